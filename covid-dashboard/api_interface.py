@@ -0,0 +1,227 @@
+"""
+Serves the dashboard's data as read-only JSON for other services
+"""
+import gzip
+import hashlib
+import json
+import logging
+from datetime import date
+from flask import current_app as app
+from flask import request, Response
+import area_registry
+import covid_data_cache
+import dashboard_snapshot
+import headline_index
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Serialized responses, indexed by request, as (snapshot version, etag,
+# bodies indexed by content encoding) tuples
+api_cache = {}
+# Cached responses kept before the cache is cleared
+MAX_CACHED = 256
+# Content encodings tried in order, when the client accepts them
+ENCODINGS = ["br", "gzip"]
+
+
+def encode_body(data) -> tuple:
+    """Serialize data once, returning its etag and its encoded bodies.
+
+    The json is compressed with gzip, and with brotli when the brotli
+    package is installed, so every later request only picks a body.
+
+    Keyword arguments:
+    data -- any json serializable data
+    """
+    body = json.dumps(data, separators=(",", ":")).encode("utf8")
+    bodies = {"identity": body, "gzip": gzip.compress(body, 6)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body)
+    return hashlib.blake2b(body, digest_size=8).hexdigest(), bodies
+
+
+def choose_encoding(bodies: dict) -> str:
+    """Return the smallest encoding of a body the client accepts.
+
+    Keyword arguments:
+    bodies -- the encoded bodies, indexed by content encoding
+    """
+    for encoding in ENCODINGS:
+        if encoding in bodies and request.accept_encodings[encoding] and \
+                len(bodies[encoding]) < len(bodies["identity"]):
+            return encoding
+    return "identity"
+
+
+def error_response(message: str, status: int) -> Response:
+    """Return a json error response.
+
+    Keyword arguments:
+    message -- what went wrong
+    status -- the http status code
+    """
+    return Response(json.dumps({"error": message}), status=status,
+        mimetype="application/json")
+
+
+def json_response(key: tuple, build) -> Response:
+    """Return cached json for a request, building it once per snapshot.
+
+    Responses are rebuilt only when a new dashboard snapshot has been
+    published since they were cached. Clients sending a matching
+    If-None-Match get a 304 Not Modified response, and the etag comes
+    from the json itself, so a new snapshot that leaves a response
+    unchanged doesn't make pollers download it again.
+
+    Keyword arguments:
+    key -- what the response is cached under, unique per request
+    build -- a callable taking the snapshot and returning the data to
+    serve, or None if what was asked for doesn't exist
+    """
+    snapshot = dashboard_snapshot.get_snapshot()
+    cached = api_cache.get(key)
+    if cached is None or cached[0] != snapshot.version:
+        data = build(snapshot)
+        if data is None:
+            return error_response("Not found", 404)
+        cached = (snapshot.version,) + encode_body(data)
+        if len(api_cache) >= MAX_CACHED:
+            api_cache.clear()
+        api_cache[key] = cached
+        logger.debug("Serialized %s for snapshot %s", key, snapshot.version)
+    _, etag, bodies = cached
+    encoding = choose_encoding(bodies)
+    response = Response(bodies[encoding], mimetype="application/json")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+        etag = f"{etag}-{encoding}"
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def area_headline(area: dict) -> dict:
+    """Return an area's headline values, with their dates when indexed.
+
+    Keyword arguments:
+    area -- the area's flat headline values, from a snapshot
+    """
+    entry = headline_index.lookup(area['areaCode'])
+    if entry is None:
+        return dict(area)
+    return dict(area, latest=entry['latest'], rolling=entry['rolling'])
+
+
+@app.route('/api/areas')
+def api_areas():
+    """Return the headline values of every area."""
+    return json_response(("areas",), lambda snapshot: {
+        "areas": [area_headline(area) for area in snapshot.areas]})
+
+
+@app.route('/api/areas/<area_code>')
+def api_area(area_code: str):
+    """Return the headline values of one area.
+
+    Keyword arguments:
+    area_code -- the areaCode of the area
+    """
+    def build(snapshot):
+        for area in snapshot.areas:
+            if area['areaCode'] == area_code:
+                return area_headline(area)
+        return None
+    return json_response(("area", area_code), build)
+
+
+def series_slice(area_code: str, start: str, end: str,
+                 names: tuple) -> dict:
+    """Return an area's time series between two dates, oldest first.
+
+    The series is read from the covid data snapshot, so areas restored
+    after a restart are served before their next update.
+
+    Keyword arguments:
+    area_code -- the areaCode of the area
+    start -- the first date (%Y-%m-%d) to include, or None
+    end -- the last date (%Y-%m-%d) to include, or None
+    names -- the metrics to include, or an empty tuple for every metric
+    """
+    import numpy as np
+    from covid_data_store import CovidDataStore
+    area = area_registry.area_data.get(area_code)
+    if area is None:
+        return None
+    connection = covid_data_cache.get_snapshot()
+    with covid_data_cache.snapshot_lock:
+        records = covid_data_cache.load_records(connection,
+            area['areaName'], area['areaType'])
+    if not records:
+        return None
+    store = CovidDataStore.from_records(records, list(names) or None)
+    included = np.ones(len(store), dtype=bool)
+    if start:
+        included &= store.dates >= np.datetime64(start)
+    if end:
+        included &= store.dates <= np.datetime64(end)
+    positions = np.flatnonzero(included)[::-1]
+    return {"areaCode": area_code,
+            "dates": [str(day) for day in store.dates[positions]],
+            "metrics": {name: [value if valid else None for value, valid in
+                zip(store.values[name][positions].tolist(),
+                    store.masks[name][positions].tolist())]
+                for name in store.values}}
+
+
+@app.route('/api/areas/<area_code>/series')
+def api_series(area_code: str):
+    """Return a slice of an area's time series.
+
+    Takes optional start and end dates (%Y-%m-%d) and a comma separated
+    list of metrics to include.
+
+    Keyword arguments:
+    area_code -- the areaCode of the area
+    """
+    from covid_data_store import METRICS
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        for value in (start, end):
+            if value:
+                date.fromisoformat(value)
+    except ValueError:
+        return error_response("start and end must be %Y-%m-%d dates", 400)
+    names = tuple(name for name in request.args.get('metrics', '').split(',')
+        if name)
+    if any(name not in METRICS for name in names):
+        return error_response("Unknown metric", 400)
+    return json_response(("series", area_code, start, end, names),
+        lambda snapshot: series_slice(area_code, start, end, names))
+
+
+@app.route('/api/news')
+def api_news():
+    """Return the stored news articles, newest first."""
+    return json_response(("news",), lambda snapshot: {
+        "articles": [{"title": article['title'],
+            "description": article.get('description', ""),
+            "url": article.get('url'),
+            "published_at": article.get('year'),
+            "topics": list(article.get('topics', ()))}
+            for article in snapshot.news]})
+
+
+@app.route('/api/updates')
+def api_updates():
+    """Return the scheduled updates shown on the dashboard."""
+    return json_response(("updates",), lambda snapshot: {
+        "updates": [{"title": update['title'],
+            "content": update['content']}
+            for update in snapshot.updates]})
@@ -0,0 +1,172 @@
+"""
+Keeps track of every area shown on the dashboard and their covid data
+"""
+import logging
+from functools import partial
+import config_loader
+from config_loader import get_config
+import covid_data_cache
+from covid_data_cache import refresh_area_batch, split_cold_areas
+from fetch_engine import run_concurrently
+import dashboard_snapshot
+import headline_index
+
+logger = logging.getLogger(__name__)
+
+# Headline values of every area, indexed by areaCode
+area_data = {}
+# areaCode of every area, indexed by (areaName, areaType)
+area_codes = {}
+# The headline_index values stored in area_data and shown on the dashboard
+HEADLINE_KEYS = ["areaCode", "areaName", "areaType", "7day_infections",
+                 "hospital_cases", "cumulative_deaths", "7day_average",
+                 "week_change"]
+
+
+def load_areas(area_config: dict = None) -> list:
+    """Return the list of (location, location_type) areas to fetch.
+
+    Areas are read from the 'areas' list in config.json, each entry
+    holding a 'name' and a 'type'. The national and local locations are
+    always included, so older config files keep working.
+
+    Keyword arguments:
+    area_config -- the config dictionary to read (config.json by default)
+    """
+    if area_config is None:
+        area_config = get_config()
+    areas = [(area_config['national_location'],
+              area_config['national_location_type']),
+             (area_config['local_location'],
+              area_config['local_location_type'])]
+    for area in area_config.get('areas', []):
+        if (area['name'], area['type']) not in areas:
+            areas.append((area['name'], area['type']))
+    return areas
+
+
+def group_by_type(areas: list) -> dict:
+    """Group a list of (location, location_type) areas by location_type.
+
+    Keyword arguments:
+    areas -- a list of (location, location_type) tuples
+    """
+    groups = {}
+    for area in areas:
+        groups.setdefault(area[1], []).append(area)
+    return groups
+
+
+def store_area(area: tuple, summary: dict, connection=None):
+    """Store an area's headline values in area_data.
+
+    The headline values, including the 7 day average of new cases and
+    its week-on-week change, come from headline_index. It keeps them up
+    to date as new days are merged into the covid snapshot, so the
+    area's full history is only loaded from the snapshot when the area
+    has to be rebuilt.
+
+    Keyword arguments:
+    area -- the (location, location_type) tuple the data is for
+    summary -- the area_summary returned by refresh_area_batch
+    connection -- the snapshot database connection (shared by default)
+    """
+    area_code = summary['areaCode'] or f"{area[1]}:{area[0]}"
+    entry = headline_index.current_entry(area, area_code,
+                                         summary['newest_date'],
+                                         summary['days'])
+    if entry is None:
+        from covid_data_store import CovidDataStore
+        if connection is None:
+            connection = covid_data_cache.get_snapshot()
+        with covid_data_cache.snapshot_lock:
+            records = covid_data_cache.load_records(connection, *area)
+        entry = headline_index.rebuild(
+            area, CovidDataStore.from_records(records), area_code)
+    area_data[area_code] = {key: entry[key] for key in HEADLINE_KEYS}
+    area_codes[area] = area_code
+
+
+def headline_entries() -> list:
+    """Return the headline values of every area."""
+    return [dict(entry) for entry in area_data.values()]
+
+
+def update_areas(areas: list = None) -> dict:
+    """Fetch the covid data of every area and store it in area_data.
+
+    Areas without a usable snapshot need their full history, so each is
+    fetched as its own job, with its own timeout. Other areas of the
+    same areaType only need their newest days, and are refreshed
+    together in one batch. Every job runs concurrently, and areas whose
+    job fails keep their previous data. The headline values are then
+    published in a dashboard snapshot, if any of them changed.
+
+    Keyword arguments:
+    areas -- a list of (location, location_type) tuples (every area
+    from load_areas by default)
+    """
+    if areas is None:
+        areas = load_areas()
+    cold, batched = split_cold_areas(areas)
+    jobs = {area: partial(refresh_area_batch, [area]) for area in cold}
+    for location_type, group in group_by_type(list(batched)).items():
+        jobs[location_type] = partial(refresh_area_batch, group)
+    results, errors = run_concurrently(
+        jobs, get_config().get('fetch_max_workers', 4),
+        get_config().get('fetch_timeout'))
+    with dashboard_snapshot.write_lock:
+        for batch in results.values():
+            for area, summary in batch.items():
+                store_area(area, summary)
+        dashboard_snapshot.publish(areas=headline_entries())
+    for key in errors:
+        logger.warning("Kept previous covid data for %s", key)
+    logger.info("Updated covid data for %s areas", len(area_data))
+    return errors
+
+
+def find_area(location: str, location_type: str) -> dict:
+    """Return the stored data of an area, or None if not fetched yet.
+
+    Keyword arguments:
+    location -- the areaName of the area
+    location_type -- the areaType of the area
+    """
+    area_code = area_codes.get((location, location_type))
+    if area_code is None:
+        return None
+    return area_data.get(area_code)
+
+
+def apply_config(old: dict, new: dict):
+    """Apply a reloaded config's area changes, called by config_loader.
+
+    Only areas that were added are fetched, and areas that were removed
+    are dropped, so the areas that stay keep their data without any
+    new requests. Processes that only read the shared snapshot leave
+    this to the process publishing it.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    old_areas = load_areas(old)
+    new_areas = load_areas(new)
+    added = [area for area in new_areas if area not in old_areas]
+    removed = [area for area in old_areas if area not in new_areas]
+    if not added and not removed or not dashboard_snapshot.is_writer():
+        return
+    with dashboard_snapshot.write_lock:
+        for area in removed:
+            area_code = area_codes.pop(area, None)
+            if area_code is not None and area_code not in area_codes.values():
+                area_data.pop(area_code, None)
+                headline_index.remove(area_code)
+        dashboard_snapshot.publish(areas=headline_entries())
+    logger.info("Areas changed, adding %s and removing %s", added, removed)
+    if added:
+        update_areas(added)
+
+
+config_loader.listeners.append(apply_config)
@@ -0,0 +1,251 @@
+"""
+Benchmarks the covid data pipeline against synthetic exports, offline
+
+Run with ``python benchmark_covid_data.py`` from this directory. Results
+are written as json, and a previous results file can be passed with
+--compare to print how much slower or faster each stage has become.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from covid_data_handler import dict_to_csv, find_recent_value
+from covid_data_handler import parse_csv_data, process_covid_csv_data
+from covid_data_handler import reformat_data, rolling_recent_values
+from covid_data_handler import stream_covid_csv_data
+from covid_data_handler import sum_recent_values
+from covid_data_store import CovidDataStore
+
+HEADER = ["areaCode", "areaName", "areaType", "date",
+          "cumDailyNsoDeathsByDeathDate", "hospitalCases",
+          "newCasesBySpecimenDate"]
+# Roughly as many days as the real exports hold
+DAYS_PER_AREA = 640
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def generate_rows(rows: int, gap_rate: float = 0.02, seed: int = 1400):
+    """Yield synthetic export rows, newest day first within each area.
+
+    Empty cells follow the real exports: deaths lag by about two
+    weeks, hospital cases by a day, the newest day has no cases yet,
+    and any other cell is left empty with probability gap_rate.
+
+    Keyword arguments:
+    rows -- the amount of rows to generate, split into areas of
+    DAYS_PER_AREA days
+    gap_rate -- the chance of any other cell being empty (0.02 by default)
+    seed -- the random seed, so runs generate the same data (1400 by
+    default)
+    """
+    generator = random.Random(seed)
+    newest = date(2021, 10, 28)
+    area = 0
+    while rows > 0:
+        days = min(rows, DAYS_PER_AREA)
+        area_code = f"E{area:08d}"
+        deaths = generator.randrange(1000, 150_000)
+        for day in range(days):
+            cases = str(generator.randrange(0, 50_000))
+            hospital = str(generator.randrange(0, 8000))
+            deaths = max(0, deaths - generator.randrange(0, 200))
+            row = [area_code, f"Area {area}", "ltla",
+                   (newest - timedelta(days=day)).isoformat(),
+                   "" if day < 14 else str(deaths),
+                   "" if day < 1 else hospital,
+                   "" if day < 1 else cases]
+            for index in range(4, 7):
+                if generator.random() < gap_rate:
+                    row[index] = ""
+            yield row
+        rows -= days
+        area += 1
+
+
+def write_export(path: str, rows: int, gap_rate: float = 0.02,
+                 compress: bool = False):
+    """Write a synthetic export to a csv file.
+
+    Keyword arguments:
+    path -- system path of the file to write
+    rows -- the amount of data rows to write
+    gap_rate -- the chance of a cell being empty (0.02 by default)
+    compress -- whether to gzip the file (False by default)
+    """
+    opener = gzip.open if compress else open
+    with opener(path, "wt", newline='', encoding="utf8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADER)
+        writer.writerows(generate_rows(rows, gap_rate))
+
+
+def rows_to_records(data: list) -> list:
+    """Turn parsed csv rows into covid API style json records.
+
+    Keyword arguments:
+    data -- a 2d list, header row first, as returned by parse_csv_data
+    """
+    header = data[0]
+    return [{name: (int(value) if value and name in HEADER[4:] else
+                    value or None)
+             for name, value in zip(header, row)} for row in data[1:]]
+
+
+def group_by_area(records: list) -> list:
+    """Split records into one list per areaCode, in order of appearance.
+
+    reformat_data keys records by date alone, as an API response only
+    ever holds one area, so it has to be given one area at a time.
+
+    Keyword arguments:
+    records -- a list of covid API style json records
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(record["areaCode"], []).append(record)
+    return list(groups.values())
+
+
+def measure(function, repeat: int = 3) -> dict:
+    """Time a function and record its peak memory use.
+
+    The time is the best of repeat runs. Peak memory is measured in a
+    separate run under tracemalloc, as tracing slows the code down.
+
+    Keyword arguments:
+    function -- a callable taking no arguments
+    repeat -- the amount of timed runs (set to 3 by default)
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "peak_bytes": peak}
+
+
+def benchmark_size(rows: int, directory: str, repeat: int = 3) -> dict:
+    """Benchmark every pipeline stage against one export size.
+
+    Keyword arguments:
+    rows -- the amount of rows in the export
+    directory -- where to write the synthetic export files
+    repeat -- the amount of timed runs per stage (set to 3 by default)
+    """
+    path = os.path.join(directory, f"export_{rows}.csv")
+    gzip_path = path + ".gz"
+    write_export(path, rows)
+    write_export(gzip_path, rows, compress=True)
+    data = parse_csv_data(path)
+    area_records = group_by_area(rows_to_records(data))
+    first_area = data[1][1]
+    area_rows = [data[0]] + [row for row in data[1:] if row[1] == first_area]
+    stages = {
+        "parse_csv_data": lambda: parse_csv_data(path),
+        "parse_csv_data_gzip": lambda: parse_csv_data(gzip_path),
+        "reformat_data": lambda: [reformat_data(records)
+                                  for records in area_records],
+        "dict_to_csv": lambda: [dict_to_csv(reformat_data(records))
+                                for records in area_records],
+        "store_from_rows": lambda: CovidDataStore.from_rows(data),
+        "process_covid_csv_data": lambda: process_covid_csv_data(data),
+        "find_recent_value": lambda: find_recent_value(
+            area_rows, "hospitalCases"),
+        "sum_recent_values": lambda: sum_recent_values(
+            area_rows, "newCasesBySpecimenDate"),
+        "rolling_recent_values": lambda: rolling_recent_values(
+            area_rows, "newCasesBySpecimenDate"),
+        "stream_covid_csv_data": lambda: stream_covid_csv_data(
+            path, first_area),
+        "stream_covid_csv_data_gzip": lambda: stream_covid_csv_data(
+            gzip_path, first_area)}
+    results = {"rows": rows, "areas": len(area_records),
+               "reformatted_rows": sum(len(reformat_data(records))
+                                       for records in area_records),
+               "file_bytes": os.path.getsize(path),
+               "gzip_bytes": os.path.getsize(gzip_path), "stages": {}}
+    for name, function in stages.items():
+        results["stages"][name] = measure(function, repeat)
+        print(f"{rows:>10} rows  {name:<28}"
+              f"{results['stages'][name]['seconds'] * 1000:>10.2f}ms"
+              f"{results['stages'][name]['peak_bytes'] / 2 ** 20:>10.1f}MiB")
+    os.remove(path)
+    os.remove(gzip_path)
+    return results
+
+
+def run_benchmarks(sizes: list, repeat: int = 3) -> dict:
+    """Benchmark every export size, returning the results.
+
+    Keyword arguments:
+    sizes -- a list of export sizes, in rows
+    repeat -- the amount of timed runs per stage (set to 3 by default)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        return {"generated_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "sizes": [benchmark_size(rows, directory, repeat)
+                          for rows in sizes]}
+
+
+def compare_results(old: dict, new: dict) -> list:
+    """Return (rows, stage, old seconds, new seconds, ratio) comparisons.
+
+    Keyword arguments:
+    old -- previously saved results
+    new -- the results to compare against them
+    """
+    old_sizes = {size["rows"]: size for size in old["sizes"]}
+    comparisons = []
+    for size in new["sizes"]:
+        previous = old_sizes.get(size["rows"])
+        if previous is None:
+            continue
+        for name, stage in size["stages"].items():
+            if name in previous["stages"]:
+                old_seconds = previous["stages"][name]["seconds"]
+                comparisons.append((size["rows"], name, old_seconds,
+                                    stage["seconds"],
+                                    stage["seconds"] / old_seconds))
+    return comparisons
+
+
+def main():
+    """Parse the command line, run the benchmarks and save the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="export sizes to benchmark, in rows")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs per stage, the best is kept")
+    parser.add_argument("--output", default="benchmark_covid_data.json",
+                        help="json file to write the results to")
+    parser.add_argument("--compare", help="previous results to compare with")
+    arguments = parser.parse_args()
+    results = run_benchmarks(arguments.sizes, arguments.repeat)
+    with open(arguments.output, "w", encoding="utf8") as output:
+        json.dump(results, output, indent=2)
+    print(f"Saved results to {arguments.output}")
+    if arguments.compare:
+        with open(arguments.compare, "r", encoding="utf8") as previous:
+            comparisons = compare_results(json.load(previous), results)
+        for rows, name, old_seconds, new_seconds, ratio in comparisons:
+            print(f"{rows:>10} rows  {name:<28}{old_seconds * 1000:>10.2f}ms"
+                  f" -> {new_seconds * 1000:>10.2f}ms  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Load tests the dashboard's /index route offline, with stubbed APIs
+
+Run with ``python benchmark_dashboard.py`` from this directory. The app
+is served on a local port with stand-ins for the Covid and News APIs,
+and each client reloads /index on the wall screens' refresh pattern
+while scheduled updates fire part way through.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from flask import Flask
+from werkzeug.serving import make_server
+import config_loader
+import dashboard_snapshot
+import http_client
+import update_scheduler
+
+app = Flask(__name__)
+with app.app_context():
+    import widget_interface  # pylint: disable=unused-import
+    import area_registry
+    import covid_data_cache
+    import covid_news_handling
+    import update_service
+
+SCENARIOS = ["steady", "update", "inline"]
+
+
+class StubCov19API:
+    """Local stand-in for uk_covid19's Cov19API.
+
+    Serves DAYS days of generated records for every configured area,
+    filtered like the real API, after sleeping for latency seconds.
+    """
+    DAYS = 640
+    latency = 0.05
+    records = []
+
+    def __init__(self, filters, structure):
+        self.filters = dict(item.split("=", 1) for item in filters)
+        self.structure = structure
+
+    @classmethod
+    def generate(cls, areas: list):
+        """Generate the records served for a list of areas.
+
+        Keyword arguments:
+        areas -- a list of (location, location_type) tuples
+        """
+        generator = random.Random(1400)
+        cls.records = [
+            {"date": (date.today() - timedelta(days=day)).isoformat(),
+             "areaCode": f"E{number:08d}", "areaName": location,
+             "areaType": location_type,
+             "cumDailyNsoDeathsByDeathDate":
+                 None if day < 14 else 150_000 - day * 100,
+             "hospitalCases": None if day < 1 else generator.randrange(8000),
+             "newCasesBySpecimenDate":
+                 None if day < 1 else generator.randrange(50_000)}
+            for number, (location, location_type) in enumerate(areas)
+            for day in range(cls.DAYS)]
+
+    def get_json(self):
+        """Return the matching records, as the real API would."""
+        time.sleep(self.latency)
+        return {"data": [record for record in self.records if all(
+            record[key] == value for key, value in self.filters.items())]}
+
+
+class StubNewsResponse:
+    """A News API response returned by StubNewsSession"""
+
+    def __init__(self, data: dict):
+        self.status_code = 200
+        self.headers = {}
+        self.data = data
+
+    def json(self):
+        """Return the response's json data."""
+        return self.data
+
+
+class StubNewsSession:
+    """Local stand-in for the requests session used by http_client.
+
+    Every request returns a page of articles that haven't been seen
+    before, after sleeping for latency seconds.
+    """
+    latency = 0.1
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        """Return a page of generated articles."""
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        page_size = (params or {}).get('pageSize', 20)
+        published = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        articles = [{"title": f"Covid story {calls}-{number}",
+                     "description": f"Update {calls} on covid case {number}",
+                     "url": f"https://example.com/{calls}/{number}",
+                     "publishedAt": published}
+                    for number in range(page_size)]
+        return StubNewsResponse({"status": "ok", "articles": articles})
+
+
+def percentile(values: list, percent: float) -> float:
+    """Return a nearest-rank percentile of a list of numbers.
+
+    Keyword arguments:
+    values -- the numbers, in any order
+    percent -- the percentile to return, from 0 to 100
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered) + 0.5))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarise(latencies: list) -> dict:
+    """Return the p50, p95, p99 and maximum of some latencies, in ms.
+
+    Keyword arguments:
+    latencies -- a list of latencies in seconds
+    """
+    return {name: (None if not latencies else
+                   round(percentile(latencies, percent) * 1000, 2))
+            for name, percent in (("p50", 50), ("p95", 95), ("p99", 99),
+                                  ("max", 100))}
+
+
+def run_client(port: int, refresh: float, end_time: float,
+               conditional: bool, results: list):
+    """Reload /index every refresh seconds until end_time.
+
+    The first request is made at a random point within the first
+    refresh interval, so clients don't all arrive at once.
+
+    Keyword arguments:
+    port -- the port the dashboard is served on
+    refresh -- seconds between reloads
+    end_time -- the time.monotonic() value to stop at
+    conditional -- whether to send If-None-Match with the last ETag
+    results -- a list to append (start time, latency, status) tuples to
+    """
+    next_time = time.monotonic() + random.uniform(0, refresh)
+    etag = None
+    while True:
+        delay = next_time - time.monotonic()
+        if next_time >= end_time:
+            return
+        if delay > 0:
+            time.sleep(delay)
+        next_time += refresh
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        start = time.monotonic()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port,
+                                                    timeout=30)
+            connection.request("GET", "/index", headers=headers)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            status = response.status
+            etag = response.getheader("ETag") or etag
+        except OSError:
+            status = None
+        results.append((start, time.monotonic() - start, status))
+
+
+def scheduled_update(window: dict):
+    """Run a full covid and news update, recording when it ran.
+
+    Keyword arguments:
+    window -- a dictionary to record the 'start' and 'end' times in
+    """
+    window['start'] = time.monotonic()
+    area_registry.update_areas()
+    covid_news_handling.update_news()
+    window['end'] = time.monotonic()
+
+
+def run_scenario(scenario: str, clients: int, refresh: float,
+                 duration: float, conditional: bool = True) -> dict:
+    """Serve the dashboard and load test it with one scenario.
+
+    'steady' sends only page loads. 'update' schedules a full update
+    half way through, run by update_service in the background.
+    'inline' schedules the same update, but runs due updates at the
+    start of every request, as update_site used to.
+
+    Keyword arguments:
+    scenario -- one of SCENARIOS
+    clients -- the amount of concurrent clients
+    refresh -- seconds between each client's reloads
+    duration -- seconds to run the load for
+    conditional -- whether clients revalidate with If-None-Match
+    (True by default)
+    """
+    window = {}
+    directory = tempfile.mkdtemp()
+    covid_data_cache.snapshot_connection = covid_data_cache.open_snapshot(
+        os.path.join(directory, "covid_snapshot.db"))
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    inline = scenario == "inline"
+    if scenario != "steady":
+        update_scheduler.schedule(
+            f"benchmark {scenario}", "00:00",
+            lambda: scheduled_update(window),
+            execute_time=time.time() + duration / 2)
+    if not inline:
+        update_service.start()
+        update_service.wake()
+
+    results = []
+    end_time = time.monotonic() + duration
+    threads = [threading.Thread(target=run_client, args=(
+        server.server_port, refresh, end_time, conditional, results))
+        for _ in range(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    server.shutdown()
+    if not inline:
+        update_service.stop()
+    update_scheduler.cancel(f"benchmark {scenario}")
+    covid_data_cache.snapshot_connection.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    latencies = [latency for _, latency, _ in results]
+    during = [latency for started, latency, _ in results if window
+              and started <= window.get('end', end_time)
+              and started + latency >= window['start']]
+    statuses = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {"scenario": scenario, "clients": clients, "refresh": refresh,
+            "duration": round(elapsed, 2), "requests": len(results),
+            "throughput": round(len(results) / elapsed, 2),
+            "statuses": statuses, "latency_ms": summarise(latencies),
+            "update_seconds": (round(window['end'] - window['start'], 3)
+                               if 'end' in window else None),
+            "during_update_latency_ms": summarise(during)}
+
+
+def install_stubs():
+    """Point the app at the stub APIs, without saving any state."""
+    config_loader.config = dict(
+        config_loader.get_config(), state_path="", snapshot_path="",
+        config_poll_seconds=0, news_max_pages=2, news_page_concurrency=2)
+    StubCov19API.generate(area_registry.load_areas())
+    covid_data_cache.default_api_class = lambda: StubCov19API
+    http_client.shared_session = StubNewsSession()
+
+
+def main():
+    """Parse the command line, run each scenario and report the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=100,
+                        help="concurrent clients (wall screens)")
+    parser.add_argument("--refresh", type=float, default=60,
+                        help="seconds between each client's reloads")
+    parser.add_argument("--duration", type=float, default=120,
+                        help="seconds each scenario runs for")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS,
+                        default=SCENARIOS, help="scenarios to run")
+    parser.add_argument("--no-conditional", action="store_true",
+                        help="always download the full page")
+    parser.add_argument("--covid-latency", type=float, default=0.05,
+                        help="seconds each stub Covid API request takes")
+    parser.add_argument("--news-latency", type=float, default=0.1,
+                        help="seconds each stub News API request takes")
+    parser.add_argument("--output", help="json file to write the results to")
+    arguments = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    StubCov19API.latency = arguments.covid_latency
+    StubNewsSession.latency = arguments.news_latency
+    install_stubs()
+
+    @app.before_request
+    def run_inline_updates():
+        if inline_updates.is_set():
+            update_scheduler.run_pending()
+
+    inline_updates = threading.Event()
+    results = []
+    for scenario in arguments.scenarios:
+        if scenario == "inline":
+            inline_updates.set()
+        else:
+            inline_updates.clear()
+        result = run_scenario(scenario, arguments.clients, arguments.refresh,
+                              arguments.duration,
+                              not arguments.no_conditional)
+        results.append(result)
+        latency = result['latency_ms']
+        print(f"{scenario:<8} {result['requests']:>7} requests "
+              f"{result['throughput']:>8.1f}/s  p50 {latency['p50']}ms  "
+              f"p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+              f"during update p99 "
+              f"{result['during_update_latency_ms']['p99']}ms  "
+              f"statuses {result['statuses']}")
+    print(f"Final snapshot version {dashboard_snapshot.get_snapshot().version}")
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf8") as output:
+            json.dump(results, output, indent=2)
+        print(f"Saved results to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Loads config.json once and shares it between every module
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+directory_path = os.path.dirname(os.path.abspath(__file__))
+config_path = os.path.join(directory_path, "config.json")
+
+config_lock = threading.RLock()
+config = None
+# Modification time of the loaded config.json, and how many times it loaded
+config_mtime = None
+config_version = 0
+# Digest of the loaded config's contents, the same across restarts
+config_hash = None
+# Callables run with the (old, new) configs whenever config.json changes
+listeners = []
+
+# Settings every config needs, and the type each must have
+REQUIRED_KEYS = {
+    "apiKey": str, "title": str, "image_path": str,
+    "national_location": str, "national_location_type": str,
+    "local_location": str, "local_location_type": str,
+    "max_articles": int, "blacklisted_strings": list,
+    "news_language": str, "news_api_url": str, "news_api_sortBy": str,
+    "specify_sources": bool, "sources": str}
+
+
+def load_config(path: str = None) -> dict:
+    """Read and parse a config file.
+
+    Keyword arguments:
+    path -- system path of the config file (config.json by default)
+    """
+    with open(path or config_path, "r", encoding="utf8") as jsonfile:
+        return json.load(jsonfile)
+
+
+def hash_config(candidate: dict) -> str:
+    """Return a short digest of a config's contents.
+
+    Keyword arguments:
+    candidate -- the parsed config to hash
+    """
+    return hashlib.blake2b(json.dumps(candidate, sort_keys=True).encode(
+        "utf8"), digest_size=8).hexdigest()
+
+
+def validate_config(candidate: dict):
+    """Raise ValueError if a config is missing settings or has bad values.
+
+    Keyword arguments:
+    candidate -- the parsed config to check
+    """
+    if not isinstance(candidate, dict):
+        raise ValueError("config must be a json object")
+    for key, expected_type in REQUIRED_KEYS.items():
+        if not isinstance(candidate.get(key), expected_type):
+            raise ValueError(f"{key} must be a {expected_type.__name__}")
+    if candidate['max_articles'] < 0:
+        raise ValueError("max_articles can't be negative")
+    if not all(isinstance(word, str)
+               for word in candidate['blacklisted_strings']):
+        raise ValueError("blacklisted_strings must be a list of strings")
+    for area in candidate.get('areas', []):
+        if not isinstance(area, dict) or not {'name', 'type'} <= set(area):
+            raise ValueError("areas entries need a name and a type")
+    for topic in candidate.get('news_topics', []):
+        if not isinstance(topic, dict) or not {'name', 'terms'} <= set(topic):
+            raise ValueError("news_topics entries need a name and terms")
+
+
+def get_config() -> dict:
+    """Return the shared config, parsing config.json on first use.
+
+    Modules should call this whenever they need a setting rather than
+    keeping their own reference, so they always see the current config.
+    The returned dictionary is never modified: reload_config replaces
+    it as a whole, so a function that reads several settings should
+    call this once and use the same dictionary throughout.
+    """
+    global config, config_mtime, config_version, config_hash
+    if config is None:
+        with config_lock:
+            if config is None:
+                config_mtime = os.stat(config_path).st_mtime_ns
+                config = load_config()
+                config_hash = hash_config(config)
+                config_version += 1
+                logger.info("Loaded config from %s", config_path)
+    return config
+
+
+def reload_config() -> bool:
+    """Swap in config.json if it changed, returning whether it did.
+
+    The file is only parsed when its modification time changes. A new
+    config that fails validate_config is logged and ignored, keeping
+    the current one. Otherwise it replaces the current config in one
+    assignment, and every listener is called with the old and the new
+    config so it can apply just the settings that changed.
+    """
+    global config, config_mtime, config_version, config_hash
+    with config_lock:
+        old = get_config()
+        try:
+            mtime = os.stat(config_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == config_mtime:
+            return False
+        config_mtime = mtime
+        try:
+            new = load_config()
+            validate_config(new)
+        except (OSError, ValueError) as error:
+            logger.error("Ignored invalid config in %s: %s",
+                         config_path, error)
+            return False
+        if new == old:
+            return False
+        config = new
+        config_hash = hash_config(new)
+        config_version += 1
+        logger.info("Reloaded config from %s, changed %s", config_path,
+                    sorted(changed_keys(old, new)))
+        for listener in listeners:
+            try:
+                listener(old, new)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Config listener %r failed", listener)
+    return True
+
+
+def changed_keys(old: dict, new: dict) -> set:
+    """Return the settings that differ between two configs.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    return {key for key in old.keys() | new.keys()
+            if old.get(key) != new.get(key)}
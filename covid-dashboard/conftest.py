@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+import covid_news_handling
+
+def clear_news_state():
+    covid_news_handling.news_list.clear()
+    covid_news_handling.current_news_titles.clear()
+    covid_news_handling.current_news_urls.clear()
+    covid_news_handling.news_blacklist.clear()
+    for index in (covid_news_handling.near_duplicates,
+                  covid_news_handling.blacklist_duplicates):
+        for key in list(index.signatures):
+            index.remove(key)
+
+@pytest.fixture
+def clear_news():
+    clear_news_state()
+    yield clear_news_state
+    clear_news_state()
+
+@pytest.fixture
+def make_article():
+    def make(title, hours_ago=0, url=None):
+        published = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+        return {'title': title, 'description': 'description',
+            'url': url or 'https://example.com/' + title.replace(' ', '-'),
+            'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ')}
+    return make
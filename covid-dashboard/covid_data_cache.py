@@ -0,0 +1,316 @@
+"""
+Keeps a local SQLite snapshot of covid API data for incremental refreshes
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+from config_loader import directory_path, get_config
+from covid_data_handler import CASES_AND_DEATHS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["areaCode", "areaName", "areaType",
+           "cumDailyNsoDeathsByDeathDate", "hospitalCases",
+           "newCasesBySpecimenDate"]
+
+# Gaps longer than this are cheaper to fetch as one full history request
+MAX_INCREMENTAL_DAYS = 30
+
+snapshot_lock = threading.Lock()
+snapshot_connection = None
+# Callables run with (location, location_type, records) whenever
+# fetched records are merged into the snapshot
+listeners = []
+
+
+def open_snapshot(path: str = None) -> sqlite3.Connection:
+    """Open (and create if needed) the snapshot database.
+
+    Keyword arguments:
+    path -- system path to the SQLite file (covid_snapshot_path from
+    config.json by default, relative to this directory)
+    """
+    if path is None:
+        path = os.path.join(directory_path, get_config().get(
+            'covid_snapshot_path', 'covid_snapshot.db'))
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS covid_data ("
+        "location TEXT NOT NULL, location_type TEXT NOT NULL, "
+        "date TEXT NOT NULL, areaCode TEXT, areaName TEXT, areaType TEXT, "
+        "cumDailyNsoDeathsByDeathDate INTEGER, hospitalCases INTEGER, "
+        "newCasesBySpecimenDate INTEGER, "
+        "PRIMARY KEY (location, location_type, date)) WITHOUT ROWID")
+    connection.commit()
+    logger.info("Opened covid snapshot at %s", path)
+    return connection
+
+
+def get_snapshot() -> sqlite3.Connection:
+    """Return the shared snapshot connection, opening it on first use."""
+    global snapshot_connection
+    with snapshot_lock:
+        if snapshot_connection is None:
+            snapshot_connection = open_snapshot()
+        return snapshot_connection
+
+
+def latest_stored_date(connection: sqlite3.Connection, location: str,
+                       location_type: str) -> str:
+    """Return the newest date stored for an area, or None.
+
+    Keyword arguments:
+    connection -- the snapshot database connection
+    location -- the areaName the data was requested for
+    location_type -- the areaType the data was requested for
+    """
+    row = connection.execute(
+        "SELECT MAX(date) FROM covid_data "
+        "WHERE location = ? AND location_type = ?",
+        (location, location_type)).fetchone()
+    return row[0]
+
+
+def area_summary(connection: sqlite3.Connection, location: str,
+                 location_type: str, records: list = ()) -> dict:
+    """Summarise an area's stored data without loading its history.
+
+    Returns the areaCode and date of the newest stored record, how many
+    days are stored, and the records that were just merged.
+
+    Keyword arguments:
+    connection -- the snapshot database connection
+    location -- the areaName the data was requested for
+    location_type -- the areaType the data was requested for
+    records -- the records that were just merged (none by default)
+    """
+    # SQLite takes areaCode from the row holding the MAX(date)
+    newest_date, area_code, days = connection.execute(
+        "SELECT MAX(date), areaCode, COUNT(*) FROM covid_data "
+        "WHERE location = ? AND location_type = ?",
+        (location, location_type)).fetchone()
+    return {"areaCode": area_code, "newest_date": newest_date,
+            "days": days, "records": list(records)}
+
+
+def merge_records(connection: sqlite3.Connection, location: str,
+                  location_type: str, records: list) -> int:
+    """Insert or replace API records in the snapshot.
+
+    Records for dates that are already stored replace the old values,
+    so revised figures within the look-back window are picked up. Every
+    listener is then called with the merged records.
+
+    Keyword arguments:
+    connection -- the snapshot database connection
+    location -- the areaName the data was requested for
+    location_type -- the areaType the data was requested for
+    records -- a list of Cov19API json records
+    """
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO covid_data VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(location, location_type, record['date'])
+             + tuple(record.get(column) for column in COLUMNS)
+             for record in records])
+    logger.info("Merged %s records into the %s snapshot",
+                len(records), location)
+    for listener in listeners:
+        try:
+            listener(location, location_type, records)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Snapshot listener %r failed", listener)
+    return len(records)
+
+
+def load_records(connection: sqlite3.Connection, location: str,
+                 location_type: str) -> list:
+    """Load the stored records of an area, newest date first.
+
+    Keyword arguments:
+    connection -- the snapshot database connection
+    location -- the areaName the data was requested for
+    location_type -- the areaType the data was requested for
+    """
+    cursor = connection.execute(
+        "SELECT date, " + ", ".join(COLUMNS) + " FROM covid_data "
+        "WHERE location = ? AND location_type = ? ORDER BY date DESC",
+        (location, location_type))
+    return [dict(zip(["date"] + COLUMNS, row)) for row in cursor]
+
+
+def default_api_class():
+    """Return uk_covid19's Cov19API, importing it on first use."""
+    from uk_covid19 import Cov19API
+    return Cov19API
+
+
+def fetch_records(location: str, location_type: str, since: str = None,
+                  api_class=None) -> list:
+    """Fetch records from the covid API, optionally only from a date.
+
+    The covid API only filters dates by equality, so an incremental
+    fetch requests each day from since up to today, keeping the
+    amount downloaded proportional to the number of new days. Without
+    since (or when since is more than MAX_INCREMENTAL_DAYS ago) the
+    full history is requested.
+
+    Keyword arguments:
+    location -- the areaName to request
+    location_type -- the areaType to request
+    since -- the first date (%Y-%m-%d) to request (None by default)
+    api_class -- the covid API client class (Cov19API by default)
+    """
+    if api_class is None:
+        api_class = default_api_class()
+    filters = [f'areaType={location_type}', f'areaName={location}']
+    if since is None or (date.today() - date.fromisoformat(since)).days \
+            > MAX_INCREMENTAL_DAYS:
+        return api_class(filters=filters,
+                         structure=CASES_AND_DEATHS).get_json()['data']
+    records = []
+    day = date.fromisoformat(since)
+    while day <= date.today():
+        records.extend(api_class(
+            filters=filters + [f'date={day.isoformat()}'],
+            structure=CASES_AND_DEATHS).get_json()['data'])
+        day += timedelta(days=1)
+    return records
+
+
+def refresh_covid_data(location: str = "England",
+                       location_type: str = "nation",
+                       connection: sqlite3.Connection = None,
+                       lookback_days: int = None,
+                       api_class=None) -> dict:
+    """Refresh the snapshot of an area and return its area_summary.
+
+    Only dates newer than the latest stored date (minus a small
+    look-back window for revised figures) are requested from the API
+    and merged into the snapshot. The stored history is never loaded,
+    so the cost of a refresh grows with the new days, not the history.
+
+    Keyword arguments:
+    location -- the areaName to request (set to England by default)
+    location_type -- the areaType to request (set to nation by default)
+    connection -- the snapshot database connection (shared by default)
+    lookback_days -- how many already stored days to request again
+    (covid_snapshot_lookback_days from config.json by default)
+    api_class -- the covid API client class (Cov19API by default)
+    """
+    if connection is None:
+        connection = get_snapshot()
+    if lookback_days is None:
+        lookback_days = get_config().get('covid_snapshot_lookback_days', 3)
+    with snapshot_lock:
+        latest = latest_stored_date(connection, location, location_type)
+    since = None
+    if latest is not None:
+        since = (date.fromisoformat(latest)
+                 - timedelta(days=lookback_days)).isoformat()
+    records = fetch_records(location, location_type, since, api_class)
+    with snapshot_lock:
+        merge_records(connection, location, location_type, records)
+        summary = area_summary(connection, location, location_type, records)
+    logger.info("Refreshed covid snapshot for %s from %s",
+                location, since)
+    return summary
+
+
+def split_cold_areas(areas: list, connection: sqlite3.Connection = None,
+                     lookback_days: int = None) -> tuple:
+    """Split areas into those needing their full history and the rest.
+
+    Returns a list of the areas without a usable snapshot, which need a
+    full history request each, and a dictionary holding the latest
+    stored date of every other area, which can be refreshed together
+    day by day.
+
+    Keyword arguments:
+    areas -- a list of (location, location_type) tuples
+    connection -- the snapshot database connection (shared by default)
+    lookback_days -- how many already stored days to request again
+    (covid_snapshot_lookback_days from config.json by default)
+    """
+    if connection is None:
+        connection = get_snapshot()
+    if lookback_days is None:
+        lookback_days = get_config().get('covid_snapshot_lookback_days', 3)
+    cold = []
+    batched = {}
+    for location, location_type in areas:
+        with snapshot_lock:
+            latest = latest_stored_date(connection, location, location_type)
+        if latest is None or (date.today() - date.fromisoformat(latest)).days \
+                > MAX_INCREMENTAL_DAYS - lookback_days:
+            cold.append((location, location_type))
+        else:
+            batched[(location, location_type)] = date.fromisoformat(latest)
+    return cold, batched
+
+
+@metrics.timed("covid_area_batch", "Covid API area batch refreshes")
+def refresh_area_batch(areas: list, connection: sqlite3.Connection = None,
+                       lookback_days: int = None,
+                       api_class=None) -> dict:
+    """Refresh the snapshots of several areas of the same areaType.
+
+    Returns the area_summary of every refreshed area, indexed by
+    (location, location_type).
+
+    Areas that already have recent data stored are refreshed together:
+    each new day is requested once for the whole areaType (without an
+    areaName filter) and the records are split between the areas, so
+    the amount of requests doesn't grow with the amount of areas.
+    Areas without a usable snapshot fall back to refresh_covid_data,
+    one after another, so callers wanting those to run concurrently
+    should split them off with split_cold_areas first.
+
+    Keyword arguments:
+    areas -- a list of (location, location_type) tuples, all sharing
+    the same location_type
+    connection -- the snapshot database connection (shared by default)
+    lookback_days -- how many already stored days to request again
+    (covid_snapshot_lookback_days from config.json by default)
+    api_class -- the covid API client class (Cov19API by default)
+    """
+    if connection is None:
+        connection = get_snapshot()
+    if lookback_days is None:
+        lookback_days = get_config().get('covid_snapshot_lookback_days', 3)
+    if api_class is None:
+        api_class = default_api_class()
+    results = {}
+    cold, batched = split_cold_areas(areas, connection, lookback_days)
+    for location, location_type in cold:
+        results[(location, location_type)] = refresh_covid_data(
+            location, location_type, connection, lookback_days, api_class)
+    if len(batched) == 1:
+        location, location_type = next(iter(batched))
+        results[(location, location_type)] = refresh_covid_data(
+            location, location_type, connection, lookback_days, api_class)
+    elif batched:
+        location_type = next(iter(batched))[1]
+        names = {location for location, _ in batched}
+        records = {location: [] for location in names}
+        day = min(batched.values()) - timedelta(days=lookback_days)
+        while day <= date.today():
+            for record in api_class(
+                    filters=[f'areaType={location_type}',
+                             f'date={day.isoformat()}'],
+                    structure=CASES_AND_DEATHS).get_json()['data']:
+                if record['areaName'] in names:
+                    records[record['areaName']].append(record)
+            day += timedelta(days=1)
+        for location in names:
+            with snapshot_lock:
+                merge_records(connection, location, location_type,
+                              records[location])
+                results[(location, location_type)] = area_summary(
+                    connection, location, location_type, records[location])
+        logger.info("Refreshed %s %s areas in one batch",
+                    len(names), location_type)
+    return results
@@ -1,41 +1,185 @@
 """
 Handles covid schedulers and API calls
 """
+import bz2
+import contextlib
 import csv
-from datetime import timedelta, date
-import sched
-import time
+import gzip
+import io
 import logging
-import json
 import os
-from typing import Union
-from uk_covid19 import Cov19API
+from functools import partial
+from typing import IO, TYPE_CHECKING, Iterator, Union
+import update_scheduler
+import metrics
+# calculate_interval now lives in update_scheduler, re-exported here
+from update_scheduler import calculate_interval  # pylint: disable=unused-import
+
+logger = logging.getLogger(__name__)
+# numpy (through covid_data_store) and uk_covid19 are slow to import, so
+# they are only imported once covid data is first requested or processed
+if TYPE_CHECKING:
+    from covid_data_store import CovidDataStore
+
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+
+CASES_AND_DEATHS = {
+    "areaCode": "areaCode",
+    "areaName": "areaName",
+    "areaType": "areaType",
+    "date": "date",
+    "cumDailyNsoDeathsByDeathDate": "cumDailyNsoDeathsByDeathDate",
+    "hospitalCases": "hospitalCases",
+    "newCasesBySpecimenDate": "newCasesBySpecimenDate"
+}
+
+
+@contextlib.contextmanager
+def decode_binary_file(source: IO) -> Iterator[IO]:
+    """Decode a caller's binary file object as a text stream.
+
+    The wrappers are detached rather than closed on exit, so the file
+    object stays open for the caller who owns it.
 
-scheduler = sched.scheduler(time.time, time.sleep)
+    Keyword arguments:
+    source -- a binary file object, optionally gzip or bz2 compressed
+    """
+    buffered = source if hasattr(source, "peek") else io.BufferedReader(source)
+    magic = buffered.peek(3)[:3]
+    decompressed = None
+    if magic[:2] == GZIP_MAGIC:
+        decompressed = gzip.GzipFile(fileobj=buffered)
+    elif magic == BZ2_MAGIC:
+        decompressed = bz2.BZ2File(buffered)
+    text = io.TextIOWrapper(decompressed or buffered, newline='',
+                            encoding="utf8")
+    try:
+        yield text
+    finally:
+        text.detach()
+        # Gzip and bz2 files don't close file objects they were given
+        if decompressed is not None:
+            decompressed.close()
+        if buffered is not source:
+            buffered.detach()
 
-scheduled_updates = []
 
-directory_path = os.path.dirname(os.path.abspath(__file__)) 
-new_path = os.path.join(directory_path, "config.json")
-with open(new_path, "r", encoding="utf8") as jsonfile:
-    config = json.load(jsonfile)
+def open_csv_source(source: Union[str, os.PathLike, IO]) -> IO:
+    """Open a csv source as a text stream.
 
+    Accepts a system path or a file object (text or binary). Gzip and
+    bz2 compressed exports are detected from their magic bytes and
+    decompressed on the fly, so the whole file never needs to be read
+    into memory. File objects passed in are never closed by the
+    caller's with block, only files opened from a path are.
 
-def parse_csv_data(input_csv: str) -> list:
+    Keyword arguments:
+    source -- a system path or file object containing csv data
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as probe:
+            magic = probe.read(3)
+        if magic[:2] == GZIP_MAGIC:
+            return gzip.open(source, "rt", newline='', encoding="utf8")
+        if magic == BZ2_MAGIC:
+            return bz2.open(source, "rt", newline='', encoding="utf8")
+        return open(source, newline='', encoding="utf8")
+    if isinstance(source, io.TextIOBase):
+        return contextlib.nullcontext(source)
+    return decode_binary_file(source)
+
+
+def iter_csv_rows(input_csv: Union[str, os.PathLike, IO]) -> Iterator[list]:
+    """Lazily yield the rows of a csv, header row first.
+
+    Keyword arguments:
+    input_csv -- a system path or file object, optionally gzip or bz2
+    compressed, containing the csv data
+    """
+    with open_csv_source(input_csv) as csvfile:
+        yield from csv.reader(csvfile, delimiter=',')
+
+
+def parse_csv_data(input_csv: Union[str, os.PathLike, IO]) -> list:
     """Parse a csv into a 2d list.
 
     Parses a csv file into a 2d list, separating rows with a ,
 
-    csv_filename -- system path to a csv file containing data to
-    be parsed
+    csv_filename -- system path or file object (optionally gzip or bz2
+    compressed) containing data to be parsed
+    """
+    csvlist = list(iter_csv_rows(input_csv))
+    logger.info("Parsed CSV data")
+    return csvlist
+
+
+def collect_recent_values(rows: Iterator[list], wanted: dict,
+                          area_name: str = None) -> dict:
+    """Collect the newest valid values of each metric from csv rows.
+
+    Reads rows lazily (newest first, as exported by the covid API)
+    and stops as soon as every metric has collected the number of
+    valid values it asked for, so memory stays flat and the rest of
+    the file is never read.
+
+    Keyword arguments:
+    rows -- an iterator of csv rows, header row first
+    wanted -- a dictionary of metric name to the number of valid values
+    to collect for it
+    area_name -- only use rows for this areaName (all rows by default)
     """
-    csvlist = []
-    with open(input_csv, newline='', encoding="utf8") as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        for row in csvreader:
-            csvlist.append(row)
-        logging.info("Parsed CSV data")
-        return csvlist
+    header = next(rows, [])
+    indexes = {name: header.index(name) for name in wanted}
+    area_index = None
+    if area_name is not None and "areaName" in header:
+        area_index = header.index("areaName")
+    found = {name: [] for name in wanted}
+    remaining = {name for name, number in wanted.items() if number > 0}
+    for row in rows:
+        if not remaining:
+            break
+        if area_index is not None and row[area_index] != area_name:
+            continue
+        for name in list(remaining):
+            index = indexes[name]
+            if index >= len(row) or row[index] == "":
+                continue
+            try:
+                found[name].append(int(row[index]))
+            except (TypeError, ValueError):
+                continue
+            if len(found[name]) == wanted[name]:
+                remaining.discard(name)
+    return found
+
+
+def stream_covid_csv_data(input_csv: Union[str, os.PathLike, IO],
+                          area_name: str = None, number: int = 7) -> tuple:
+    """Process a csv export into index.html values without loading it.
+
+    A streaming alternative to process_covid_csv_data for large
+    (optionally compressed) exports, returning the same values.
+
+    Keyword arguments:
+    input_csv -- a system path or file object containing the csv data
+    area_name -- only use rows for this areaName (all rows by default)
+    number -- the amount of days to sum infections over (7 by default)
+    """
+    rows = iter_csv_rows(input_csv)
+    try:
+        found = collect_recent_values(rows, {
+            "cumDailyNsoDeathsByDeathDate": 1,
+            "hospitalCases": 1,
+            "newCasesBySpecimenDate": number + 1}, area_name)
+    finally:
+        rows.close()
+    cumulative_deaths = next(iter(found["cumDailyNsoDeathsByDeathDate"]), None)
+    hospital_cases = next(iter(found["hospitalCases"]), None)
+    # The most recent day is skipped, as it is incomplete
+    national_7day_infections = sum(found["newCasesBySpecimenDate"][1:])
+    logger.info("Streamed covid values for %s", area_name)
+    return national_7day_infections, hospital_cases, cumulative_deaths
 
 
 def is_integer(value: any) -> bool:
@@ -54,47 +198,38 @@ def is_integer(value: any) -> bool:
     except TypeError:
         return False
     else:
-        logging.info("is_integer returned %s", value)
+        # Called for every cell, so skip the call unless debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("is_integer returned %s", value)
         return True
 
 
 def find_recent_value(test_dictionary: list, indexname: str) -> int:
     """Find the most recent value for a category in a csv dictionary.
 
-    Finds the most recent value in a csv datasheet by iterating through
-    until the selected value returns true to an is_integer check.
-    Used to make sure the value we are taking is the most recent one
-    that is valid.
+    Finds the most recent valid value in a csv datasheet (newest row
+    first), stopping at the first row holding one.
 
     Keyword arguments:
     data -- the 2d list to iterate through
     valuename -- the name of the vale which to iterate through
     """
-    temp = 0
-    index = test_dictionary[0].index(indexname)
-    counter = 1
-    try:
-        temp = (test_dictionary[counter])[index]
-    except IndexError:
-        logging.error("IndexError in find_recent_value for value %s",temp)
+    values = collect_recent_values(iter(test_dictionary),
+        {indexname: 1})[indexname]
+    if not values:
+        logger.error("No valid values found for %s", indexname)
         return None
-    while not is_integer(temp):
-        counter += 1
-        try:
-            temp = (test_dictionary[counter])[index]
-        except IndexError:
-            logging.error("IndexError in find_recent_value for value %s",temp)
-            return None
-    logging.info("Most recent value for %s is %s",indexname, temp)
-    return int(temp)
+    logger.info("Most recent value for %s is %s",indexname, values[0])
+    return values[0]
 
 
 def sum_recent_values(data: list, indexname: str, number: int = 7) -> int:
     """Return the sum of a set number of the most recent values.
 
     Sums the most recent values of a category in order to obtain an
-    'X-day' summation. Only counts up with integer values thanks to
-    the is_integer test
+    'X-day' summation, skipping the most recent (incomplete) value.
+    Rows are read newest first, stopping once number + 1 valid values
+    have been found
 
     Keyword arguments:
     data -- the 2d list to iterate through
@@ -102,64 +237,65 @@ def sum_recent_values(data: list, indexname: str, number: int = 7) -> int:
     number -- the amount of iterations to calculate
     (set to 7 [one week] by default)
     """
-    index = data[0].index(indexname)
-    templist = []
-    counter = 0
-    finalval = 0
-    while len(templist) != number:
-        if counter - 1 >= 0:
-            tempcounter = counter - 1
-        else:
-            tempcounter = counter
-        try:
-            int_test = (data[tempcounter])[index]
-        except IndexError:
-            logging.error(
-                "IndexError in find_recent_value for value %s",
-                (data[counter])[index])
-        if is_integer(int_test):
-            try:
-                templist.append((data[counter])[index])
-            except IndexError:
-                logging.error(
-                    "IndexError in find_recent_value for value %s",
-                    (data[counter])[index])
-        counter += 1
-    for i in range(len(templist)):
-        finalval += int(templist[i])
-    logging.info("Sum of most recent values for %s is %s",indexname, finalval)
+    values = collect_recent_values(iter(data),
+        {indexname: number + 1})[indexname]
+    if len(values) < number + 1:
+        logger.warning(
+            "Only %s valid values available for %s", len(values), indexname)
+    finalval = sum(values[1:])
+    logger.info("Sum of most recent values for %s is %s",indexname, finalval)
     return finalval
 
 
-def process_covid_csv_data(data_to_process: Union[list, dict]) -> int:
+def rolling_recent_values(data: list, indexname: str,
+                          windows: tuple = (7, 14, 28)) -> dict:
+    """Return rolling sums, means and week-on-week changes of a category.
+
+    Computes every window in one pass over the data, rather than one
+    sum_recent_values call (and one scan) per window. See
+    CovidDataStore.rolling for how missing days are handled.
+
+    Keyword arguments:
+    data -- the 2d list to iterate through
+    indexname -- the name of the index which to iterate through
+    windows -- the window lengths in days (set to 7, 14 and 28 by default)
+    """
+    from covid_data_store import CovidDataStore
+    return CovidDataStore.from_rows(data, [indexname]).rolling(
+        indexname, windows)
+
+
+@metrics.timed("process_covid_csv_data", "processing covid data")
+def process_covid_csv_data(data_to_process: Union[list, dict,
+                                                  "CovidDataStore"]) -> int:
     """Process covid data into values used by index.html.
 
-    Processes csv data into values usable by
+    Processes covid data into values usable by
     index.html, exctracting cumulative 7 day values for infections,
-    hospital case data, and cumulative death data through the use of
-    above-defined functions such as sum_recent_values
+    hospital case data, and cumulative death data. The data is loaded
+    into a CovidDataStore once, and the three values are then read
+    from its arrays
 
     Keyword arguments:
-    data_to_process -- a 2d list or dictionary containing the data
-    about national covid cases. In the case of a dictionary, it is
-    converted into a csv file as this function's existence is
-    necessitated through a test function
+    data_to_process -- a 2d list, a dictionary as returned by
+    covid_API_request or an already built CovidDataStore containing
+    the data about national covid cases
     """
-    try:
-        data_to_process[0]
-    except KeyError:
-        data_to_process = dict_to_csv(data_to_process)
+    from covid_data_store import CovidDataStore
+    if isinstance(data_to_process, CovidDataStore):
+        store = data_to_process
+    elif isinstance(data_to_process, dict):
+        store = CovidDataStore.from_dictionary(data_to_process)
+    else:
+        store = CovidDataStore.from_rows(data_to_process)
 
-    cumulative_deaths = find_recent_value(data_to_process,
-        "cumDailyNsoDeathsByDeathDate")
+    cumulative_deaths = store.recent_value("cumDailyNsoDeathsByDeathDate")
 
-    national_7day_infections = sum_recent_values(data_to_process,
-        "newCasesBySpecimenDate", 7)
+    national_7day_infections = store.sum_recent("newCasesBySpecimenDate", 7)
 
-    hospital_cases = find_recent_value(data_to_process,
-        "hospitalCases")
+    hospital_cases = store.recent_value("hospitalCases")
 
-    logging.info(
+    logger.info(
         "Processed cumulative deaths as %s, 7 day infections\
             as %s, and hospital cases as %s",cumulative_deaths,
             national_7day_infections,
@@ -188,10 +324,11 @@ def dict_to_csv(input_dictionary):
         return_csv.append([loop_dict["areaCode"], loop_dict["areaName"],
             loop_dict["areaType"], loop_dict["cumDailyNsoDeathsByDeathDate"],
             loop_dict["hospitalCases"], loop_dict["newCasesBySpecimenDate"]])
-    logging.info("Successfully parsed dictionary to csv")
+    logger.info("Successfully parsed dictionary to csv")
     return return_csv
 
 
+@metrics.timed("covid_api_request", "Covid API requests")
 def covid_API_request(location: str = "England",
                       location_type: str = "nation"):
     """Request data from the British Government's covid API.
@@ -211,19 +348,10 @@ def covid_API_request(location: str = "England",
         f'areaType={location_type}',
         f'areaName={location}'
     ]
-    cases_and_deaths = {
-        "areaCode": "areaCode",
-        "areaName": "areaName",
-        "areaType": "areaType",
-        "date": "date",
-        "cumDailyNsoDeathsByDeathDate": "cumDailyNsoDeathsByDeathDate",
-        "hospitalCases": "hospitalCases",
-        "newCasesBySpecimenDate": "newCasesBySpecimenDate"
-    }
-
+    from uk_covid19 import Cov19API
     covid_data = Cov19API(filters=england_only,
-                            structure=cases_and_deaths).get_json()['data']
-    logging.info("Successfully called Covid API for %s",location)
+                            structure=CASES_AND_DEATHS).get_json()['data']
+    logger.info("Successfully called Covid API for %s",location)
     return reformat_data(covid_data)
 
 def reformat_data(input_dict):
@@ -250,76 +378,38 @@ def reformat_data(input_dict):
         }
         counter += 1
 
-    logging.info("Successfuly reformatted dictionary")
+    logger.info("Successfuly reformatted dictionary")
     return data_dictionary
 
 
-def schedule_covid_updates(update_interval: str, update_name: str):
-    """Schedule a covid update using the sched module.
+def schedule_covid_updates(update_interval: str, update_name: str,
+                           repeat: bool = False):
+    """Schedule a covid update with the shared update_scheduler.
 
     Keyword arguments:
     update-interval -- the time at which the update should run,
     expected in the format %H:%M [parsed into usable data]
     update-name -- a unique identifier for the update, derived from the widget title
+    repeat -- whether the update runs again every day (False by default)
     """
-    execute_time = calculate_interval(update_interval)
     try:
-        scheduled_update = scheduler.enterabs(execute_time, 1, update_data,
-                                              {update_interval: update_interval,
-                                              update_name: update_name})
-        scheduled_updates.append({"update": scheduled_update, "title": update_name,
-                                  "time": update_interval})
-        logging.info(
+        update_scheduler.schedule(update_name, update_interval,
+            partial(update_data, update_interval, update_name), repeat)
+        logger.info(
             "Sucessfully scheduled %s at %s",update_name, update_interval)
-        logging.info("scheduler queue is: %s",scheduler.queue)
     except ValueError:
-        logging.error(
+        logger.error(
             "ValueError thrown when scheduling update with interval %s and\
-            name %s",execute_time, update_name)
-
-
-def calculate_interval(update_interval: str = "00:00") -> str:
-    """Calculate a timestamp for when to schedule covid updates.
-
-    Generates a unixtime timestamp from an Hours:Minutes string,
-    which is parsed into unix time that can then be used to schedule
-    the update. If the given time has already passed, we set the update
-    to happen the next time that time happes [i.e. tomorrow]
-
-    update-interval -- the time at which the update should run,
-    expected in the format %H:%M [parsed into usable data]
-    """
-    update_interval = str(update_interval).split(":")
-    update_hour = update_interval[0]
-    try:
-        update_minute = update_interval[1]
-    except IndexError:
-        update_minute = "00"
-    next_time = str(date.today()) + ' ' + update_hour + \
-        ":" + update_minute + ':00'
-    execute_time = time.strptime(next_time, '%Y-%m-%d %H:%M:%S')
-    execute_time = time.mktime(execute_time)
-    try:
-        if time.time() > execute_time:
-            next_time = (str((date.today() + timedelta(days=1))) +
-                         ' ' + update_hour + ":" + update_minute + ':00')
-            execute_time = time.mktime(
-                time.strptime(next_time, '%Y-%m-%d %H:%M:%S'))
-    except TypeError:
-        logging.error("TypeError when parsing time")
-    logging.info(
-        "Successfuly parsed %s, next call is at: %s",update_interval,
-        next_time)
-    return execute_time
+            name %s",update_interval, update_name)
 
 
 def update_data(update_interval: str, update_name: str):
     """Update data after an update has run.
 
-    Allows for rescheduling updates and calling an API request on
-    completion of a scheduled update. Checks to see if the update_name
-    contains the word "daily" [assigned for repeating updates] and if
-    so repeats it, if not removes the widget
+    Calls an API request when a scheduled update runs. Checks to see
+    if the update_name contains the word "daily" [assigned for repeating
+    updates] and if not removes the widget, as repeating updates are
+    rescheduled by update_scheduler itself
 
     Keyword arguments:
     update-interval -- the time at which the update should run,
@@ -328,27 +418,18 @@ def update_data(update_interval: str, update_name: str):
     derived from the widget title
     """
     import widget_interface
-    widget_interface.local_7day_infections = process_covid_csv_data(
-        covid_API_request(config['local_location'],
-        config['local_location_type']))[0]
-    (widget_interface.national_7day_infections, 
-        widget_interface.hospital_cases,
-        widget_interface.cumulative_deaths) = process_covid_csv_data(
-        covid_API_request(config['national_location'],
-        config['national_location_type']))
-    for update in widget_interface.updates_list:
-        if update_name == update['title']:
-            if "daily" in update['content']:
-                try:
-                    schedule_covid_updates(update_interval, update_name)
-                    logging.info("Scheduled a new covid update")
-                except ValueError:
-                    logging.error(
-                        "Failed to schedule covid update %s",update_name)
-            else:
+    import dashboard_snapshot
+    import area_registry
+    area_registry.update_areas()
+    with dashboard_snapshot.write_lock:
+        for update in list(widget_interface.updates_list):
+            if update_name == update['title'] and \
+                    "daily" not in update['content']:
                 widget_interface.remove_item(update, "update_item",
                     widget_interface.updates_list, True)
-                logging.info("Removed widget %s",update['title'])
+                dashboard_snapshot.publish(
+                    updates=widget_interface.updates_list)
+                logger.info("Removed widget %s",update['title'])
 
 
 def remove_update(title: str):
@@ -358,23 +439,7 @@ def remove_update(title: str):
     title -- the name of the update which to remove,
     corresponding to update_name
     """
-    for update in scheduled_updates:
-        if update['title'] == title:
-            scheduled_update = update['update']
-            try:
-                scheduler.cancel(scheduled_update)
-                logging.info(
-                    "Removed Covid update, scheduler queue is: %s",
-                    scheduler.queue)
-            except ValueError:
-                logging.warning(
-                    "Scheduler failed to cancel update %s, (this could be\
-                    because it's already been cancelled!)",scheduled_update)
-                logging.warning("Covid scheduler queue is: %s",
-                    scheduler.queue)
-
-
-def run_updates():
-    """Run the scheduler, called from the widget_interface every 60s."""
-    scheduler.run(blocking=False)
-    logging.info("Covid data scheduler was run with blocking=False")
\ No newline at end of file
+    if not update_scheduler.cancel(title):
+        logger.warning(
+            "Scheduler failed to cancel update %s, (this could be\
+            because it's already been cancelled!)",title)
@@ -0,0 +1,309 @@
+"""
+Columnar, NumPy-backed storage for covid time series data
+"""
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRICS = ["cumDailyNsoDeathsByDeathDate", "hospitalCases",
+           "newCasesBySpecimenDate"]
+
+AREA_FIELDS = ["areaCode", "areaName", "areaType"]
+
+
+def to_masked_int64(cells) -> tuple:
+    """Convert a column of raw cells into an int64 array and a mask.
+
+    Cells that are empty strings or None are marked invalid in the
+    mask (and stored as 0 in the values array), everything else is
+    converted to an int64 in a single vectorized cast. Falls back to
+    converting cell by cell if the column contains anything that
+    can't be cast directly.
+
+    Keyword arguments:
+    cells -- an iterable of csv strings, integers or None values
+    """
+    cells = np.asarray(list(cells), dtype=object)
+    # Elementwise comparison against None is intended here
+    mask = (cells != None) & (cells != "")  # pylint: disable=singleton-comparison
+    values = np.zeros(len(cells), dtype=np.int64)
+    try:
+        values[mask] = cells[mask].astype(np.int64)
+    except (TypeError, ValueError):
+        for position in np.flatnonzero(mask):
+            try:
+                values[position] = int(cells[position])
+            except (TypeError, ValueError):
+                mask[position] = False
+    return values, mask
+
+
+def column(rows: list, index: int) -> list:
+    """Return one column of a csv-type 2d list, without its header.
+
+    Short rows are treated as holding empty cells.
+
+    Keyword arguments:
+    rows -- the 2d list, header row first
+    index -- the position of the column
+    """
+    return [row[index] if index < len(row) else "" for row in rows[1:]]
+
+
+class CovidDataStore:
+    """Typed, columnar store of the covid time series for one area.
+
+    Holds a single date index (newest date first) alongside an int64
+    values array and a boolean validity mask for every metric, so that
+    headline numbers can be read with vectorized masked operations
+    instead of scanning a 2d list cell by cell. Build one with
+    from_rows, from_records or from_dictionary.
+
+    Keyword arguments:
+    dates -- a datetime64[D] array, one entry per row
+    metrics -- a dictionary of metric name to (values, mask) tuples
+    area -- a dictionary holding the areaCode, areaName and areaType
+    """
+
+    def __init__(self, dates, metrics: dict, area: dict = None):
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.values = {}
+        self.masks = {}
+        order = None
+        if len(self.dates) > 1 and not np.isnat(self.dates).any():
+            if (np.diff(self.dates.astype(np.int64)) > 0).any():
+                order = np.argsort(-self.dates.astype(np.int64),
+                                   kind="stable")
+                self.dates = self.dates[order]
+        for name, (values, mask) in metrics.items():
+            if order is not None:
+                values, mask = values[order], mask[order]
+            self.values[name] = values
+            self.masks[name] = mask
+        area = area or {}
+        self.area_code = area.get("areaCode")
+        self.area_name = area.get("areaName")
+        self.area_type = area.get("areaType")
+        # Cached results of daily_prefix_sums, indexed by metric name
+        self.prefix_sums = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_rows(cls, rows: list, metrics: list = None):
+        """Build a store from a csv-type 2d list with a header row.
+
+        Only the date column and the requested metric columns are read.
+
+        Keyword arguments:
+        rows -- the 2d list, as returned by parse_csv_data
+        metrics -- the metric names to load (all known metrics present
+        in the header by default)
+        """
+        header = rows[0]
+        if metrics is None:
+            metrics = [name for name in METRICS if name in header]
+        if "date" in header:
+            dates = [value or "NaT"
+                     for value in column(rows, header.index("date"))]
+        else:
+            dates = ["NaT"] * (len(rows) - 1)
+        area = {}
+        if len(rows) > 1:
+            for field in AREA_FIELDS:
+                if field in header:
+                    area[field] = rows[1][header.index(field)]
+        loaded = {}
+        for name in metrics:
+            loaded[name] = to_masked_int64(column(rows, header.index(name)))
+        logger.info("Loaded %s rows into a columnar data store", len(dates))
+        return cls(dates, loaded, area)
+
+    @classmethod
+    def from_records(cls, records: list, metrics: list = None):
+        """Build a store from a list of Cov19API json records.
+
+        Keyword arguments:
+        records -- the 'data' list returned by Cov19API.get_json
+        metrics -- the metric names to load (all known metrics by default)
+        """
+        if metrics is None:
+            metrics = METRICS
+        dates = [record.get("date") or "NaT" for record in records]
+        area = {}
+        if records:
+            area = {field: records[0].get(field) for field in AREA_FIELDS}
+        loaded = {}
+        for name in metrics:
+            loaded[name] = to_masked_int64(
+                record.get(name) for record in records)
+        logger.info("Loaded %s records into a columnar data store",
+                    len(dates))
+        return cls(dates, loaded, area)
+
+    @classmethod
+    def from_dictionary(cls, input_dictionary: dict, metrics: list = None):
+        """Build a store from a date-keyed dictionary from reformat_data.
+
+        Keyword arguments:
+        input_dictionary -- the dictionary returned by covid_API_request
+        metrics -- the metric names to load (all known metrics by default)
+        """
+        records = []
+        for key, entry in input_dictionary.items():
+            record = dict(entry)
+            record.setdefault("date", key)
+            records.append(record)
+        return cls.from_records(records, metrics)
+
+    def recent_value(self, name: str) -> int:
+        """Return the most recent valid value of a metric, or None.
+
+        Keyword arguments:
+        name -- the name of the metric
+        """
+        valid = np.flatnonzero(self.masks[name])
+        if len(valid) == 0:
+            logger.error("No valid values found for %s", name)
+            return None
+        return int(self.values[name][valid[0]])
+
+    def recent_date(self, name: str) -> str:
+        """Return the date of the most recent valid value of a metric.
+
+        Keyword arguments:
+        name -- the name of the metric
+        """
+        valid = np.flatnonzero(self.masks[name])
+        if len(valid) == 0 or np.isnat(self.dates[valid[0]]):
+            return None
+        return str(self.dates[valid[0]])
+
+    def sum_recent(self, name: str, number: int = 7) -> int:
+        """Return the sum of a set number of the most recent valid values.
+
+        The most recent valid value is skipped, as the latest day's
+        figures are incomplete when they are first published.
+
+        Keyword arguments:
+        name -- the name of the metric
+        number -- the amount of values to sum (set to 7 by default)
+        """
+        valid = self.values[name][self.masks[name]]
+        if len(valid) < number + 1:
+            logger.warning(
+                "Only %s valid values available for %s", len(valid), name)
+        return int(valid[1:number + 1].sum())
+
+    def daily_prefix_sums(self, name: str) -> tuple:
+        """Return a metric's prefix sums over every calendar day.
+
+        The valid values are laid out on a calendar grid from the
+        oldest to the newest valid date, with days missing from the data
+        (or holding no valid value) counting as zero and not as a valid
+        day. Returns the oldest date, the running totals and the running
+        count of valid days, each with a leading zero, so the total of
+        any run of days is a difference of two entries. The result is
+        cached, as the store isn't changed once built.
+
+        Keyword arguments:
+        name -- the name of the metric
+        """
+        if name in self.prefix_sums:
+            return self.prefix_sums[name]
+        valid = self.masks[name] & ~np.isnat(self.dates)
+        dates = self.dates[valid]
+        if len(dates) == 0:
+            result = None, np.zeros(1, dtype=np.int64), \
+                np.zeros(1, dtype=np.int64)
+        else:
+            oldest = dates.min()
+            offsets = (dates - oldest).astype(np.int64)
+            totals = np.zeros(offsets.max() + 1, dtype=np.int64)
+            counts = np.zeros(offsets.max() + 1, dtype=np.int64)
+            np.add.at(totals, offsets, self.values[name][valid])
+            np.add.at(counts, offsets, 1)
+            result = (oldest,
+                      np.concatenate(([0], np.cumsum(totals))),
+                      np.concatenate(([0], np.cumsum(counts))))
+        self.prefix_sums[name] = result
+        return result
+
+    def rolling(self, name: str, windows: tuple = (7,),
+                skip_latest: bool = True, offset: int = 7) -> dict:
+        """Return rolling sums, means and changes for a set of windows.
+
+        Every window ends on the same day: the most recent day with a
+        valid value, or the day before it when skip_latest is set, as
+        the latest day's figures are incomplete when first published.
+        Windows are measured in calendar days, so a missing day shortens
+        the window's 'days' instead of pulling in an older day, and the
+        'mean' is taken over the valid days only. 'change' is the
+        relative change of the mean from the same window ending offset
+        days earlier (week-on-week by default), or None without data to
+        compare against. All windows come from one set of prefix sums.
+
+        Keyword arguments:
+        name -- the name of the metric
+        windows -- the window lengths in days (set to (7,) by default)
+        skip_latest -- whether to leave out the latest day (True by
+        default)
+        offset -- how many days earlier the compared window ends (set to
+        7 by default)
+        """
+        _, totals, counts = self.daily_prefix_sums(name)
+        end = len(totals) - 2 - (1 if skip_latest else 0)
+        results = {}
+        for window in windows:
+            total, days = window_total(totals, counts, end, window)
+            previous, previous_days = window_total(
+                totals, counts, end - offset, window)
+            mean = total / days if days else None
+            previous_mean = previous / previous_days if previous_days \
+                else None
+            change = None
+            if mean is not None and previous_mean:
+                change = (mean - previous_mean) / previous_mean
+            results[window] = {"sum": total, "days": days, "mean": mean,
+                               "change": change}
+        return results
+
+    def rolling_series(self, name: str, window: int = 7) -> tuple:
+        """Return the rolling sums and means ending on every day.
+
+        Returns the dates (oldest first) alongside the sum and the mean
+        of the window ending on each date, with a NaN mean for windows
+        holding no valid days.
+
+        Keyword arguments:
+        name -- the name of the metric
+        window -- the window length in days (set to 7 by default)
+        """
+        oldest, totals, counts = self.daily_prefix_sums(name)
+        if oldest is None:
+            return (np.array([], dtype="datetime64[D]"),
+                    np.array([], dtype=np.int64), np.array([]))
+        ends = np.arange(1, len(totals))
+        starts = np.maximum(ends - window, 0)
+        sums = totals[ends] - totals[starts]
+        days = counts[ends] - counts[starts]
+        means = np.where(days > 0, sums / np.maximum(days, 1), np.nan)
+        return oldest + np.arange(len(ends)), sums, means
+
+
+def window_total(totals, counts, end: int, window: int) -> tuple:
+    """Return the total and valid day count of a window of days.
+
+    Keyword arguments:
+    totals -- running totals with a leading zero, from daily_prefix_sums
+    counts -- running valid day counts with a leading zero
+    end -- the grid index of the window's last day
+    window -- the window length in days
+    """
+    if end < 0:
+        return 0, 0
+    start = max(end + 1 - window, 0)
+    return (int(totals[end + 1] - totals[start]),
+            int(counts[end + 1] - counts[start]))
@@ -1,175 +1,385 @@
 """
 Handles news schedulers and API calls
 """
-from datetime import timedelta, date
+from datetime import datetime, timedelta, timezone
+from functools import partial
 import logging
-import sched
-import time
-import json
-import os
-import requests
+import http_client
+from fetch_engine import iter_concurrently
 from flask import Markup
+import update_scheduler
+import dashboard_snapshot
+import config_loader
+import metrics
+from config_loader import changed_keys, get_config
+from news_dedupe import NearDuplicateIndex, signature
+from news_topics import load_topics, match_topics, plan_queries, topic_pattern
+# calculate_interval now lives in update_scheduler, re-exported here
+from update_scheduler import calculate_interval  # pylint: disable=unused-import
 
-scheduler = sched.scheduler(time.time, time.sleep)
+logger = logging.getLogger(__name__)
 
-scheduled_updates = []
+# Stored articles, newest first
 news_list = []
-current_news_titles = []
-news_blacklist = []
+# Normalized titles and urls of every stored article
+current_news_titles = set()
+current_news_urls = set()
+# Normalized titles of dismissed articles, mapped to when they were dismissed
+news_blacklist = {}
 
-directory_path = os.path.dirname(os.path.abspath(__file__)) 
-new_path = os.path.join(directory_path, "config.json")
-with open(new_path, "r", encoding="utf8") as jsonfile:
-    config = json.load(jsonfile)
-apiKey = config['apiKey']
+# Signatures of stored and of dismissed articles, for near-duplicate checks
+near_duplicates = NearDuplicateIndex(
+    get_config().get('news_duplicate_threshold', 0.5))
+blacklist_duplicates = NearDuplicateIndex(
+    get_config().get('news_duplicate_threshold', 0.5))
+# Every news topic, with the main headlines first, and their patterns
+topics = load_topics(get_config())
+topic_patterns = {topic['id']: topic_pattern(topic) for topic in topics}
 
 
-def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus") -> dict:
+@metrics.timed("news_api_request", "News API requests")
+def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus",
+                     page: int = None, sources: str = None) -> dict:
     """Request news database from the news API.
 
+    Requests go through http_client's pooled session, and identical
+    requests within news_cache_ttl seconds are served from its cache.
+
     Keyword arguments:
     covid_terms -- search terms using when fetching from the news API
+    page -- the page of results to request, news_page_size articles
+    long (None by default, meaning the API's default first page)
+    sources -- the sources to limit results to (None by default,
+    meaning the sources set in config.json)
     """
     terms = " OR ".join(covid_terms.split())
-    if config['specify_sources'] is True:
+    if get_config()['specify_sources'] is True:
         payload = {
-            "apiKey": apiKey,
-            "language": config['news_language'],
+            "apiKey": get_config()['apiKey'],
+            "language": get_config()['news_language'],
             "q": terms,
-            "sortBy": config['news_api_sortBy'],
-            "sources": config['sources']}
+            "sortBy": get_config()['news_api_sortBy'],
+            "sources": get_config()['sources']}
     else:
         payload = {
-            "apiKey": apiKey,
-            "language": config['news_language'],
+            "apiKey": get_config()['apiKey'],
+            "language": get_config()['news_language'],
             "q": terms,
-            "sortBy": config['news_api_sortBy']}
-    request = requests.get(config['news_api_url'], params=payload)
-    logging.info("Successfully requested news data from the news API")
-    return request.json()
+            "sortBy": get_config()['news_api_sortBy']}
+    if page is not None:
+        payload['page'] = page
+        payload['pageSize'] = get_config().get('news_page_size', 100)
+    if sources is not None:
+        payload['sources'] = sources
+    news_data = http_client.get_json(get_config()['news_api_url'], payload,
+        get_config().get('news_cache_ttl', 300),
+        get_config().get('http_timeout', 10))
+    logger.info("Successfully requested news data from the news API")
+    return news_data
 
 
-def update_news(covid_terms: str = "Covid COVID-19 coronavirus"):
+@metrics.timed("update_news", "news updates")
+def update_news(covid_terms: str = None):
     """Update the news list.
 
-    Called from widget_interface.py and update_data, updates all_news,
-    and then sorts it to make sure blacklisted and already existing
-    news elements don't get spawned. Sorts the news based on the
-    date of publishing, with newest dates coming first in the list
-    (on top of the widget stack)
+    Called from widget_interface.py and update_data, adds new articles
+    from the news API to news_list, making sure blacklisted and already
+    existing news elements don't get spawned. The news is kept sorted
+    by date of publishing, with newest dates coming first in the list
+    (on top of the widget stack). Up to news_max_pages pages are
+    fetched with fetch_news_pages, each stored and published as soon
+    as it arrives. Unless covid_terms is given, every news topic is
+    searched for, using the queries planned by plan_queries
 
     Keyword arguments:
     covid_terms -- string of terms, separated by a space which are
-    used by the news_API to search for connected articles
+    used by the news_API to search for connected articles (None by
+    default, meaning the terms of every topic)
     """
-    global news_list
-    try:
-        all_news = news_API_request(covid_terms)['articles']
-    except IndexError:
-        logging.error("Failed to get NewsAPI with given terms %s",covid_terms)
-        all_news = []
-    length_cache = len(news_list)
-    for element in all_news:
-        if element['title'] in news_blacklist or (element['title'] in 
-            current_news_titles):
-            pass
-        else:
-            title = element['title']
-            for word in config['blacklisted_strings']:
-                if word in title:
-                    title = title.replace(word, '')
-            content = element['description'] + " (" + Markup(
-                "<a target=""blank"" rel=""noopener noreferrer"" href=\"" +
-                element['url'] + "\">" + "Read More" + "</a>") + ")"
-            news_list.append(
-                {"title": title, "content": content,
-                "year": element['publishedAt']})
-            current_news_titles.append(element['title'])
-            logging.debug(
-                "Successfuly added %s to the updates list",element['title'])
-    news_list.sort(reverse=True, key=sort_by_date)
-    if length_cache == len(news_list):
-        logging.info(
+    if covid_terms is None:
+        queries = plan_queries(topics)
+    else:
+        queries = [{"terms": covid_terms, "sources": None, "topics": ()}]
+    added = 0
+    for query in queries:
+        added += fetch_news_pages(query['terms'], query['sources'],
+                                  query['topics'])
+    if added == 0:
+        logger.info(
             "Successfully processed the result from the news API, but\
                 no new articles found")
     else:
-        logging.info("Successfuly added new articles")
+        logger.info("Successfuly added %s new articles", added)
+
 
+def fetch_news_pages(covid_terms: str, sources: str = None,
+                     query_topics: tuple = ()) -> int:
+    """Fetch pages of news concurrently, returning how many articles were new.
 
-def sort_by_date(entry):
-    """Return the entry of key 'year' for use in sorting"""
-    return entry['year']
+    Pages are requested in waves of news_page_concurrency at a time.
+    Fetching stops after news_max_pages pages, after a short or failed
+    page (there are no more results), or after a page holding only
+    articles that are already stored or blacklisted, as the pages after
+    it won't have anything new either.
+
+    Keyword arguments:
+    covid_terms -- string of terms, separated by a space which are
+    used by the news_API to search for connected articles
+    sources -- the sources to limit results to (None by default,
+    meaning the sources set in config.json)
+    query_topics -- the ids of the topics the terms were planned for,
+    given to articles matching none of their terms (none by default)
+    """
+    max_pages = get_config().get('news_max_pages', 1)
+    page_size = get_config().get('news_page_size', 100)
+    wave_size = max(1, get_config().get('news_page_concurrency', 3))
+    added = 0
+    next_page = 1
+    finished = False
+    while not finished and next_page <= max_pages:
+        pages = range(next_page, min(next_page + wave_size, max_pages + 1))
+        next_page = pages.stop
+        results = iter_concurrently(
+            {page: partial(news_API_request, covid_terms, page, sources)
+             for page in pages}, wave_size)
+        for page, news_data, error in results:
+            if error is not None or news_data.get('status') == 'error':
+                logger.error("Failed to get page %s of NewsAPI with given\
+                    terms %s", page, covid_terms)
+                finished = True
+                continue
+            articles = news_data.get('articles', [])
+            if len(articles) < page_size or \
+                    all(is_known(element) for element in articles):
+                finished = True
+            added += store_articles(articles, query_topics)
+    return added
 
 
-def schedule_news_updates(update_interval: str, update_name: str):
-    """Schedule a news update using the sched module.
+def store_articles(articles: list, query_topics: tuple = ()) -> int:
+    """Add a page of articles and publish them, returning how many were new.
 
     Keyword arguments:
-    update-interval -- the time at which the update should run,
-    expected in the format %H:%M [parsed into usable data]
-    update-name -- a unique identifier for the update,
-    derived from the widget title
+    articles -- a list of articles from the news API's 'articles' list
+    query_topics -- the ids of the topics the page was requested for
+    (none by default)
     """
-    execute_time = calculate_interval(update_interval)
-    try:
-        scheduled_update = scheduler.enterabs(execute_time, 1, update_data,
-            {update_interval: update_interval,
-            update_name: update_name})
-        scheduled_updates.append({"update": scheduled_update,
-            "title": update_name, "time": update_interval})
-        logging.info(
-            "Sucessfully scheduled %s at %s",update_name,update_interval)
-        logging.info("scheduler queue is: %s",scheduler.queue)
-    except ValueError:
-        logging.error(
-        "ValueError thrown when scheduling update with\
-             interval %s and name %s",execute_time,update_name)
+    with dashboard_snapshot.write_lock:
+        length_cache = len(news_list)
+        added = 0
+        for element in articles:
+            if add_article(element, query_topics):
+                added += 1
+        evict_articles()
+        if added or length_cache != len(news_list):
+            dashboard_snapshot.publish(news=news_list)
+    return added
+
+
+def normalize_title(title: str) -> str:
+    """Return the key an article title is deduplicated on.
+
+    Blacklisted strings (such as the source's name) are removed, and
+    the title is case-folded with its whitespace collapsed, so the same
+    story from slightly different feeds maps to the same key.
 
+    Keyword arguments:
+    title -- the raw or displayed article title
+    """
+    for word in get_config()['blacklisted_strings']:
+        title = title.replace(word, '')
+    return " ".join(title.casefold().split())
+
+
+def normalize_url(url: str) -> str:
+    """Return the key an article url is deduplicated on.
+
+    Keyword arguments:
+    url -- the article url
+    """
+    return url.split('#')[0].split('?')[0].rstrip('/').lower()
+
+
+def article_cutoff() -> str:
+    """Return the publishedAt time before which articles are dropped."""
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        days=get_config().get('news_max_age_days', 7))
+    return cutoff.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def insert_position(published_at: str) -> int:
+    """Return where an article belongs in news_list, newest first.
 
-def calculate_interval(update_interval: str = "00:00") -> str:
-    """Calculate a timestamp for when to schedule covid updates.
+    Keyword arguments:
+    published_at -- the article's publishedAt time
+    """
+    low, high = 0, len(news_list)
+    while low < high:
+        middle = (low + high) // 2
+        if news_list[middle]['year'] >= published_at:
+            low = middle + 1
+        else:
+            high = middle
+    return low
 
-    Generates a unixtime timestamp from an Hours:Minutes string,
-    which is parsed into unix time that can then be used to schedule
-    the update. If the given time has already passed, we set the
-    update to happen the next time that time happes [i.e. tomorrow]
 
+def is_known(element: dict) -> bool:
+    """Return whether an article is already stored or blacklisted.
+
+    Keyword arguments:
+    element -- an article from the news API's 'articles' list
+    """
+    key = normalize_title(element['title'])
+    return key in news_blacklist or key in current_news_titles or \
+        normalize_url(element['url']) in current_news_urls
+
+
+def tag_article(text: str, query_topics: tuple = ()) -> tuple:
+    """Return the ids of the news topics an article belongs to.
+
+    Articles are tagged with every topic whose terms they mention. The
+    News API also matches text that isn't returned, such as the full
+    article, so articles mentioning none of the terms keep the topics
+    of the query that fetched them.
+
+    Keyword arguments:
+    text -- the article's title and description
+    query_topics -- the ids of the topics the article was requested for
+    (none by default)
+    """
+    return match_topics(text, topics, topic_patterns) or tuple(
+        topic for topic in query_topics if topic in topic_patterns)
+
+
+def add_article(element: dict, query_topics: tuple = ()) -> bool:
+    """Add an article from the news API, returning whether it was new.
+
+    Articles are skipped if their normalized title or url has already
+    been stored or blacklisted, both checked with set lookups, if they
+    are older than every article the store can hold, or if their title
+    and description are a near-duplicate of a stored or dismissed
+    article. New articles are inserted in date order with a binary
+    search, tagged with tag_article.
+
+    Keyword arguments:
+    element -- an article from the news API's 'articles' list
+    query_topics -- the ids of the topics the article was requested for
+    (none by default)
+    """
+    if is_known(element):
+        return False
+    key = normalize_title(element['title'])
+    url = normalize_url(element['url'])
+    published_at = element['publishedAt']
+    if published_at < article_cutoff():
+        return False
+    if len(news_list) >= get_config().get('news_max_stored', 100) and \
+            published_at <= news_list[-1]['year']:
+        return False
+    article_signature = signature(
+        element['title'] + " " + (element['description'] or ""))
+    duplicate = blacklist_duplicates.find(article_signature) or \
+        near_duplicates.find(article_signature)
+    if duplicate is not None:
+        logger.debug("Skipped %s as a near-duplicate of %s",
+           element['title'], duplicate)
+        return False
+    title = element['title']
+    for word in get_config()['blacklisted_strings']:
+        if word in title:
+            title = title.replace(word, '')
+    content = element['description'] + " (" + Markup(
+        "<a target=""blank"" rel=""noopener noreferrer"" href=\"" +
+        element['url'] + "\">" + "Read More" + "</a>") + ")"
+    article_topics = tag_article(
+        element['title'] + " " + (element['description'] or ""),
+        query_topics)
+    news_list.insert(insert_position(published_at),
+        {"title": title, "content": content, "year": published_at,
+        "key": key, "url": url, "topics": article_topics,
+        "query_topics": tuple(query_topics),
+        "description": element['description'] or ""})
+    current_news_titles.add(key)
+    current_news_urls.add(url)
+    near_duplicates.add(key, article_signature)
+    logger.debug(
+        "Successfuly added %s to the updates list",element['title'])
+    return True
+
+
+def forget_article(article: dict):
+    """Remove a stored article's title and url from the indexes.
+
+    Keyword arguments:
+    article -- the article dictionary from news_list
+    """
+    current_news_titles.discard(article['key'])
+    current_news_urls.discard(article['url'])
+    near_duplicates.remove(article['key'])
+
+
+def evict_articles():
+    """Drop the oldest articles beyond news_max_stored or news_max_age_days.
+
+    Old blacklist entries are dropped too, as articles older than
+    news_max_age_days are never added again anyway.
+    """
+    cutoff = article_cutoff()
+    max_stored = get_config().get('news_max_stored', 100)
+    while news_list and (len(news_list) > max_stored or
+            news_list[-1]['year'] < cutoff):
+        forget_article(news_list.pop())
+    for key, dismissed_at in list(news_blacklist.items()):
+        if dismissed_at < cutoff:
+            del news_blacklist[key]
+            blacklist_duplicates.remove(key)
+
+
+def blacklist_article(article: dict):
+    """Stop an article (and any near-duplicate of it) from being shown again.
+
+    Keyword arguments:
+    article -- the article dictionary from news_list
+    """
+    key = normalize_title(article['title'])
+    news_blacklist[key] = datetime.now(timezone.utc).strftime(
+        '%Y-%m-%dT%H:%M:%SZ')
+    article_signature = near_duplicates.signatures.get(
+        article.get('key'), signature(article['title']))
+    blacklist_duplicates.add(key, article_signature)
+    if 'key' in article:
+        forget_article(article)
+
+
+def schedule_news_updates(update_interval: str, update_name: str,
+                          repeat: bool = False):
+    """Schedule a news update with the shared update_scheduler.
+
+    Keyword arguments:
     update-interval -- the time at which the update should run,
     expected in the format %H:%M [parsed into usable data]
+    update-name -- a unique identifier for the update,
+    derived from the widget title
+    repeat -- whether the update runs again every day (False by default)
     """
-    update_interval = str(update_interval).split(":")
-    update_hour = update_interval[0]
-    try:
-        update_minute = update_interval[1]
-    except IndexError:
-        update_minute = "00"
-    next_time = str(date.today()) + ' ' + update_hour + \
-        ":" + update_minute + ':00'
-    execute_time = time.strptime(next_time, '%Y-%m-%d %H:%M:%S')
-    execute_time = time.mktime(execute_time)
     try:
-        if time.time() > execute_time:
-            next_time = (str((date.today() + timedelta(days=1))) +
-                         ' ' + update_hour + ":" + update_minute + ':00')
-            execute_time = time.mktime(
-                time.strptime(
-                    next_time,
-                    '%Y-%m-%d %H:%M:%S'))
-    except TypeError:
-        logging.error("TypeError when parsing time")
-    logging.info(
-        "Successfuly parsed %s, next call is at: %s",update_interval,
-        next_time)
-    return execute_time
+        update_scheduler.schedule(update_name, update_interval,
+            partial(update_data, update_interval, update_name), repeat)
+        logger.info(
+            "Sucessfully scheduled %s at %s",update_name,update_interval)
+    except ValueError:
+        logger.error(
+        "ValueError thrown when scheduling update with\
+             interval %s and name %s",update_interval,update_name)
 
 
 def update_data(update_interval: str, update_name: str):
     """Update data after an update has run.
 
-    Allows for rescheduling updates and calling an API request on
-    completion of a scheduled update. Checks to see if the update_name
-    contains the word "daily" [assigned for repeating updates] and if
-    so repeats it, if not removes the widget
+    Calls an API request when a scheduled update runs. Checks to see
+    if the update_name contains the word "daily" [assigned for repeating
+    updates] and if not removes the widget, as repeating updates are
+    rescheduled by update_scheduler itself
 
     Keyword arguments:
     update-interval -- the time at which the update should run,
@@ -179,16 +389,15 @@ def update_data(update_interval: str, update_name: str):
     """
     import widget_interface
     update_news()
-    widget_interface.update_site()
-    for update in widget_interface.updates_list:
-        if update_name == update['title']:
-            if "daily" in update['content']:
-                schedule_news_updates(update_interval, update_name)
-                logging.info("Scheduled a new news update")
-            else:
+    with dashboard_snapshot.write_lock:
+        for update in list(widget_interface.updates_list):
+            if update_name == update['title'] and \
+                    "daily" not in update['content']:
                 widget_interface.remove_item(update, "news_item",
                     widget_interface.updates_list, True)
-                logging.info("Removed widget %s",update['title'])
+                dashboard_snapshot.publish(
+                    updates=widget_interface.updates_list)
+                logger.info("Removed widget %s",update['title'])
 
 
 def remove_update(title: str):
@@ -198,23 +407,92 @@ def remove_update(title: str):
     title -- the name of the update which to remove,
     corresponding to update_name
     """
-    for update in scheduled_updates:
-        if update['title'] == title:
-            scheduled_update = update['update']
-            try:
-                scheduler.cancel(scheduled_update)
-                logging.info(
-                    "Removed News update, scheduler queue is: %s",
-                    scheduler.queue)
-            except ValueError:
-                logging.warning(
-                    "Scheduler failed to cancel update %s,\
-                        (this could be because it's already been cancelled!)",
-                        scheduled_update)
-                logging.warning("News scheduler queue is: %s",scheduler.queue)
-
-
-def run_updates():
-    """Run the scheduler, called from the widget_interface every 60s."""
-    scheduler.run(blocking=False)
-    logging.info("News data scheduler was run with blocking=False")
\ No newline at end of file
+    if not update_scheduler.cancel(title):
+        logger.warning(
+            "Scheduler failed to cancel update %s,\
+                (this could be because it's already been cancelled!)",
+                title)
+
+
+def refilter_articles():
+    """Remove the current blacklisted_strings from stored article titles.
+
+    Stored articles and dismissed titles are re-keyed in place, and an
+    article whose new title matches a dismissed or another stored
+    article is dropped, so no request to the news API is needed.
+    """
+    words = [word.casefold() for word in get_config()['blacklisted_strings']]
+    for key in list(news_blacklist):
+        new_key = key
+        for word in words:
+            new_key = new_key.replace(word, '')
+        new_key = " ".join(new_key.split())
+        if new_key != key:
+            news_blacklist[new_key] = news_blacklist.pop(key)
+            article_signature = blacklist_duplicates.signatures.get(key)
+            blacklist_duplicates.remove(key)
+            if article_signature is not None:
+                blacklist_duplicates.add(new_key, article_signature)
+    for article in list(news_list):
+        title = article['title']
+        for word in get_config()['blacklisted_strings']:
+            title = title.replace(word, '')
+        key = normalize_title(title)
+        if key == article['key']:
+            article['title'] = title
+            continue
+        if key in news_blacklist or key in current_news_titles:
+            news_list.remove(article)
+            forget_article(article)
+            continue
+        article_signature = near_duplicates.signatures.get(article['key'])
+        forget_article(article)
+        article.update(title=title, key=key)
+        current_news_titles.add(key)
+        current_news_urls.add(article['url'])
+        if article_signature is not None:
+            near_duplicates.add(key, article_signature)
+
+
+def apply_config(old: dict, new: dict):
+    """Apply a reloaded config's news changes, called by config_loader.
+
+    Stored articles are re-filtered against new blacklisted_strings,
+    re-tagged for changed topics and evicted for new limits, all
+    locally. Other news settings, such as sources, are simply used by
+    the next request. Processes that only read the shared snapshot just
+    load the new topics, to render their panels.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    global topics, topic_patterns
+    changed = changed_keys(old, new)
+    if not changed & {'blacklisted_strings', 'search_terms', 'news_topics',
+            'news_duplicate_threshold', 'news_max_stored',
+            'news_max_age_days'}:
+        return
+    if changed & {'search_terms', 'news_topics'}:
+        topics = load_topics(new)
+        topic_patterns = {topic['id']: topic_pattern(topic)
+            for topic in topics}
+    if not dashboard_snapshot.is_writer():
+        return
+    with dashboard_snapshot.write_lock:
+        near_duplicates.threshold = blacklist_duplicates.threshold = \
+            new.get('news_duplicate_threshold', 0.5)
+        if 'blacklisted_strings' in changed:
+            refilter_articles()
+        if changed & {'search_terms', 'news_topics'}:
+            for article in news_list:
+                article['topics'] = tag_article(article['title'] + " " +
+                    article.get('description', ""),
+                    article.get('query_topics', ()))
+        evict_articles()
+        dashboard_snapshot.publish(news=news_list)
+    logger.info("Applied news config changes to %s stored articles",
+       len(news_list))
+
+
+config_loader.listeners.append(apply_config)
@@ -0,0 +1,275 @@
+"""
+Immutable, atomically published snapshot of the dashboard's data
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import NamedTuple
+from flask import Markup
+from config_loader import directory_path, get_config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardSnapshot(NamedTuple):
+    """Everything update_site needs to render the dashboard.
+
+    Snapshots are never modified: writers build a new one and publish
+    it by swapping the current reference, so readers can use whichever
+    snapshot they picked up without taking a lock.
+    """
+    version: int = 0
+    published_at: float = 0.0
+    areas: tuple = ()
+    news: tuple = ()
+    updates: tuple = ()
+
+
+# Held by anything changing the dashboard's state, never by readers
+write_lock = threading.RLock()
+# Notified whenever a new snapshot is published
+published = threading.Condition()
+current = DashboardSnapshot()
+loaded_mtime = None
+# Recently published snapshots, indexed by version, for building diffs
+history = OrderedDict([(current.version, current)])
+MAX_HISTORY = 50
+# Callables run with every newly published snapshot, such as checkpoints
+listeners = []
+# Whether this process publishes snapshots (None until first checked),
+# and the open lock file that keeps other processes from doing so
+writer = None
+writer_lock = None
+
+
+def freeze(entries) -> tuple:
+    """Return a tuple of read-only copies of a list of dictionaries.
+
+    Keyword arguments:
+    entries -- an iterable of dictionaries
+    """
+    return tuple(MappingProxyType(dict(entry)) for entry in entries)
+
+
+def snapshot_path() -> str:
+    """Return the path of the shared snapshot file, or None if unset."""
+    if not get_config().get('snapshot_path'):
+        return None
+    return os.path.join(directory_path, get_config()['snapshot_path'])
+
+
+def lock_file(handle) -> bool:
+    """Take an exclusive lock on an open file, returning whether it worked.
+
+    The lock is held until the file is closed, or the process exits.
+
+    Keyword arguments:
+    handle -- the open file to lock
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def is_writer() -> bool:
+    """Return whether this process publishes snapshots.
+
+    Without snapshot_path, every process keeps its own snapshot and
+    publishes it. With it, only the first process to lock the file
+    <snapshot_path>.lock writes to the shared file. That process also
+    runs the scheduled updates and checkpoints, and every other process
+    only reads the snapshots it publishes.
+    """
+    global writer, writer_lock
+    with write_lock:
+        if writer is None:
+            path = snapshot_path()
+            if path is None:
+                writer = True
+            else:
+                handle = open(f"{path}.lock", "a", encoding="utf8")
+                writer = lock_file(handle)
+                if writer:
+                    writer_lock = handle
+                else:
+                    handle.close()
+                logger.info("This process %s the shared snapshot",
+                            "publishes" if writer else "only reads")
+        return writer
+
+
+def publish(**changes) -> DashboardSnapshot:
+    """Publish a new snapshot with some fields replaced.
+
+    Every new version invalidates cached pages and responses, wakes the
+    event streams and is checkpointed, so nothing is published when the
+    given fields are unchanged and the current snapshot is returned
+    instead. Calling it without any changes always publishes, to wake
+    the event streams. Raises PermissionError in processes that only
+    read the shared snapshot (see is_writer).
+
+    Keyword arguments:
+    changes -- new values for any of areas, news or updates, as lists of
+    dictionaries
+    """
+    global current
+    with write_lock:
+        if not is_writer():
+            raise PermissionError(
+                "Snapshots are published by another process")
+        base = get_snapshot()
+        frozen = {key: freeze(value) for key, value in changes.items()}
+        if frozen and all(value == getattr(base, key)
+                          for key, value in frozen.items()):
+            logger.debug("Skipped publishing unchanged %s", sorted(frozen))
+            return base
+        snapshot = base._replace(version=base.version + 1,
+                                 published_at=time.time(), **frozen)
+        current = snapshot
+        remember(snapshot)
+        path = snapshot_path()
+        if path is not None:
+            write_snapshot(snapshot, path)
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Snapshot listener %r failed", listener)
+    with published:
+        published.notify_all()
+    logger.debug("Published dashboard snapshot %s", snapshot.version)
+    return snapshot
+
+
+def restore(snapshot: DashboardSnapshot):
+    """Make a previously saved snapshot the current one, keeping its version.
+
+    Keyword arguments:
+    snapshot -- the snapshot to restore
+    """
+    global current
+    with write_lock:
+        if snapshot.version > current.version:
+            current = snapshot
+            remember(snapshot)
+    with published:
+        published.notify_all()
+
+
+def remember(snapshot: DashboardSnapshot):
+    """Keep a snapshot in history, dropping the oldest ones.
+
+    Keyword arguments:
+    snapshot -- the snapshot to keep
+    """
+    history[snapshot.version] = snapshot
+    while len(history) > MAX_HISTORY:
+        history.popitem(last=False)
+
+
+def wait_for_change(version: int, timeout: float) -> DashboardSnapshot:
+    """Block until a snapshot newer than version is published.
+
+    Returns the latest snapshot, which is still the same version if
+    the timeout ran out first. Snapshots published to the shared file
+    by other processes are only noticed when the wait times out.
+
+    Keyword arguments:
+    version -- the snapshot version the caller already has
+    timeout -- the maximum amount of seconds to wait for
+    """
+    with published:
+        published.wait_for(lambda: current.version != version, timeout)
+    return get_snapshot()
+
+
+def get_snapshot() -> DashboardSnapshot:
+    """Return the latest snapshot, loading the shared file if it changed.
+
+    When snapshot_path is set in config.json, other processes may have
+    published a newer snapshot to the file; this is picked up with a
+    single stat call per read.
+    """
+    global current, loaded_mtime
+    path = snapshot_path()
+    if path is None:
+        return current
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return current
+    if mtime != loaded_mtime:
+        snapshot = read_snapshot(path)
+        if snapshot.version > current.version:
+            current = snapshot
+            remember(snapshot)
+        loaded_mtime = mtime
+    return current
+
+
+def snapshot_to_json(snapshot: DashboardSnapshot) -> dict:
+    """Return a snapshot as a dictionary that can be dumped to json.
+
+    Keyword arguments:
+    snapshot -- the snapshot to convert
+    """
+    return {"version": snapshot.version,
+            "published_at": snapshot.published_at,
+            "areas": [dict(area) for area in snapshot.areas],
+            "news": [dict(article) for article in snapshot.news],
+            "updates": [dict(update) for update in snapshot.updates]}
+
+
+def snapshot_from_json(data: dict) -> DashboardSnapshot:
+    """Return the snapshot a snapshot_to_json dictionary was made from.
+
+    Keyword arguments:
+    data -- the dictionary returned by snapshot_to_json
+    """
+    news = []
+    for article in data["news"]:
+        article["content"] = Markup(article["content"])
+        news.append(article)
+    return DashboardSnapshot(data["version"], data["published_at"],
+                             freeze(data["areas"]), freeze(news),
+                             freeze(data["updates"]))
+
+
+def write_snapshot(snapshot: DashboardSnapshot, path: str):
+    """Atomically write a snapshot to a file as json.
+
+    Keyword arguments:
+    snapshot -- the snapshot to write
+    path -- system path of the file to replace
+    """
+    global loaded_mtime
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf8") as snapshot_file:
+        json.dump(snapshot_to_json(snapshot), snapshot_file)
+    os.replace(temporary_path, path)
+    loaded_mtime = os.stat(path).st_mtime_ns
+
+
+def read_snapshot(path: str) -> DashboardSnapshot:
+    """Read a snapshot written by write_snapshot.
+
+    Keyword arguments:
+    path -- system path of the snapshot file
+    """
+    with open(path, "r", encoding="utf8") as snapshot_file:
+        return snapshot_from_json(json.load(snapshot_file))
@@ -0,0 +1,116 @@
+"""
+Runs API requests concurrently, with timeouts and timing information
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# Seconds taken by the most recent run of each request, and of each batch
+request_timings = {}
+batch_timings = []
+
+# How many batch timings to keep for monitoring
+MAX_BATCH_TIMINGS = 100
+
+
+def iter_concurrently(jobs: dict, max_workers: int = 4,
+                      timeout: float = None) -> Iterator[tuple]:
+    """Run a set of requests at the same time, yielding them as they finish.
+
+    Each job runs on a thread pool limited to max_workers threads, and
+    a (key, result, error) tuple is yielded as soon as it completes, so
+    callers can use results while slower requests are still running.
+    A job that raises, or that has been running for longer than
+    timeout seconds, is yielded with its error instead of blocking the
+    rest of the batch. Timed out requests are abandoned rather than
+    killed, and finish in the background.
+
+    Keyword arguments:
+    jobs -- a dictionary of key to a callable taking no arguments
+    max_workers -- the maximum amount of requests to run at once
+    (set to 4 by default)
+    timeout -- seconds a single request may run for (None by default,
+    meaning no limit)
+    """
+    started = {}
+
+    def timed(key, job):
+        started[key] = time.monotonic()
+        try:
+            return job()
+        finally:
+            request_timings[key] = time.monotonic() - started[key]
+
+    batch_start = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    futures = {pool.submit(timed, key, job): key for key, job in jobs.items()}
+    pending = set(futures)
+    failed = 0
+    try:
+        while pending:
+            wait_for = None
+            if timeout is not None:
+                now = time.monotonic()
+                deadlines = [started[futures[future]] + timeout - now
+                             for future in pending
+                             if futures[future] in started]
+                wait_for = max(0.01, min(deadlines, default=timeout))
+            done, pending = wait(pending, timeout=wait_for,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.error("Request %s failed with %r", key, error)
+                    failed += 1
+                    yield key, None, error
+                else:
+                    yield key, result, None
+            if timeout is None:
+                continue
+            now = time.monotonic()
+            for future in list(pending):
+                key = futures[future]
+                if key in started and now - started[key] > timeout:
+                    logger.warning("Request %s timed out after %ss",
+                                   key, timeout)
+                    pending.discard(future)
+                    failed += 1
+                    yield key, None, TimeoutError(f"{key} timed out")
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+        batch_timings.append(time.monotonic() - batch_start)
+        del batch_timings[:-MAX_BATCH_TIMINGS]
+        logger.info("Ran %s requests in %.3fs, %s failed", len(jobs),
+                    batch_timings[-1], failed)
+
+
+def run_concurrently(jobs: dict, max_workers: int = 4,
+                     timeout: float = None) -> tuple:
+    """Run a set of requests at the same time and collect the results.
+
+    Runs the jobs with iter_concurrently, returning a dictionary of
+    results and a dictionary of errors, both indexed by job key, so
+    callers can keep their previous values for failed requests.
+
+    Keyword arguments:
+    jobs -- a dictionary of key to a callable taking no arguments
+    max_workers -- the maximum amount of requests to run at once
+    (set to 4 by default)
+    timeout -- seconds a single request may run for (None by default,
+    meaning no limit)
+    """
+    results = {}
+    errors = {}
+    for key, result, error in iter_concurrently(jobs, max_workers, timeout):
+        if error is None:
+            results[key] = result
+        else:
+            errors[key] = error
+    return results, errors
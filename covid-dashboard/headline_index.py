@@ -0,0 +1,218 @@
+"""
+Precomputed headline values of every area, indexed by areaCode
+"""
+import logging
+import threading
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+import covid_data_cache
+import metrics
+
+logger = logging.getLogger(__name__)
+# numpy (through covid_data_store) is slow to import, so it is only
+# imported once an area is first indexed
+if TYPE_CHECKING:
+    from covid_data_store import CovidDataStore
+
+# Rolling windows (in days) kept for new cases
+WINDOWS = (7, 14, 28)
+# How many days apart the windows compared for week-on-week changes end
+CHANGE_OFFSET = 7
+# Days of records kept per area, enough to recompute every window
+RETAINED_DAYS = max(WINDOWS) + CHANGE_OFFSET + 2
+
+# Headline entries, indexed by areaCode. Entries are replaced, never
+# modified, so a looked up entry can be read without holding index_lock
+index = {}
+# The last RETAINED_DAYS of each area's records, indexed by areaCode
+# then by date
+recent_records = {}
+index_lock = threading.Lock()
+
+
+@metrics.timed("headline_index_entry", "headline index entries")
+def entry_from_store(store: "CovidDataStore", area: tuple, area_code: str,
+                     previous: dict = None) -> dict:
+    """Derive an area's headline entry from its covid data.
+
+    Holds the latest valid value and date of every metric, the rolling
+    new case windows, and the flat values shown on the dashboard.
+
+    Keyword arguments:
+    store -- the area's covid data, either its full history or its
+    retained recent records
+    area -- the (location, location_type) tuple the data is for
+    area_code -- the areaCode the entry is indexed by
+    previous -- the area's previous entry, whose latest values are kept
+    for metrics with no valid value older than the store's data
+    (None by default)
+    """
+    import numpy as np
+    from covid_data_store import METRICS
+    oldest = None
+    if len(store) and not np.isnat(store.dates[-1]):
+        oldest = str(store.dates[-1])
+    latest = {}
+    for name in METRICS:
+        latest_date = store.recent_date(name) if name in store.masks else None
+        previous_date = None
+        if previous is not None:
+            previous_date = previous['latest'].get(name, {}).get('date')
+        if latest_date is not None:
+            latest[name] = {"value": store.recent_value(name),
+                            "date": latest_date}
+        elif oldest is not None and previous_date is not None and \
+                previous_date < oldest:
+            latest[name] = previous['latest'][name]
+        else:
+            latest[name] = {"value": None, "date": None}
+    rolling = store.rolling("newCasesBySpecimenDate", WINDOWS,
+                            offset=CHANGE_OFFSET)
+    week = rolling[7]
+    return {
+        "areaCode": area_code,
+        "areaName": area[0],
+        "areaType": area[1],
+        "newest_date": str(store.dates[0]) if len(store) else None,
+        "days": len(store),
+        "latest": latest,
+        "rolling": rolling,
+        "7day_infections": week['sum'],
+        "hospital_cases": latest["hospitalCases"]['value'],
+        "cumulative_deaths": latest["cumDailyNsoDeathsByDeathDate"]['value'],
+        "7day_average": None if week['mean'] is None else round(week['mean']),
+        "week_change": None if week['change'] is None else round(
+            week['change'], 4)}
+
+
+def retained_records(store: "CovidDataStore") -> dict:
+    """Return the last RETAINED_DAYS of a store's records, indexed by date.
+
+    Keyword arguments:
+    store -- an area's full covid data
+    """
+    import numpy as np
+    if not len(store) or np.isnat(store.dates[0]):
+        return {}
+    cutoff = store.dates[0] - np.timedelta64(RETAINED_DAYS, 'D')
+    records = {}
+    for position in np.flatnonzero(store.dates > cutoff):
+        records[str(store.dates[position])] = {
+            name: int(store.values[name][position])
+            if store.masks[name][position] else None
+            for name in store.masks}
+    return records
+
+
+def rebuild(area: tuple, store: "CovidDataStore", area_code: str) -> dict:
+    """Index an area from its full history, returning its entry.
+
+    Keyword arguments:
+    area -- the (location, location_type) tuple the data is for
+    store -- the area's full covid data
+    area_code -- the areaCode to index the area by
+    """
+    entry = entry_from_store(store, area, area_code)
+    with index_lock:
+        index[area_code] = entry
+        recent_records[area_code] = retained_records(store)
+    return entry
+
+
+def ingest(location: str, location_type: str, records: list):
+    """Apply newly fetched records to an already indexed area.
+
+    Registered with covid_data_cache, so it runs whenever records are
+    merged into the snapshot. Only the area's retained recent records
+    are updated and re-derived, so the cost doesn't grow with the length
+    of its history. Areas that aren't indexed yet are left to rebuild.
+
+    Keyword arguments:
+    location -- the areaName the records were requested for
+    location_type -- the areaType the records were requested for
+    records -- a list of Cov19API json records, new or revised
+    """
+    if not records:
+        return
+    from covid_data_store import METRICS, CovidDataStore
+    area_code = records[0].get('areaCode')
+    with index_lock:
+        retained = recent_records.get(area_code)
+        previous = index.get(area_code)
+        if retained is None or previous is None:
+            return
+        new_days = len({record['date'] for record in records} - set(retained))
+        for record in records:
+            retained[record['date']] = {name: record.get(name)
+                                        for name in METRICS}
+        cutoff = (date.fromisoformat(max(retained))
+                  - timedelta(days=RETAINED_DAYS)).isoformat()
+        for day in [day for day in retained if day <= cutoff]:
+            del retained[day]
+        store = CovidDataStore.from_records(
+            [dict(values, date=day) for day, values in retained.items()])
+        entry = entry_from_store(store, (location, location_type),
+                                 area_code, previous)
+        entry['days'] = previous['days'] + new_days
+        index[area_code] = entry
+    logger.info("Applied %s new records to the headline index of %s",
+                len(records), location)
+
+
+def current_entry(area: tuple, area_code: str, newest_date: str,
+                  days: int) -> dict:
+    """Return an area's entry if ingest has kept it up to date, or None.
+
+    An entry is current when it covers the same days as the area's
+    fetched data, so the area doesn't need rebuilding.
+
+    Keyword arguments:
+    area -- the (location, location_type) tuple the data is for
+    area_code -- the areaCode the area is indexed by
+    newest_date -- the newest date (%Y-%m-%d) of the fetched data
+    days -- how many days the fetched data holds
+    """
+    entry = index.get(area_code)
+    if entry is None or area_code not in recent_records or \
+            entry['newest_date'] != newest_date or entry['days'] != days \
+            or entry['areaName'] != area[0]:
+        return None
+    return entry
+
+
+def lookup(area_code: str) -> dict:
+    """Return the headline entry of an area, or None if not indexed.
+
+    Keyword arguments:
+    area_code -- the areaCode of the area
+    """
+    return index.get(area_code)
+
+
+def remove(area_code: str):
+    """Drop an area from the index.
+
+    Keyword arguments:
+    area_code -- the areaCode of the area
+    """
+    with index_lock:
+        index.pop(area_code, None)
+        recent_records.pop(area_code, None)
+
+
+def restore(entries: list):
+    """Index headline values saved before a restart.
+
+    Restored areas hold no recent records, so they are rebuilt from
+    their full history on their next update.
+
+    Keyword arguments:
+    entries -- a list of flat headline values, as shown on the dashboard
+    """
+    with index_lock:
+        for entry in entries:
+            index[entry['areaCode']] = dict(
+                entry, newest_date=None, latest={}, rolling={})
+
+
+covid_data_cache.listeners.append(ingest)
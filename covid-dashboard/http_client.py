@@ -0,0 +1,124 @@
+"""
+Shared, pooled HTTP session with a response cache for API requests
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cached responses, indexed by cache_key
+response_cache = {}
+# Requests currently being made, indexed by cache_key
+in_flight = {}
+cache_lock = threading.Lock()
+session_lock = threading.Lock()
+shared_session = None
+
+MAX_CACHED_RESPONSES = 256
+
+
+def get_session() -> "requests.Session":
+    """Return the shared keep-alive session, creating it on first use.
+
+    requests is only imported here, so importing this module (and
+    covid_news_handling) stays cheap until the first request is made.
+    """
+    global shared_session
+    with session_lock:
+        if shared_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            shared_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            shared_session.mount("https://", adapter)
+            shared_session.mount("http://", adapter)
+        return shared_session
+
+
+def cache_key(url: str, params: dict) -> tuple:
+    """Return the key a request is cached under.
+
+    Keyword arguments:
+    url -- the url being requested
+    params -- the query parameters of the request
+    """
+    return (url, tuple(sorted((key, str(value))
+                              for key, value in params.items())))
+
+
+def prune_cache(now: float):
+    """Drop expired responses once the cache grows past its limit.
+
+    Keyword arguments:
+    now -- the current time.monotonic() value
+    """
+    if len(response_cache) <= MAX_CACHED_RESPONSES:
+        return
+    for key, cached in list(response_cache.items()):
+        if cached['expires'] <= now and not cached.get('etag'):
+            del response_cache[key]
+    while len(response_cache) > MAX_CACHED_RESPONSES:
+        del response_cache[next(iter(response_cache))]
+
+
+def get_json(url: str, params: dict, ttl: float = 300,
+             timeout: float = 10, session: "requests.Session" = None):
+    """Request json from a url through the shared session and cache.
+
+    Responses are reused for ttl seconds. Identical requests made at
+    the same time share a single round-trip, and once a response has
+    expired it is revalidated with If-None-Match when the server sent
+    an ETag, so an unchanged response isn't downloaded again. Error
+    responses (status 400 and above) are returned but never cached.
+
+    Keyword arguments:
+    url -- the url to request
+    params -- the query parameters to send
+    ttl -- seconds a response is reused for (set to 300 by default)
+    timeout -- seconds to wait for the server (set to 10 by default)
+    session -- the session to use (the shared session by default)
+    """
+    key = cache_key(url, params)
+    with cache_lock:
+        cached = response_cache.get(key)
+        if cached is not None and cached['expires'] > time.monotonic():
+            logger.debug("Served %s from the response cache", url)
+            return cached['data']
+        waiter = in_flight.get(key)
+        leader = waiter is None
+        if leader:
+            waiter = in_flight[key] = {"done": threading.Event()}
+    if not leader:
+        waiter['done'].wait()
+        if 'error' in waiter:
+            raise waiter['error']
+        return waiter['data']
+
+    try:
+        headers = {}
+        if cached is not None and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        response = (session or get_session()).get(
+            url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached is not None:
+            data, etag = cached['data'], cached['etag']
+            logger.info("%s was not modified, reusing cached response", url)
+        else:
+            data, etag = response.json(), response.headers.get('ETag')
+        with cache_lock:
+            if response.status_code < 400:
+                now = time.monotonic()
+                response_cache[key] = {"data": data, "etag": etag,
+                                       "expires": now + ttl}
+                prune_cache(now)
+            waiter['data'] = data
+            del in_flight[key]
+    except Exception as error:
+        with cache_lock:
+            waiter['error'] = error
+            del in_flight[key]
+        raise
+    finally:
+        waiter['done'].set()
+    return data
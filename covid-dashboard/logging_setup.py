@@ -0,0 +1,162 @@
+"""
+Sets up logging through a queue, written to a rotating file in batches
+"""
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import config_loader
+from config_loader import directory_path, get_config
+
+LOG_FORMAT = '%(name)s - %(levelname)s - %(message)s'
+
+log_queue = None
+listener = None
+
+
+class BatchingFileHandler(RotatingFileHandler):
+    """A rotating file handler that flushes to disk in batches.
+
+    Records are written into the file's buffer, which is only flushed
+    every batch_size records, when the queue runs dry or on close,
+    instead of after every record. The file's size is tracked as records
+    are written, as the seek RotatingFileHandler uses to measure it
+    would flush the buffer on every record.
+
+    Keyword arguments:
+    filename -- system path of the log file
+    max_bytes -- the size at which the file is rotated
+    backup_count -- how many rotated files to keep
+    batch_size -- how many records to write between flushes
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int,
+                 batch_size: int = 100):
+        super().__init__(filename, maxBytes=max_bytes,
+                         backupCount=backup_count, encoding="utf8")
+        self.batch_size = batch_size
+        self.pending = 0
+        self.size = os.path.getsize(self.baseFilename) \
+            if os.path.exists(self.baseFilename) else 0
+
+    def shouldRollover(self, record) -> bool:
+        """Return whether a record would take the file past max_bytes."""
+        if self.maxBytes <= 0:
+            return False
+        length = len((self.format(record) + self.terminator).encode(
+            self.encoding or "utf8"))
+        if self.size and self.size + length >= self.maxBytes:
+            self.size = length
+            return True
+        self.size += length
+        return False
+
+    def flush(self):
+        """Count a written record, flushing once a batch is complete."""
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush_batch()
+
+    def flush_batch(self):
+        """Flush every written record to disk."""
+        self.pending = 0
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class BatchingQueueListener(QueueListener):
+    """A queue listener that flushes its handlers whenever it goes idle.
+
+    Keyword arguments:
+    log_queue -- the queue records are put on by QueueHandler
+    handlers -- the handlers to pass records to
+    flush_interval -- seconds without records before flushing
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers,
+                 flush_interval: float = 1.0):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool):
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                self.flush_handlers()
+
+    def flush_handlers(self):
+        """Flush any records still buffered by the handlers."""
+        for handler in self.handlers:
+            getattr(handler, 'flush_batch', handler.flush)()
+
+    def stop(self):
+        super().stop()
+        self.flush_handlers()
+
+
+def apply_levels(settings: dict):
+    """Set the root log level and each module's own level.
+
+    Keyword arguments:
+    settings -- the config dictionary, holding log_level and log_levels
+    """
+    logging.getLogger().setLevel(settings.get('log_level', 'INFO'))
+    for name, level in settings.get('log_levels', {}).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def setup_logging(settings: dict = None) -> QueueListener:
+    """Send every log record through a queue to a background writer.
+
+    Loggers only put records on an in-memory queue, and a listener
+    thread writes them to log_file, rotating it at log_max_bytes and
+    flushing in batches of log_batch_size records. Levels can be set
+    per module with log_levels.
+
+    Keyword arguments:
+    settings -- the config dictionary to read (config.json by default)
+    """
+    global log_queue, listener
+    if settings is None:
+        settings = get_config()
+    if listener is not None:
+        return listener
+    file_handler = BatchingFileHandler(
+        os.path.join(directory_path, settings.get('log_file', 'app.log')),
+        settings.get('log_max_bytes', 5_000_000),
+        settings.get('log_backup_count', 3),
+        settings.get('log_batch_size', 100))
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    apply_levels(settings)
+    listener = BatchingQueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def apply_config(old: dict, new: dict):
+    """Apply changed log levels when config.json changes.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    for name in old.get('log_levels', {}):
+        if name not in new.get('log_levels', {}):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+    apply_levels(new)
+
+
+config_loader.listeners.append(apply_config)
@@ -1,12 +1,17 @@
 from flask import Flask
-import logging
+import logging_setup
 
-logging.basicConfig(filename='app.log', filemode='w', format='%(name)s - %(levelname)s - %(message)s', level=logging.DEBUG)
+logging_setup.setup_logging()
 
 app = Flask(__name__)
+import state_store
+state_store.start()
 with app.app_context():
     import widget_interface
+    import api_interface
+    import update_service
+
+update_service.start()
 
 if __name__ == "__main__":
     app.run()
-
@@ -0,0 +1,179 @@
+"""
+Counters and timing histograms, exposed in the Prometheus text format
+"""
+import bisect
+import functools
+import threading
+import time
+import config_loader
+from config_loader import get_config
+
+# Upper bounds (in seconds) of the default histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Every metric, indexed by name, in the order they were created
+registry = {}
+registry_lock = threading.Lock()
+# Checked before any work is done, so disabled metrics cost one lookup
+enabled = get_config().get('metrics_enabled', True)
+
+
+class Counter:
+    """A value that only goes up, such as a count of failed requests."""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def increment(self, amount: float = 1):
+        """Add an amount (1 by default) to the counter."""
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> list:
+        """Return the (name, labels, value) samples of the counter."""
+        return [(self.name, "", self.value)]
+
+
+class Histogram:
+    """Counts observed values, such as durations, into buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str,
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record a value.
+
+        Keyword arguments:
+        value -- the value to record, typically in seconds
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+
+    def samples(self) -> list:
+        """Return the (name, labels, value) samples of the histogram."""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.total
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            samples.append((self.name + "_bucket", f'{{le="{bound}"}}',
+                            cumulative))
+        cumulative += counts[-1]
+        samples.append((self.name + "_bucket", '{le="+Inf"}', cumulative))
+        samples.append((self.name + "_sum", "", total))
+        samples.append((self.name + "_count", "", cumulative))
+        return samples
+
+
+def get_metric(metric_class, name: str, description: str, **options):
+    """Return the metric with a name, creating it on first use.
+
+    Keyword arguments:
+    metric_class -- Counter or Histogram
+    name -- the metric's Prometheus name
+    description -- the metric's help text
+    options -- any extra arguments for the metric class, such as buckets
+    """
+    metric = registry.get(name)
+    if metric is None:
+        with registry_lock:
+            metric = registry.get(name)
+            if metric is None:
+                metric = registry[name] = metric_class(name, description,
+                                                       **options)
+    return metric
+
+
+def increment(name: str, description: str = "", amount: float = 1):
+    """Add to a counter, if metrics are enabled.
+
+    Keyword arguments:
+    name -- the counter's name
+    description -- the counter's help text, used when it is created
+    amount -- how much to add (set to 1 by default)
+    """
+    if enabled:
+        get_metric(Counter, name, description).increment(amount)
+
+
+def observe(name: str, value: float, description: str = ""):
+    """Record a value in a histogram, if metrics are enabled.
+
+    Keyword arguments:
+    name -- the histogram's name
+    value -- the value to record, typically in seconds
+    description -- the histogram's help text, used when it is created
+    """
+    if enabled:
+        get_metric(Histogram, name, description).observe(value)
+
+
+def timed(name: str, description: str = ""):
+    """Decorate a function to record how long each call takes.
+
+    Durations are recorded in the histogram <name>_seconds and
+    exceptions are counted in <name>_failures_total. When metrics are
+    disabled the function is called straight away.
+
+    Keyword arguments:
+    name -- the prefix of the metric names
+    description -- what is being timed, used in the help text
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                increment(f"{name}_failures_total",
+                          f"Failed calls of {description or name}")
+                raise
+            finally:
+                observe(f"{name}_seconds", time.perf_counter() - start,
+                        f"Seconds taken by {description or name}")
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for sample_name, labels, value in metric.samples():
+            lines.append(f"{sample_name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def apply_config(old: dict, new: dict):
+    """Turn metrics on or off when config.json changes.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    global enabled
+    enabled = new.get('metrics_enabled', True)
+
+
+config_loader.listeners.append(apply_config)
@@ -0,0 +1,132 @@
+"""
+Finds near-duplicate news articles using MinHash and locality sensitive hashing
+"""
+import random
+import re
+import zlib
+
+PERMUTATIONS = 128
+BANDS = 32
+ROWS = PERMUTATIONS // BANDS
+PRIME = (1 << 61) - 1
+
+# Fixed coefficients, so signatures stay comparable across restarts
+coefficient_generator = random.Random(1400)
+COEFFICIENTS = [(coefficient_generator.randrange(1, PRIME),
+                 coefficient_generator.randrange(0, PRIME))
+                for _ in range(PERMUTATIONS)]
+
+
+def shingles(text: str, size: int = 2) -> set:
+    """Return the set of word shingles (runs of words) in some text.
+
+    Keyword arguments:
+    text -- the text to split up, typically a title and description
+    size -- the amount of words per shingle (set to 2 by default)
+    """
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[index:index + size])
+            for index in range(len(words) - size + 1)}
+
+
+def signature(text: str) -> tuple:
+    """Return the MinHash signature of some text.
+
+    The fraction of positions at which two signatures agree estimates
+    the Jaccard similarity of the two texts' shingle sets.
+
+    Keyword arguments:
+    text -- the text to sign
+    """
+    hashes = [zlib.crc32(shingle.encode("utf8"))
+              for shingle in shingles(text)] or [0]
+    return tuple(min((multiplier * value + offset) % PRIME
+                     for value in hashes)
+                 for multiplier, offset in COEFFICIENTS)
+
+
+def similarity(first: tuple, second: tuple) -> float:
+    """Estimate the Jaccard similarity of two signatures.
+
+    Keyword arguments:
+    first -- a signature returned by signature
+    second -- another signature returned by signature
+    """
+    return sum(a == b for a, b in zip(first, second)) / PERMUTATIONS
+
+
+class NearDuplicateIndex:
+    """An index of signatures that finds near-duplicates in sub-linear time.
+
+    Each signature is split into bands, and each band is hashed into a
+    bucket. Only signatures sharing at least one bucket with a new one
+    are compared against it, so checking an article costs roughly the
+    same whether the index holds a hundred or tens of thousands.
+
+    Keyword arguments:
+    threshold -- the estimated similarity at or above which two texts
+    count as duplicates (set to 0.5 by default)
+    """
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    @staticmethod
+    def bands(article_signature: tuple):
+        """Yield the (band number, band) pairs of a signature."""
+        for band in range(BANDS):
+            yield band, article_signature[band * ROWS:(band + 1) * ROWS]
+
+    def add(self, key, article_signature: tuple):
+        """Add a signature to the index under a key.
+
+        Keyword arguments:
+        key -- a unique key for the article, such as its normalized title
+        article_signature -- the article's signature
+        """
+        self.remove(key)
+        self.signatures[key] = article_signature
+        for band, rows in self.bands(article_signature):
+            self.buckets[band].setdefault(rows, set()).add(key)
+
+    def remove(self, key):
+        """Remove a key from the index, if it is present.
+
+        Keyword arguments:
+        key -- the key the signature was added under
+        """
+        article_signature = self.signatures.pop(key, None)
+        if article_signature is None:
+            return
+        for band, rows in self.bands(article_signature):
+            bucket = self.buckets[band].get(rows)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band][rows]
+
+    def find(self, article_signature: tuple):
+        """Return the key of the closest near-duplicate, or None.
+
+        Keyword arguments:
+        article_signature -- the signature to look for duplicates of
+        """
+        candidates = set()
+        for band, rows in self.bands(article_signature):
+            candidates.update(self.buckets[band].get(rows, ()))
+        best_key, best_score = None, self.threshold
+        for key in candidates:
+            score = similarity(article_signature, self.signatures[key])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
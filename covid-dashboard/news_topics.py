@@ -0,0 +1,115 @@
+"""
+Plans News API queries for several news topics and matches articles to them
+"""
+import re
+
+# The longest q parameter the News API accepts
+MAX_QUERY_LENGTH = 500
+DEFAULT_TERMS = "Covid COVID-19 coronavirus"
+
+
+def load_topics(topic_config: dict) -> list:
+    """Return the list of topics the dashboard shows news for.
+
+    The first topic is always the main headlines, searched for with
+    search_terms. Extra topics come from the 'news_topics' list in
+    config.json, each entry holding a 'name', its search 'terms' and
+    optionally the 'sources' to limit it to.
+
+    Keyword arguments:
+    topic_config -- the config dictionary to read
+    """
+    topics = [{"name": "Headlines", "id": "headlines",
+               "terms": topic_config.get('search_terms', DEFAULT_TERMS).split(),
+               "sources": None}]
+    for topic in topic_config.get('news_topics', []):
+        topics.append({"name": topic['name'], "id": topic_id(topic['name']),
+                       "terms": topic['terms'].split(),
+                       "sources": topic.get('sources')})
+    return topics
+
+
+def topic_id(name: str) -> str:
+    """Return the html id of a topic's panel.
+
+    Keyword arguments:
+    name -- the topic's name
+    """
+    return re.sub(r"\W+", "-", name.casefold()).strip("-")
+
+
+def query_length(terms: list) -> int:
+    """Return the length of the q parameter searching for some terms.
+
+    Keyword arguments:
+    terms -- the list of search terms, which are joined with OR
+    """
+    return len(" OR ".join(terms))
+
+
+def plan_queries(topics: list, max_length: int = MAX_QUERY_LENGTH) -> list:
+    """Merge the topics' searches into as few News API queries as possible.
+
+    Topics limited to the same sources share queries, and a term
+    wanted by several topics is only searched for once. Terms are
+    packed into each query until its q parameter would grow past
+    max_length, so adding a topic usually adds no request at all.
+    Each query records the ids of the topics whose terms it searches
+    for, and results are matched back to their topics with match_topics.
+
+    Keyword arguments:
+    topics -- a list of topics returned by load_topics
+    max_length -- the longest q parameter to build (set to
+    MAX_QUERY_LENGTH by default)
+    """
+    groups = {}
+    for topic in topics:
+        terms = groups.setdefault(topic['sources'], {})
+        for term in topic['terms']:
+            owners = terms.setdefault(term.casefold(), (term, []))[1]
+            if topic['id'] not in owners:
+                owners.append(topic['id'])
+    queries = []
+    for sources, terms in groups.items():
+        query_terms = []
+        query_topics = []
+        for term, owners in terms.values():
+            if query_terms and query_length(query_terms + [term]) > max_length:
+                queries.append({"terms": " ".join(query_terms),
+                                "sources": sources,
+                                "topics": tuple(query_topics)})
+                query_terms = []
+                query_topics = []
+            query_terms.append(term)
+            query_topics.extend(topic for topic in owners
+                                if topic not in query_topics)
+        if query_terms:
+            queries.append({"terms": " ".join(query_terms), "sources": sources,
+                            "topics": tuple(query_topics)})
+    return queries
+
+
+def topic_pattern(topic: dict):
+    """Return a compiled pattern matching any of a topic's terms.
+
+    Keyword arguments:
+    topic -- a topic returned by load_topics
+    """
+    return re.compile(r"(?<!\w)(?:" + "|".join(
+        re.escape(term) for term in topic['terms']) + r")(?!\w)",
+        re.IGNORECASE)
+
+
+def match_topics(text: str, topics: list, patterns: dict = None) -> tuple:
+    """Return the ids of every topic whose terms appear in some text.
+
+    Keyword arguments:
+    text -- an article's title and description
+    topics -- a list of topics returned by load_topics
+    patterns -- compiled topic_pattern results indexed by topic id, to
+    avoid compiling them for every article (None by default)
+    """
+    if patterns is None:
+        patterns = {topic['id']: topic_pattern(topic) for topic in topics}
+    return tuple(topic['id'] for topic in topics
+                 if patterns[topic['id']].search(text))
@@ -0,0 +1,242 @@
+"""
+Checkpoints the dashboard's state to SQLite so restarts come back warm
+"""
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from functools import partial
+from importlib import import_module
+from config_loader import directory_path, get_config
+import dashboard_snapshot
+import update_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Modules whose update_data scheduled jobs can be re-armed after a restart
+JOB_MODULES = ("covid_data_handler", "covid_news_handling")
+# News article signatures are stored as packed unsigned 64 bit integers
+SIGNATURE_FORMAT = "<128Q"
+
+state_lock = threading.Lock()
+state_connection = None
+# Keys of the signatures already saved, indexed by kind ('news'/'blacklist')
+saved_signatures = {"news": set(), "blacklist": set()}
+
+
+def state_path() -> str:
+    """Return the path of the state database, or None if unset."""
+    if not get_config().get('state_path'):
+        return None
+    return os.path.join(directory_path, get_config()['state_path'])
+
+
+def open_state(path: str) -> sqlite3.Connection:
+    """Open (and create if needed) the state database in WAL mode.
+
+    Keyword arguments:
+    path -- system path to the SQLite file
+    """
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS state ("
+        "name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS signatures ("
+        "kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+        "PRIMARY KEY (kind, key)) WITHOUT ROWID")
+    connection.commit()
+    logger.info("Opened dashboard state at %s", path)
+    return connection
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return the shared state connection, opening it on first use."""
+    global state_connection
+    if state_connection is None:
+        state_connection = open_state(state_path())
+    return state_connection
+
+
+def saved_jobs() -> list:
+    """Return every scheduled update that can be re-armed after a restart."""
+    records = []
+    with update_scheduler.queue_lock:
+        for job in update_scheduler.jobs.values():
+            module = getattr(job['action'], 'func', job['action']).__module__
+            if module in JOB_MODULES:
+                records.append({"title": job['title'], "module": module,
+                                "interval": job['interval'],
+                                "repeat": job['repeat'], "time": job['time']})
+    return records
+
+
+def save_signatures(connection: sqlite3.Connection, kind: str,
+                    index) -> None:
+    """Write the changes to a near-duplicate index since the last save.
+
+    Keyword arguments:
+    connection -- the state database connection
+    kind -- 'news' or 'blacklist'
+    index -- the NearDuplicateIndex to save
+    """
+    saved = saved_signatures[kind]
+    current = set(index.signatures)
+    connection.executemany(
+        "DELETE FROM signatures WHERE kind = ? AND key = ?",
+        [(kind, key) for key in saved - current])
+    connection.executemany(
+        "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)",
+        [(kind, key, struct.pack(SIGNATURE_FORMAT, *index.signatures[key]))
+         for key in current - saved])
+    saved_signatures[kind] = current
+
+
+def checkpoint(snapshot: dashboard_snapshot.DashboardSnapshot):
+    """Save the dashboard's state, called with every published snapshot.
+
+    The snapshot (headline values, news and update widgets), the news
+    blacklist, the near-duplicate signatures and the scheduled updates
+    are written in a single transaction. Signatures are only written
+    when they change, so a checkpoint is a handful of small rows.
+
+    Keyword arguments:
+    snapshot -- the snapshot that was just published
+    """
+    import covid_news_handling
+    start = time.perf_counter()
+    with state_lock:
+        connection = get_connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO state VALUES (?, ?)",
+                [("snapshot", json.dumps(
+                    dashboard_snapshot.snapshot_to_json(snapshot))),
+                 ("news_blacklist", json.dumps(
+                     covid_news_handling.news_blacklist)),
+                 ("jobs", json.dumps(saved_jobs()))])
+            save_signatures(connection, "news",
+                            covid_news_handling.near_duplicates)
+            save_signatures(connection, "blacklist",
+                            covid_news_handling.blacklist_duplicates)
+    logger.debug("Checkpointed snapshot %s in %.1fms", snapshot.version,
+                 (time.perf_counter() - start) * 1000)
+
+
+def load_state(connection: sqlite3.Connection) -> dict:
+    """Return the saved state, or an empty dictionary if there is none.
+
+    Keyword arguments:
+    connection -- the state database connection
+    """
+    state = {name: json.loads(value) for name, value in
+             connection.execute("SELECT name, value FROM state")}
+    state['signatures'] = {"news": {}, "blacklist": {}}
+    for kind, key, value in connection.execute(
+            "SELECT kind, key, value FROM signatures"):
+        state['signatures'][kind][key] = struct.unpack(SIGNATURE_FORMAT, value)
+    return state
+
+
+def restore_news(snapshot: dashboard_snapshot.DashboardSnapshot,
+                 state: dict):
+    """Restore the stored articles, blacklist and their indexes.
+
+    Keyword arguments:
+    snapshot -- the restored snapshot, holding the stored articles
+    state -- the dictionary returned by load_state
+    """
+    import covid_news_handling
+    covid_news_handling.news_list[:] = [dict(article)
+                                        for article in snapshot.news]
+    for article in covid_news_handling.news_list:
+        covid_news_handling.current_news_titles.add(article['key'])
+        covid_news_handling.current_news_urls.add(article['url'])
+    covid_news_handling.news_blacklist.update(state.get('news_blacklist', {}))
+    for key, article_signature in state['signatures']['news'].items():
+        covid_news_handling.near_duplicates.add(key, article_signature)
+    for key, article_signature in state['signatures']['blacklist'].items():
+        covid_news_handling.blacklist_duplicates.add(key, article_signature)
+    for kind, index in (("news", covid_news_handling.near_duplicates),
+                        ("blacklist", covid_news_handling.blacklist_duplicates)):
+        saved_signatures[kind] = set(index.signatures)
+
+
+def restore_areas(snapshot: dashboard_snapshot.DashboardSnapshot):
+    """Restore the last known headline values of every area.
+
+    Keyword arguments:
+    snapshot -- the restored snapshot
+    """
+    import area_registry
+    import headline_index
+    headline_index.restore(snapshot.areas)
+    for area in snapshot.areas:
+        area_registry.area_data[area['areaCode']] = dict(area)
+        area_registry.area_codes[(area['areaName'], area['areaType'])] = \
+            area['areaCode']
+
+
+def restore_jobs(records: list) -> int:
+    """Schedule the saved updates again, returning how many were re-armed.
+
+    Updates whose time passed while the dashboard was down run as soon
+    as the update service starts.
+
+    Keyword arguments:
+    records -- the list of jobs returned by saved_jobs
+    """
+    for record in records:
+        module = import_module(record['module'])
+        update_scheduler.schedule(
+            record['title'], record['interval'],
+            partial(module.update_data, record['interval'], record['title']),
+            record['repeat'], execute_time=record['time'])
+    return len(records)
+
+
+def restore() -> bool:
+    """Restore the state saved by the last checkpoint, if there is one.
+
+    Must run before widget_interface is imported, which picks up its
+    update widgets from the restored snapshot.
+    """
+    start = time.perf_counter()
+    with state_lock:
+        state = load_state(get_connection())
+    if 'snapshot' not in state:
+        return False
+    snapshot = dashboard_snapshot.snapshot_from_json(state['snapshot'])
+    with dashboard_snapshot.write_lock:
+        restore_news(snapshot, state)
+        restore_areas(snapshot)
+        dashboard_snapshot.restore(snapshot)
+        job_count = restore_jobs(
+            [record for record in state.get('jobs', [])
+             if record['module'] in JOB_MODULES])
+    logger.info("Restored snapshot %s and %s updates in %.1fms",
+                snapshot.version, job_count,
+                (time.perf_counter() - start) * 1000)
+    return True
+
+
+def start():
+    """Restore the saved state and checkpoint every published snapshot.
+
+    Does nothing when state_path is empty in config.json, or in
+    processes that only read the shared snapshot, as the saved updates
+    are run by the process publishing snapshots.
+    """
+    if state_path() is None or not dashboard_snapshot.is_writer():
+        return
+    try:
+        restore()
+    except (sqlite3.Error, ValueError, KeyError):
+        logger.exception("Failed to restore the saved dashboard state")
+    if checkpoint not in dashboard_snapshot.listeners:
+        dashboard_snapshot.listeners.append(checkpoint)
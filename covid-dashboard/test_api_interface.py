@@ -0,0 +1,88 @@
+import gzip
+import json
+from flask import Flask
+import area_registry
+import covid_data_cache
+import dashboard_snapshot
+
+app = Flask(__name__)
+with app.app_context():
+    import api_interface
+
+TESTSHIRE = {
+    '2021-10-28': {'areaCode': 'E07999999', 'areaName': 'Testshire',
+        'areaType': 'ltla', 'cumDailyNsoDeathsByDeathDate': None,
+        'hospitalCases': 12, 'newCasesBySpecimenDate': 40},
+    '2021-10-27': {'areaCode': 'E07999999', 'areaName': 'Testshire',
+        'areaType': 'ltla', 'cumDailyNsoDeathsByDeathDate': 3,
+        'hospitalCases': 10, 'newCasesBySpecimenDate': 30}}
+
+def publish_area(connection):
+    records = [dict(entry, date=day) for day, entry in TESTSHIRE.items()]
+    covid_data_cache.merge_records(connection, 'Testshire', 'ltla', records)
+    summary = covid_data_cache.area_summary(connection, 'Testshire', 'ltla',
+        records)
+    area_registry.store_area(('Testshire', 'ltla'), summary, connection)
+    dashboard_snapshot.publish(areas=area_registry.headline_entries())
+
+def test_api_area(tmp_path):
+    publish_area(covid_data_cache.open_snapshot(str(tmp_path / 'snapshot.db')))
+    client = app.test_client()
+    response = client.get('/api/areas/E07999999')
+    assert response.status_code == 200
+    area = response.get_json()
+    assert area['hospital_cases'] == 12
+    assert area['latest']['cumDailyNsoDeathsByDeathDate'] == {'value': 3,
+        'date': '2021-10-27'}
+    assert client.get('/api/areas/unknown').status_code == 404
+    areas = client.get('/api/areas').get_json()['areas']
+    assert 'E07999999' in [area['areaCode'] for area in areas]
+
+def test_api_series(monkeypatch, tmp_path):
+    connection = covid_data_cache.open_snapshot(str(tmp_path / 'snapshot.db'))
+    monkeypatch.setattr(covid_data_cache, 'snapshot_connection', connection)
+    records = [dict(entry, date=day) for day, entry in TESTSHIRE.items()]
+    covid_data_cache.merge_records(connection, 'Testshire', 'ltla', records)
+    # Restored areas hold only their headline values
+    area_registry.area_data['E07999999'] = {'areaCode': 'E07999999',
+        'areaName': 'Testshire', 'areaType': 'ltla'}
+    dashboard_snapshot.publish()
+    client = app.test_client()
+    series = client.get('/api/areas/E07999999/series?start=2021-10-27'
+        '&metrics=hospitalCases,cumDailyNsoDeathsByDeathDate').get_json()
+    assert series['dates'] == ['2021-10-27', '2021-10-28']
+    assert series['metrics'] == {'hospitalCases': [10, 12],
+        'cumDailyNsoDeathsByDeathDate': [3, None]}
+    series = client.get('/api/areas/E07999999/series?end=2021-10-27'
+        ).get_json()
+    assert series['dates'] == ['2021-10-27']
+    assert client.get('/api/areas/E07999999/series?start=soon'
+        ).status_code == 400
+    assert client.get('/api/areas/E07999999/series?metrics=unknown'
+        ).status_code == 400
+    assert client.get('/api/areas/unknown/series').status_code == 404
+
+def test_api_not_modified():
+    dashboard_snapshot.publish(updates=[{'title': 'Update',
+        'content': 'Covid data will be updated at: 10:00'}])
+    client = app.test_client()
+    response = client.get('/api/updates')
+    assert response.get_json()['updates'][0]['title'] == 'Update'
+    dashboard_snapshot.publish()
+    response = client.get('/api/updates',
+        headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_api_gzip():
+    dashboard_snapshot.publish(news=[{'title': f'Article {number}',
+        'content': 'content', 'description': 'Covid news ' * 10,
+        'url': f'https://example.com/{number}', 'year': '2021-10-28',
+        'topics': ('vaccines',)} for number in range(10)])
+    response = app.test_client().get('/api/news',
+        headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    articles = json.loads(gzip.decompress(response.data))['articles']
+    assert articles[0]['topics'] == ['vaccines']
+    assert len(articles) == 10
@@ -0,0 +1,100 @@
+from area_registry import load_areas
+from area_registry import group_by_type
+from area_registry import store_area
+from area_registry import find_area
+from covid_data_cache import open_snapshot
+from covid_data_cache import merge_records
+from covid_data_cache import area_summary
+
+def merge_area(connection, area, record):
+    merge_records(connection, area[0], area[1], [record])
+    return area_summary(connection, area[0], area[1], [record])
+
+def test_load_areas():
+    areas = load_areas({'national_location': 'England',
+        'national_location_type': 'nation', 'local_location': 'Exeter',
+        'local_location_type': 'ltla', 'areas': [
+        {'name': 'Exeter', 'type': 'ltla'}, {'name': 'Torbay', 'type': 'ltla'}]})
+    assert areas == [('England', 'nation'), ('Exeter', 'ltla'),
+        ('Torbay', 'ltla')]
+
+def test_group_by_type():
+    groups = group_by_type([('England', 'nation'), ('Exeter', 'ltla'),
+        ('Torbay', 'ltla')])
+    assert groups['ltla'] == [('Exeter', 'ltla'), ('Torbay', 'ltla')]
+
+def test_store_area(tmp_path):
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    summary = merge_area(connection, ('Torbay', 'ltla'), {'date': '2021-10-28',
+        'areaCode': 'E06000027', 'areaName': 'Torbay', 'areaType': 'ltla',
+        'cumDailyNsoDeathsByDeathDate': None, 'hospitalCases': 12,
+        'newCasesBySpecimenDate': 40})
+    store_area(('Torbay', 'ltla'), summary, connection)
+    area = find_area('Torbay', 'ltla')
+    assert area['areaCode'] == 'E06000027'
+    assert area['hospital_cases'] == 12
+    assert area['7day_average'] is None
+    assert find_area('Exeter', 'nation') is None
+
+def test_store_area_reuses_current_entry(tmp_path, monkeypatch):
+    import covid_data_cache
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    record = {'date': '2021-10-28', 'areaCode': 'E06000099',
+        'areaName': 'Testbay', 'areaType': 'ltla',
+        'cumDailyNsoDeathsByDeathDate': None, 'hospitalCases': 3,
+        'newCasesBySpecimenDate': 4}
+    store_area(('Testbay', 'ltla'),
+        merge_area(connection, ('Testbay', 'ltla'), record), connection)
+    def fail(*args):
+        raise AssertionError("rebuilt a current area")
+    monkeypatch.setattr(covid_data_cache, 'load_records', fail)
+    summary = merge_area(connection, ('Testbay', 'ltla'),
+        dict(record, date='2021-10-29', hospitalCases=5))
+    store_area(('Testbay', 'ltla'), summary, connection)
+    assert find_area('Testbay', 'ltla')['hospital_cases'] == 5
+
+def test_apply_config(tmp_path, monkeypatch):
+    import area_registry
+    fetched = []
+    monkeypatch.setattr(area_registry, 'update_areas', fetched.append)
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    summary = merge_area(connection, ('Torbay', 'ltla'), {'date': '2021-10-28',
+        'areaCode': 'E06000027', 'areaName': 'Torbay', 'areaType': 'ltla',
+        'cumDailyNsoDeathsByDeathDate': None, 'hospitalCases': 12,
+        'newCasesBySpecimenDate': 40})
+    store_area(('Torbay', 'ltla'), summary, connection)
+    old = {'national_location': 'England', 'national_location_type': 'nation',
+        'local_location': 'Exeter', 'local_location_type': 'ltla',
+        'areas': [{'name': 'Torbay', 'type': 'ltla'}]}
+    new = dict(old, areas=[{'name': 'Plymouth', 'type': 'ltla'}])
+    area_registry.apply_config(old, new)
+    assert fetched == [[('Plymouth', 'ltla')]]
+    assert find_area('Torbay', 'ltla') is None
+
+def test_update_areas_splits_cold_areas(monkeypatch):
+    import area_registry
+    submitted = {}
+    monkeypatch.setattr(area_registry, 'split_cold_areas', lambda areas: (
+        [('Exeter', 'ltla'), ('Torbay', 'ltla')],
+        {('Mid Devon', 'ltla'): None, ('East Devon', 'ltla'): None}))
+    def run_concurrently(jobs, max_workers, timeout):
+        submitted.update({key: job.args[0] for key, job in jobs.items()})
+        return {}, {}
+    monkeypatch.setattr(area_registry, 'run_concurrently', run_concurrently)
+    area_registry.update_areas([('Exeter', 'ltla'), ('Torbay', 'ltla'),
+        ('Mid Devon', 'ltla'), ('East Devon', 'ltla')])
+    assert submitted == {('Exeter', 'ltla'): [('Exeter', 'ltla')],
+        ('Torbay', 'ltla'): [('Torbay', 'ltla')],
+        'ltla': [('Mid Devon', 'ltla'), ('East Devon', 'ltla')]}
+
+def test_update_areas_failed_does_not_publish(monkeypatch):
+    import area_registry
+    import dashboard_snapshot
+    dashboard_snapshot.publish(areas=area_registry.headline_entries())
+    version = dashboard_snapshot.get_snapshot().version
+    monkeypatch.setattr(area_registry, 'split_cold_areas', lambda areas: (
+        [('Exeter', 'ltla')], {}))
+    monkeypatch.setattr(area_registry, 'run_concurrently',
+        lambda jobs, max_workers, timeout: ({}, {('Exeter', 'ltla'): 'error'}))
+    area_registry.update_areas([('Exeter', 'ltla')])
+    assert dashboard_snapshot.get_snapshot().version == version
@@ -0,0 +1,18 @@
+from benchmark_covid_data import generate_rows
+from benchmark_covid_data import benchmark_size
+from benchmark_covid_data import compare_results
+from benchmark_covid_data import DAYS_PER_AREA
+
+def test_generate_rows():
+    rows = list(generate_rows(DAYS_PER_AREA + 10))
+    assert len(rows) == DAYS_PER_AREA + 10
+    assert len({row[0] for row in rows}) == 2
+    assert rows[0][4] == '' and rows[0][6] == ''
+    assert rows[20][3] < rows[19][3]
+
+def test_benchmark_size(tmp_path):
+    results = benchmark_size(700, str(tmp_path), repeat=1)
+    assert results['areas'] == 2
+    assert results['reformatted_rows'] == 700
+    assert results['stages']['parse_csv_data']['peak_bytes'] > 0
+    assert compare_results({'sizes': [results]}, {'sizes': [results]})[0][4] == 1
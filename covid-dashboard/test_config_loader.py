@@ -0,0 +1,51 @@
+import json
+import os
+import pytest
+import config_loader
+from config_loader import load_config
+from config_loader import validate_config
+from config_loader import reload_config
+from config_loader import changed_keys
+
+def write_config(path, **changes):
+    settings = dict(load_config())
+    settings.update(changes)
+    with open(path, 'w', encoding='utf8') as config_file:
+        json.dump(settings, config_file)
+
+def test_validate_config():
+    validate_config(load_config())
+    with pytest.raises(ValueError):
+        validate_config(dict(load_config(), max_articles='4'))
+    with pytest.raises(ValueError):
+        validate_config(dict(load_config(), areas=[{'name': 'Torbay'}]))
+
+def test_changed_keys():
+    assert changed_keys({'a': 1, 'b': 2}, {'a': 1, 'b': 3, 'c': 4}) == {'b', 'c'}
+
+def test_reload_config(tmp_path, monkeypatch):
+    path = str(tmp_path / 'config.json')
+    write_config(path)
+    monkeypatch.setattr(config_loader, 'config_path', path)
+    monkeypatch.setattr(config_loader, 'config', load_config(path))
+    monkeypatch.setattr(config_loader, 'config_mtime', os.stat(path).st_mtime_ns)
+    monkeypatch.setattr(config_loader, 'config_hash', None)
+    calls = []
+    monkeypatch.setattr(config_loader, 'listeners',
+        [lambda old, new: calls.append(changed_keys(old, new))])
+    assert not reload_config()
+
+    write_config(path, max_articles=8)
+    os.utime(path, ns=(0, config_loader.config_mtime + 1))
+    version = config_loader.config_version
+    assert reload_config()
+    assert config_loader.get_config()['max_articles'] == 8
+    assert config_loader.config_version == version + 1
+    assert config_loader.config_hash == config_loader.hash_config(
+        config_loader.get_config())
+    assert calls == [{'max_articles'}]
+
+    write_config(path, max_articles=-1)
+    os.utime(path, ns=(0, config_loader.config_mtime + 1))
+    assert not reload_config()
+    assert config_loader.get_config()['max_articles'] == 8
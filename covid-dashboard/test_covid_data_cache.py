@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from covid_data_cache import open_snapshot
+from covid_data_cache import latest_stored_date
+from covid_data_cache import load_records
+from covid_data_cache import refresh_covid_data
+from covid_data_cache import refresh_area_batch
+from covid_data_cache import split_cold_areas
+
+class FakeCov19API:
+    """Local stand-in for Cov19API, serving a fixed set of records"""
+    records = []
+    calls = []
+
+    def __init__(self, filters, structure):
+        self.filters = dict(f.split('=') for f in filters)
+
+    def get_json(self):
+        FakeCov19API.calls.append(self.filters)
+        return {'data': [record for record in FakeCov19API.records
+            if all(record[key] == value for key, value in self.filters.items())]}
+
+def make_record(days_ago, cases, name='England', area_type='nation'):
+    return {'date': (date.today() - timedelta(days=days_ago)).isoformat(),
+        'areaCode': 'E' + name, 'areaName': name, 'areaType': area_type,
+        'cumDailyNsoDeathsByDeathDate': None, 'hospitalCases': cases,
+        'newCasesBySpecimenDate': cases}
+
+def test_refresh_covid_data(tmp_path):
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    FakeCov19API.records = [make_record(days, days) for days in range(2, 100)]
+    FakeCov19API.calls = []
+    summary = refresh_covid_data(connection=connection, api_class=FakeCov19API)
+    assert summary['days'] == 98
+    assert summary['areaCode'] == 'EEngland'
+    assert summary['newest_date'] == make_record(2, 0)['date']
+    assert len(FakeCov19API.calls) == 1
+    assert latest_stored_date(connection, 'England', 'nation') == \
+        make_record(2, 0)['date']
+
+def test_refresh_covid_data_incremental(tmp_path, monkeypatch):
+    import covid_data_cache
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    FakeCov19API.records = [make_record(days, days) for days in range(2, 100)]
+    refresh_covid_data(connection=connection, api_class=FakeCov19API)
+    FakeCov19API.records = [make_record(1, 1), make_record(2, 500)]
+    FakeCov19API.calls = []
+    def fail(*args):
+        raise AssertionError("loaded the stored history")
+    monkeypatch.setattr(covid_data_cache, 'load_records', fail)
+    summary = refresh_covid_data(connection=connection, lookback_days=1,
+        api_class=FakeCov19API)
+    monkeypatch.undo()
+    assert summary['days'] == 99
+    assert len(summary['records']) == 2
+    assert len(FakeCov19API.calls) == 4
+    assert all('date' in call for call in FakeCov19API.calls)
+    stored = load_records(connection, 'England', 'nation')
+    assert stored[1]['hospitalCases'] == 500
+
+def test_refresh_area_batch(tmp_path):
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    names = ['Exeter', 'Mid Devon', 'Torbay']
+    FakeCov19API.records = [make_record(days, days, name, 'ltla')
+        for name in names + ['Plymouth'] for days in range(2, 10)]
+    areas = [(name, 'ltla') for name in names]
+    refresh_area_batch(areas, connection, 1, FakeCov19API)
+    FakeCov19API.records.append(make_record(1, 42, 'Torbay', 'ltla'))
+    FakeCov19API.calls = []
+    results = refresh_area_batch(areas, connection, 1, FakeCov19API)
+    assert len(FakeCov19API.calls) == 4
+    assert all('areaName' not in call for call in FakeCov19API.calls)
+    assert results[('Torbay', 'ltla')]['days'] == 9
+    assert results[('Torbay', 'ltla')]['newest_date'] == \
+        make_record(1, 0)['date']
+    assert results[('Exeter', 'ltla')]['days'] == 8
+
+def test_split_cold_areas(tmp_path):
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    FakeCov19API.records = [make_record(days, days, 'Exeter', 'ltla')
+        for days in range(2, 10)]
+    refresh_covid_data('Exeter', 'ltla', connection, 1, FakeCov19API)
+    cold, batched = split_cold_areas([('Exeter', 'ltla'), ('Torbay', 'ltla')],
+        connection, 1)
+    assert cold == [('Torbay', 'ltla')]
+    assert list(batched) == [('Exeter', 'ltla')]
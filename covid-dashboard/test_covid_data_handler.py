@@ -1,4 +1,7 @@
 from re import I
+import bz2
+import gzip
+import io
 from covid_data_handler import parse_csv_data
 from covid_data_handler import process_covid_csv_data
 from covid_data_handler import covid_API_request
@@ -8,6 +11,7 @@ from covid_data_handler import find_recent_value
 from covid_data_handler import sum_recent_values
 from covid_data_handler import dict_to_csv
 from covid_data_handler import calculate_interval
+from covid_data_handler import stream_covid_csv_data
 
 def test_parse_csv_data():
     data = parse_csv_data('nation_2021-10-28.csv')
@@ -40,9 +44,49 @@ def test_sum_recent_values():
     result = sum_recent_values(parse_csv_data('nation_2021-10-28.csv'), "newCasesBySpecimenDate", 7)
     assert result == 240_299
 
+def test_recent_values_stop_early():
+    class UnreadRow(list):
+        def __len__(self):
+            raise AssertionError("read past the values needed")
+    rows = [['date', 'hospitalCases'], ['2021-10-28', ''],
+        ['2021-10-27', '5'], ['2021-10-26', '4'], UnreadRow()]
+    assert find_recent_value(rows, 'hospitalCases') == 5
+    assert sum_recent_values(rows, 'hospitalCases', 1) == 4
+
 def test_dict_to_csv():
     dict_to_csv(covid_API_request())
 
 def test_calculate_interval():
     interval = calculate_interval()
-    assert interval == 1639180800.0
\ No newline at end of file
+    assert interval == 1639180800.0
+
+def test_parse_csv_data_compressed(tmp_path):
+    compressed = tmp_path / 'nation.csv.gz'
+    with open('nation_2021-10-28.csv', 'rb') as source:
+        with gzip.open(compressed, 'wb') as target:
+            target.write(source.read())
+    assert len(parse_csv_data(compressed)) == 639
+
+def test_stream_covid_csv_data():
+    last7days_cases , current_hospital_cases , total_deaths = \
+        stream_covid_csv_data('nation_2021-10-28.csv')
+    assert last7days_cases == 240_299
+    assert current_hospital_cases == 7_019
+    assert total_deaths == 141_544
+
+def test_stream_covid_csv_data_file_object():
+    with open('nation_2021-10-28.csv', 'rb') as source:
+        compressed = io.BytesIO(bz2.compress(source.read()))
+    assert stream_covid_csv_data(compressed, "England")[1] == 7_019
+
+def test_file_objects_left_open():
+    with open('nation_2021-10-28.csv', 'rb') as source:
+        assert len(parse_csv_data(source)) == 639
+        assert not source.closed
+    with open('nation_2021-10-28.csv', 'rb') as source:
+        compressed = io.BytesIO(gzip.compress(source.read()))
+    assert stream_covid_csv_data(compressed)[1] == 7_019
+    assert not compressed.closed
+    compressed.seek(0)
+    assert len(parse_csv_data(compressed)) == 639
+    assert not compressed.closed
@@ -0,0 +1,67 @@
+from covid_data_handler import parse_csv_data
+from covid_data_store import CovidDataStore
+from covid_data_store import to_masked_int64
+
+def test_to_masked_int64():
+    values, mask = to_masked_int64(["10", "", None, 7])
+    assert list(mask) == [True, False, False, True]
+    assert values[0] == 10 and values[3] == 7
+
+def test_from_rows():
+    store = CovidDataStore.from_rows(parse_csv_data('nation_2021-10-28.csv'))
+    assert len(store) == 638
+    assert store.area_name == "England"
+    assert store.recent_value("hospitalCases") == 7_019
+    assert store.recent_value("cumDailyNsoDeathsByDeathDate") == 141_544
+    assert store.sum_recent("newCasesBySpecimenDate", 7) == 240_299
+
+def test_from_records():
+    records = [
+        {"date": "2021-10-26", "hospitalCases": 5, "newCasesBySpecimenDate": 1},
+        {"date": "2021-10-28", "hospitalCases": None, "newCasesBySpecimenDate": None},
+        {"date": "2021-10-27", "hospitalCases": 6, "newCasesBySpecimenDate": 2}]
+    store = CovidDataStore.from_records(records,
+        ["hospitalCases", "newCasesBySpecimenDate"])
+    assert str(store.dates[0]) == "2021-10-28"
+    assert store.recent_value("hospitalCases") == 6
+    assert store.recent_date("hospitalCases") == "2021-10-27"
+    assert store.sum_recent("newCasesBySpecimenDate", 1) == 1
+
+def test_from_dictionary():
+    store = CovidDataStore.from_dictionary(
+        {"2021-10-28": {"hospitalCases": 7}}, ["hospitalCases"])
+    assert store.recent_value("hospitalCases") == 7
+
+def test_rolling():
+    store = CovidDataStore.from_rows(parse_csv_data('nation_2021-10-28.csv'))
+    windows = store.rolling("newCasesBySpecimenDate", (7, 14, 28))
+    assert windows[7]['sum'] == store.sum_recent("newCasesBySpecimenDate", 7)
+    assert windows[14]['sum'] == store.sum_recent("newCasesBySpecimenDate", 14)
+    assert windows[28]['days'] == 28
+    assert windows[7]['mean'] == windows[7]['sum'] / 7
+
+def test_rolling_missing_days():
+    records = [
+        {"date": "2021-10-28", "newCasesBySpecimenDate": None},
+        {"date": "2021-10-27", "newCasesBySpecimenDate": 30},
+        {"date": "2021-10-25", "newCasesBySpecimenDate": 10},
+        {"date": "2021-10-24", "newCasesBySpecimenDate": 20},
+        {"date": "2021-10-23", "newCasesBySpecimenDate": 5},
+        {"date": "2021-10-22", "newCasesBySpecimenDate": 5}]
+    store = CovidDataStore.from_records(records, ["newCasesBySpecimenDate"])
+    windows = store.rolling("newCasesBySpecimenDate", (3,), offset=2)
+    # 2021-10-27 is skipped, and 2021-10-26 is missing
+    assert windows[3] == {"sum": 30, "days": 2, "mean": 15.0, "change": 0.5}
+    assert store.rolling("newCasesBySpecimenDate", (1,),
+        skip_latest=False)[1]['sum'] == 30
+
+def test_rolling_series():
+    store = CovidDataStore.from_records([
+        {"date": "2021-10-28", "newCasesBySpecimenDate": 4},
+        {"date": "2021-10-26", "newCasesBySpecimenDate": 2}],
+        ["newCasesBySpecimenDate"])
+    dates, sums, means = store.rolling_series("newCasesBySpecimenDate", 2)
+    assert [str(day) for day in dates] == [
+        "2021-10-26", "2021-10-27", "2021-10-28"]
+    assert list(sums) == [2, 2, 4]
+    assert list(means) == [2.0, 2.0, 4.0]
@@ -0,0 +1,68 @@
+import pytest
+from flask import Markup
+import dashboard_snapshot
+from dashboard_snapshot import publish
+from dashboard_snapshot import get_snapshot
+from dashboard_snapshot import write_snapshot
+from dashboard_snapshot import read_snapshot
+
+def test_publish():
+    before = get_snapshot()
+    updates = [{'title': 'Covid data test', 'content': 'content'}]
+    snapshot = publish(updates=updates)
+    updates.append({'title': 'News data test', 'content': 'content'})
+    assert snapshot.version == before.version + 1
+    assert get_snapshot() is snapshot
+    assert len(snapshot.updates) == 1
+    assert snapshot.news == before.news
+    with pytest.raises(TypeError):
+        snapshot.updates[0]['title'] = 'changed'
+
+def test_publish_skips_unchanged():
+    snapshot = publish(updates=[{'title': 'Unchanged', 'content': 'content'}])
+    assert publish(updates=[{'title': 'Unchanged', 'content': 'content'}]) \
+        is snapshot
+    assert publish().version == snapshot.version + 1
+
+def test_write_and_read_snapshot(tmp_path):
+    snapshot = dashboard_snapshot.DashboardSnapshot(3, 1.5,
+        dashboard_snapshot.freeze([{'areaName': 'England'}]),
+        dashboard_snapshot.freeze([{'title': 'title',
+        'content': Markup('<a href="x">Read More</a>')}]), ())
+    write_snapshot(snapshot, str(tmp_path / 'snapshot.json'))
+    loaded = read_snapshot(str(tmp_path / 'snapshot.json'))
+    assert loaded == snapshot
+    assert isinstance(loaded.news[0]['content'], Markup)
+
+CHILD_PUBLISHER = '''
+import sys
+import config_loader
+import dashboard_snapshot
+config_loader.config = dict(config_loader.get_config(), snapshot_path=sys.argv[1])
+try:
+    dashboard_snapshot.publish(updates=[{'title': 'Child', 'content': 'x'}])
+    print('published')
+except PermissionError:
+    print('rejected')
+print(dashboard_snapshot.get_snapshot().updates[0]['title'])
+'''
+
+def test_one_publisher_per_shared_file(tmp_path, monkeypatch):
+    import subprocess
+    import sys
+    import config_loader
+    path = str(tmp_path / 'snapshot.json')
+    monkeypatch.setattr(config_loader, 'config',
+        dict(config_loader.get_config(), snapshot_path=path))
+    monkeypatch.setattr(dashboard_snapshot, 'writer', None)
+    monkeypatch.setattr(dashboard_snapshot, 'writer_lock', None)
+    publish(updates=[{'title': 'Parent', 'content': 'x'}])
+    assert dashboard_snapshot.is_writer()
+    def run_child():
+        return subprocess.run([sys.executable, '-c', CHILD_PUBLISHER, path],
+            capture_output=True, text=True, check=True,
+            cwd=dashboard_snapshot.directory_path).stdout.split()
+    assert run_child() == ['rejected', 'Parent']
+    assert read_snapshot(path).updates[0]['title'] == 'Parent'
+    dashboard_snapshot.writer_lock.close()
+    assert run_child() == ['published', 'Child']
@@ -0,0 +1,20 @@
+import time
+from fetch_engine import run_concurrently
+from fetch_engine import request_timings
+
+def test_run_concurrently():
+    start = time.monotonic()
+    results, errors = run_concurrently(
+        {'a': lambda: time.sleep(0.2) or 1, 'b': lambda: time.sleep(0.2) or 2})
+    assert results == {'a': 1, 'b': 2}
+    assert errors == {}
+    assert time.monotonic() - start < 0.35
+    assert request_timings['a'] >= 0.2
+
+def test_run_concurrently_partial_failure():
+    results, errors = run_concurrently(
+        {'slow': lambda: time.sleep(1), 'fast': lambda: 'ok',
+        'broken': lambda: 1 / 0}, timeout=0.1)
+    assert results == {'fast': 'ok'}
+    assert isinstance(errors['slow'], TimeoutError)
+    assert isinstance(errors['broken'], ZeroDivisionError)
@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+import headline_index
+import metrics
+from covid_data_cache import merge_records
+from covid_data_cache import open_snapshot
+from covid_data_store import CovidDataStore
+from headline_index import lookup
+from headline_index import rebuild
+from headline_index import current_entry
+
+def make_record(days_ago, cases, deaths=None):
+    return {'date': (date(2021, 10, 28) - timedelta(days=days_ago)).isoformat(),
+        'areaCode': 'E09999999', 'areaName': 'Torbay', 'areaType': 'ltla',
+        'cumDailyNsoDeathsByDeathDate': deaths, 'hospitalCases': cases,
+        'newCasesBySpecimenDate': cases}
+
+def test_rebuild():
+    records = [make_record(days, days, 1000 if days == 90 else None)
+        for days in range(1, 100)]
+    entry = rebuild(('Torbay', 'ltla'), CovidDataStore.from_records(records),
+        'E09999999')
+    assert lookup('E09999999') is entry
+    assert entry['latest']['hospitalCases'] == {'value': 1,
+        'date': '2021-10-27'}
+    assert entry['cumulative_deaths'] == 1000
+    assert entry['7day_infections'] == sum(range(2, 9))
+    assert entry['rolling'][28]['days'] == 28
+    assert len(headline_index.recent_records['E09999999']) == \
+        headline_index.RETAINED_DAYS
+    assert 'headline_index_entry_seconds' in metrics.registry
+
+def test_ingest_matches_rebuild(tmp_path):
+    records = [make_record(days, days, 1000 if days == 90 else None)
+        for days in range(2, 100)]
+    rebuild(('Torbay', 'ltla'), CovidDataStore.from_records(records),
+        'E09999999')
+    new_records = [make_record(0, 7), make_record(1, 5), make_record(2, 3)]
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    merge_records(connection, 'Torbay', 'ltla', new_records)
+    incremental = lookup('E09999999')
+    full = headline_index.entry_from_store(CovidDataStore.from_records(
+        new_records + records[1:]), ('Torbay', 'ltla'), 'E09999999')
+    assert incremental == full
+    assert incremental['newest_date'] == '2021-10-28'
+    assert incremental['cumulative_deaths'] == 1000
+    assert current_entry(('Torbay', 'ltla'), 'E09999999', '2021-10-28',
+        len(new_records + records[1:])) is incremental
+    assert current_entry(('Torbay', 'ltla'), 'E09999999', '2021-10-29',
+        len(new_records + records[1:])) is None
+
+def test_restore():
+    headline_index.restore([{'areaCode': 'E0000001', 'areaName': 'Test',
+        'areaType': 'ltla', '7day_infections': 5}])
+    assert lookup('E0000001')['7day_infections'] == 5
+    assert current_entry(('Test', 'ltla'), 'E0000001', '2021-10-28', 1) \
+        is None
+
+def test_ingest_metric_without_values(tmp_path):
+    records = [dict(make_record(days, days), areaCode='E09999998',
+        areaName='Mid Devon') for days in range(2, 60)]
+    rebuild(('Mid Devon', 'ltla'), CovidDataStore.from_records(records),
+        'E09999998')
+    assert lookup('E09999998')['latest']['cumDailyNsoDeathsByDeathDate'] \
+        == {'value': None, 'date': None}
+    connection = open_snapshot(str(tmp_path / 'snapshot.db'))
+    merge_records(connection, 'Mid Devon', 'ltla',
+        [dict(make_record(1, 9), areaCode='E09999998', areaName='Mid Devon')])
+    entry = lookup('E09999998')
+    assert entry['newest_date'] == '2021-10-27'
+    assert entry['hospital_cases'] == 9
+    assert entry['cumulative_deaths'] is None
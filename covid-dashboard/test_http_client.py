@@ -0,0 +1,58 @@
+import threading
+import time
+import http_client
+from http_client import get_json
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, etag=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {'ETag': etag} if etag else {}
+
+    def json(self):
+        return self.data
+
+class FakeSession:
+    """Counts requests and answers 304 when the ETag matches"""
+    def __init__(self, delay=0):
+        self.calls = []
+        self.delay = delay
+
+    def get(self, url, params, headers, timeout):
+        self.calls.append(headers)
+        time.sleep(self.delay)
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {'articles': [], 'call': len(self.calls)}, '"v1"')
+
+def test_get_json_cached():
+    http_client.response_cache.clear()
+    session = FakeSession()
+    first = get_json('https://example.com', {'q': 'a', 'page': 1},
+        session=session)
+    second = get_json('https://example.com', {'page': 1, 'q': 'a'},
+        session=session)
+    assert first == second
+    assert len(session.calls) == 1
+
+def test_get_json_revalidates_with_etag():
+    http_client.response_cache.clear()
+    session = FakeSession()
+    first = get_json('https://example.com', {'q': 'b'}, ttl=0, session=session)
+    second = get_json('https://example.com', {'q': 'b'}, ttl=0, session=session)
+    assert second == first
+    assert session.calls[1] == {'If-None-Match': '"v1"'}
+
+def test_get_json_shares_in_flight_requests():
+    http_client.response_cache.clear()
+    session = FakeSession(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        get_json('https://example.com', {'q': 'c'}, session=session)))
+        for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 5
+    assert len(session.calls) == 1
@@ -0,0 +1,80 @@
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler
+from logging_setup import BatchingFileHandler
+from logging_setup import BatchingQueueListener
+from logging_setup import apply_config
+from logging_setup import apply_levels
+
+def make_record(message):
+    return logging.LogRecord('test', logging.INFO, __file__, 1, message,
+        None, None)
+
+def test_batching_file_handler(tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = BatchingFileHandler(path, 0, 0, batch_size=3)
+    handler.emit(make_record('first'))
+    handler.emit(make_record('second'))
+    assert os.path.getsize(path) == 0
+    handler.emit(make_record('third'))
+    assert os.path.getsize(path) > 0
+    handler.emit(make_record('fourth'))
+    handler.close()
+    with open(path, encoding='utf8') as logfile:
+        assert logfile.read().split() == ['first', 'second', 'third', 'fourth']
+
+def test_batching_file_handler_with_rotation(tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = BatchingFileHandler(path, 5_000_000, 3, batch_size=100)
+    for number in range(5):
+        handler.emit(make_record(f'message {number}'))
+    assert os.path.getsize(path) == 0
+    handler.flush_batch()
+    assert os.path.getsize(path) == handler.size == 50
+    handler.close()
+
+def test_batching_file_handler_rotates(tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = BatchingFileHandler(path, 20, 2, batch_size=100)
+    for number in range(5):
+        handler.emit(make_record(f'message {number}'))
+    handler.close()
+    assert os.path.exists(path + '.1')
+    assert not os.path.exists(path + '.3')
+
+def test_queue_listener_flushes_when_idle(tmp_path):
+    path = str(tmp_path / 'test.log')
+    handler = BatchingFileHandler(path, 0, 0, batch_size=100)
+    log_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(log_queue, handler, flush_interval=0.05)
+    logger = logging.getLogger('test_queue_listener')
+    logger.propagate = False
+    logger.addHandler(QueueHandler(log_queue))
+    listener.start()
+    try:
+        logger.warning('queued message')
+        for _ in range(100):
+            if os.path.getsize(path):
+                break
+            listener._thread.join(0.02)
+        with open(path, encoding='utf8') as logfile:
+            assert logfile.read() == 'queued message\n'
+    finally:
+        listener.stop()
+        handler.close()
+
+def test_apply_levels():
+    root_level = logging.getLogger().level
+    try:
+        apply_levels({'log_level': 'WARNING',
+            'log_levels': {'test_quiet_module': 'ERROR'}})
+        assert logging.getLogger().level == logging.WARNING
+        assert not logging.getLogger('test_quiet_module').isEnabledFor(
+            logging.WARNING)
+        apply_config({'log_levels': {'test_quiet_module': 'ERROR'}},
+            {'log_level': 'DEBUG', 'log_levels': {}})
+        assert logging.getLogger('test_quiet_module').isEnabledFor(
+            logging.DEBUG)
+    finally:
+        logging.getLogger().setLevel(root_level)
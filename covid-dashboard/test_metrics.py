@@ -0,0 +1,36 @@
+import metrics
+from metrics import Histogram
+from metrics import render
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'A test histogram', (0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    samples = {name + labels: value
+        for name, labels, value in histogram.samples()}
+    assert samples['test_seconds_bucket{le="0.1"}'] == 1
+    assert samples['test_seconds_bucket{le="1.0"}'] == 2
+    assert samples['test_seconds_bucket{le="+Inf"}'] == 3
+    assert samples['test_seconds_count'] == 3
+
+def test_timed():
+    @metrics.timed('test_timed', 'a test function')
+    def double(value):
+        if value is None:
+            raise ValueError
+        return value * 2
+    assert double(2) == 4
+    try:
+        double(None)
+    except ValueError:
+        pass
+    text = render()
+    assert '# TYPE test_timed_seconds histogram' in text
+    assert 'test_timed_seconds_count 2' in text
+    assert 'test_timed_failures_total 1' in text
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', False)
+    metrics.increment('test_disabled_total')
+    assert 'test_disabled_total' not in metrics.registry
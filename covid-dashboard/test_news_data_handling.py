@@ -1,6 +1,11 @@
 from covid_news_handling import news_API_request
 from covid_news_handling import update_news
 from covid_news_handling import calculate_interval
+from covid_news_handling import add_article
+from covid_news_handling import blacklist_article
+from covid_news_handling import evict_articles
+import covid_news_handling
+from config_loader import get_config
 def test_news_API_request():
     assert news_API_request()
     assert news_API_request('Covid COVID-19 coronavirus') == news_API_request()
@@ -10,4 +15,98 @@ def test_update_news():
 
 def test_calculate_interval():
     interval = calculate_interval()
-    assert interval == 1639180800.0
\ No newline at end of file
+    assert interval == 1639180800.0
+
+def test_add_article(clear_news, make_article):
+    assert add_article(make_article('Older story', 5))
+    assert add_article(make_article('Newer story - Reuters', 1))
+    assert not add_article(make_article('newer  STORY', 2))
+    assert not add_article(make_article('Other title', 2,
+        'https://example.com/Older-story?ref=feed'))
+    assert not add_article(make_article('Ancient story', 24 * 365))
+    assert [article['title'] for article in covid_news_handling.news_list] \
+        == ['Newer story', 'Older story']
+
+def test_blacklist_article(clear_news, make_article):
+    assert add_article(make_article('Dismissed story', 1))
+    article = covid_news_handling.news_list.pop()
+    blacklist_article(article)
+    assert not add_article(make_article('Dismissed story - Reuters', 1))
+
+def test_evict_articles(clear_news, make_article):
+    max_stored = get_config().get('news_max_stored', 100)
+    for number in range(max_stored + 10):
+        add_article(make_article(f'Story {number}', number))
+    evict_articles()
+    assert len(covid_news_handling.news_list) == max_stored
+    assert len(covid_news_handling.current_news_titles) == max_stored
+    assert covid_news_handling.news_list[0]['title'] == 'Story 0'
+
+def test_near_duplicate_articles(clear_news, make_article):
+    first = make_article('Covid cases in England rise for third week running', 1)
+    first['description'] = 'Figures from the ONS show infections rising again'
+    copy = make_article('Covid cases in England rise for a third week running', 2)
+    copy['description'] = 'New figures from the ONS show infections rising again'
+    assert add_article(first)
+    assert not add_article(copy)
+    blacklist_article(covid_news_handling.news_list.pop(0))
+    assert not add_article(copy)
+
+def test_fetch_news_pages(monkeypatch, clear_news, make_article):
+    monkeypatch.setitem(get_config(), 'news_max_pages', 6)
+    monkeypatch.setitem(get_config(), 'news_page_size', 2)
+    monkeypatch.setitem(get_config(), 'news_page_concurrency', 1)
+    pages = {1: [make_article('Paged story one', 1),
+                 make_article('Paged story two', 2)],
+             2: [make_article('Paged story three', 3),
+                 make_article('Paged story one', 1)],
+             3: [make_article('Paged story one', 1),
+                 make_article('Paged story three', 3)],
+             4: [make_article('Paged story four', 4),
+                 make_article('Paged story five', 5)]}
+    requested = []
+    def fake_request(covid_terms, page=None, sources=None):
+        requested.append(page)
+        return {'status': 'ok', 'articles': pages.get(page, [])}
+    monkeypatch.setattr(covid_news_handling, 'news_API_request', fake_request)
+    assert covid_news_handling.fetch_news_pages('Covid') == 3
+    assert requested == [1, 2, 3]
+    assert len(covid_news_handling.news_list) == 3
+
+def test_update_news_topics(monkeypatch, clear_news, make_article):
+    monkeypatch.setitem(get_config(), 'news_max_pages', 1)
+    requested = []
+    def fake_request(covid_terms, page=None, sources=None):
+        requested.append(covid_terms)
+        return {'status': 'ok', 'articles': [
+            make_article('Vaccine booster rollout speeds up', 1),
+            make_article('New lockdown guidance published', 2)]}
+    monkeypatch.setattr(covid_news_handling, 'news_API_request', fake_request)
+    update_news()
+    assert len(requested) == 1
+    topics = {article['title']: article['topics']
+        for article in covid_news_handling.news_list}
+    assert 'vaccines' in topics['Vaccine booster rollout speeds up']
+    assert 'policy' in topics['New lockdown guidance published']
+
+def test_articles_keep_query_topics(clear_news, make_article):
+    assert add_article(make_article('Weekly roundup', 1), ('vaccines',))
+    assert add_article(make_article('Monthly roundup', 2), ('unknown',))
+    topics = {article['title']: article['topics']
+        for article in covid_news_handling.news_list}
+    assert topics == {'Weekly roundup': ('vaccines',), 'Monthly roundup': ()}
+
+def test_apply_config_refilters_articles(monkeypatch, clear_news, make_article):
+    import config_loader
+    assert add_article(make_article('Cases fall again | Daily Mail', 1))
+    assert add_article(make_article('Cases fall again', 2,
+        'https://example.com/other'))
+    old = get_config()
+    new = dict(old, blacklisted_strings=old['blacklisted_strings'] +
+        [' | Daily Mail'])
+    monkeypatch.setattr(config_loader, 'config', new)
+    covid_news_handling.apply_config(old, new)
+    assert [article['title'] for article in covid_news_handling.news_list] \
+        == ['Cases fall again']
+    assert not add_article(make_article('Cases fall again | Daily Mail', 1,
+        'https://example.com/another'))
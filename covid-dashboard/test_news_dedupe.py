@@ -0,0 +1,30 @@
+from news_dedupe import NearDuplicateIndex
+from news_dedupe import shingles
+from news_dedupe import signature
+from news_dedupe import similarity
+
+FIRST = ("Covid cases in England rise for third week in a row, "
+    "figures from the Office for National Statistics show")
+SYNDICATED = ("Covid cases in England rise for the third week in a row, "
+    "new figures from the Office for National Statistics show")
+OTHER = "Booster jab rollout extended to over 40s across the country"
+
+def test_shingles():
+    assert shingles("Covid cases rise") == {"covid cases", "cases rise"}
+
+def test_similarity():
+    assert similarity(signature(FIRST), signature(FIRST)) == 1
+    assert similarity(signature(FIRST), signature(SYNDICATED)) > 0.5
+    assert similarity(signature(FIRST), signature(OTHER)) < 0.2
+
+def test_near_duplicate_index():
+    index = NearDuplicateIndex()
+    for number in range(2000):
+        index.add(number, signature(f"Unrelated story number {number} "
+            f"about topic {number * 7}"))
+    index.add('first', signature(FIRST))
+    assert index.find(signature(SYNDICATED)) == 'first'
+    assert index.find(signature(OTHER)) is None
+    index.remove('first')
+    assert 'first' not in index
+    assert index.find(signature(SYNDICATED)) is None
@@ -0,0 +1,48 @@
+from news_topics import load_topics
+from news_topics import plan_queries
+from news_topics import match_topics
+from news_topics import topic_id
+
+def test_load_topics():
+    topics = load_topics({'search_terms': 'Covid coronavirus',
+        'news_topics': [{'name': 'Local outbreaks', 'terms': 'Exeter outbreak'}]})
+    assert [topic['id'] for topic in topics] == ['headlines', 'local-outbreaks']
+    assert topics[1]['terms'] == ['Exeter', 'outbreak']
+
+def test_topic_id():
+    assert topic_id('Vaccines & boosters') == 'vaccines-boosters'
+
+def test_plan_queries_merges_topics():
+    topics = load_topics({'search_terms': 'Covid coronavirus',
+        'news_topics': [{'name': 'Vaccines', 'terms': 'vaccine covid'},
+                        {'name': 'Policy', 'terms': 'lockdown'}]})
+    assert plan_queries(topics) == [{'terms': 'Covid coronavirus vaccine lockdown',
+        'sources': None, 'topics': ('headlines', 'vaccines', 'policy')}]
+
+def test_plan_queries_splits_long_queries():
+    topics = load_topics({'search_terms': 'Covid',
+        'news_topics': [{'name': f'Topic {number}', 'terms': f'term{number:03}'}
+                        for number in range(200)]})
+    queries = plan_queries(topics)
+    assert len(queries) == 5
+    assert queries[1]['topics'][0] == \
+        f"topic-{int(queries[1]['terms'].split()[0][4:])}"
+    assert len(queries[1]['topics']) == len(queries[1]['terms'].split())
+    assert all(len(query['terms'].replace(' ', ' OR ')) <= 500
+        for query in queries)
+
+def test_plan_queries_keeps_sources_apart():
+    topics = load_topics({'news_topics': [
+        {'name': 'Tech', 'terms': 'app', 'sources': 'the-verge'}]})
+    queries = plan_queries(topics)
+    assert len(queries) == 2
+    assert queries[1] == {'terms': 'app', 'sources': 'the-verge',
+        'topics': ('tech',)}
+
+def test_match_topics():
+    topics = load_topics({'search_terms': 'COVID-19',
+        'news_topics': [{'name': 'Vaccines', 'terms': 'vaccine booster'},
+                        {'name': 'Policy', 'terms': 'lockdown'}]})
+    assert match_topics('Booster jabs for COVID-19 patients', topics) == \
+        ('headlines', 'vaccines')
+    assert match_topics('Boosters open to over 40s', topics) == ()
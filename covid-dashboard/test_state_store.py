@@ -0,0 +1,37 @@
+import covid_news_handling
+import dashboard_snapshot
+import state_store
+import update_scheduler
+
+def test_checkpoint_and_restore(tmp_path, monkeypatch, clear_news,
+        make_article):
+    monkeypatch.setattr(state_store, 'state_connection',
+        state_store.open_state(str(tmp_path / 'state.db')))
+    monkeypatch.setattr(dashboard_snapshot, 'listeners', [state_store.checkpoint])
+    covid_news_handling.add_article(make_article('Restored story'))
+    covid_news_handling.blacklist_article({'title': 'Dismissed story'})
+    covid_news_handling.schedule_news_updates('10:00', 'News data restored', True)
+    published = dashboard_snapshot.publish(
+        areas=[{'areaCode': 'E07000041', 'areaName': 'Exeter',
+                'areaType': 'ltla', '7day_infections': 1234}],
+        news=covid_news_handling.news_list,
+        updates=[{'title': 'News data restored', 'content': 'daily'}])
+
+    clear_news()
+    update_scheduler.cancel('News data restored')
+    monkeypatch.setattr(dashboard_snapshot, 'current',
+        dashboard_snapshot.DashboardSnapshot())
+    assert state_store.restore()
+
+    snapshot = dashboard_snapshot.get_snapshot()
+    assert snapshot.version == published.version
+    assert snapshot.areas[0]['7day_infections'] == 1234
+    assert [article['title'] for article in covid_news_handling.news_list] \
+        == ['Restored story']
+    assert 'dismissed story' in covid_news_handling.news_blacklist
+    assert len(covid_news_handling.current_news_urls) == 1
+    assert len(covid_news_handling.near_duplicates) == 1
+    assert len(covid_news_handling.blacklist_duplicates) == 1
+    assert not covid_news_handling.add_article(make_article('Restored story'))
+    assert update_scheduler.jobs['News data restored']['repeat'] is True
+    update_scheduler.cancel('News data restored')
@@ -0,0 +1,42 @@
+import time
+import update_scheduler
+from update_scheduler import calculate_interval
+
+def test_calculate_interval():
+    interval = calculate_interval('00:00')
+    assert 0 < interval - time.time() <= 24 * 60 * 60
+
+def test_run_pending():
+    ran = []
+    now = time.time()
+    update_scheduler.schedule('first', '00:00', lambda: ran.append(1),
+        execute_time=now - 2)
+    update_scheduler.schedule('second', '00:00', lambda: ran.append(2),
+        execute_time=now - 1)
+    update_scheduler.schedule('later', '00:00', lambda: ran.append(3),
+        execute_time=now + 60)
+    assert update_scheduler.run_pending(now) == 2
+    assert ran == [1, 2]
+    assert 'first' not in update_scheduler.jobs
+    assert update_scheduler.cancel('later')
+
+def test_repeating_job():
+    ran = []
+    now = time.time()
+    job = update_scheduler.schedule('repeating', '00:00',
+        lambda: ran.append(1), True, now - 1)
+    update_scheduler.run_pending(now)
+    assert ran == [1]
+    assert job['time'] > now
+    assert update_scheduler.jobs['repeating'] is job
+    assert update_scheduler.cancel('repeating')
+
+def test_cancel():
+    for number in range(1000):
+        update_scheduler.schedule(f'job {number}', '00:00', print)
+    for number in range(1000):
+        assert update_scheduler.cancel(f'job {number}')
+    assert not update_scheduler.cancel('job 0')
+    assert len(update_scheduler.queue) < 1000
+    assert update_scheduler.next_due_time() is None or \
+        update_scheduler.next_due_time() > time.time()
@@ -0,0 +1,24 @@
+import threading
+import time
+import update_scheduler
+import update_service
+
+def test_scheduled_update_runs_in_background():
+    finished = threading.Event()
+    update_service.start()
+    try:
+        update_scheduler.schedule('service test', '00:00', finished.set,
+            execute_time=time.time() + 0.2)
+        update_service.wake()
+        assert finished.wait(2)
+    finally:
+        update_service.stop()
+
+def test_run_soon():
+    finished = threading.Event()
+    update_service.start()
+    try:
+        update_service.run_soon(finished.set)
+        assert finished.wait(2)
+    finally:
+        update_service.stop()
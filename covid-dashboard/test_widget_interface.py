@@ -0,0 +1,143 @@
+import threading
+from flask import Flask
+import dashboard_snapshot
+
+app = Flask(__name__)
+with app.app_context():
+    import widget_interface
+
+def test_update_site():
+    response = app.test_client().get('/index')
+    assert response.status_code == 200
+    assert b'Scheduled updates' in response.data
+
+def test_update_site_not_modified():
+    client = app.test_client()
+    etag = client.get('/index').headers['ETag']
+    response = client.get('/index', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    dashboard_snapshot.publish(news=[{'title': 'Changed', 'content': 'x'}])
+    response = client.get('/index', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_update_site_skips_unchanged_publish():
+    client = app.test_client()
+    version = dashboard_snapshot.get_snapshot().version
+    client.get('/index?update_item=Not a scheduled update')
+    client.get('/index?update_news=Not a stored article')
+    assert dashboard_snapshot.get_snapshot().version == version
+
+def test_update_site_etag_follows_config(monkeypatch):
+    import config_loader
+    client = app.test_client()
+    etag = client.get('/index').headers['ETag']
+    monkeypatch.setattr(config_loader, 'config_hash', 'edited')
+    response = client.get('/index', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'edited' in response.headers['ETag']
+
+def test_update_site_schedules_update():
+    client = app.test_client()
+    response = client.get('/index?alarm=10:00&two=Widget&covid-data=covid-data')
+    assert b'Covid data Widget' in response.data
+    response = client.get('/index?update_item=Covid data Widget')
+    assert b'Covid data Widget' not in response.data
+
+def test_snapshot_diff():
+    old = dashboard_snapshot.DashboardSnapshot(1, 0.0, (),
+        dashboard_snapshot.freeze([{'title': 'Old', 'content': 'content'}]), ())
+    new = dashboard_snapshot.DashboardSnapshot(2, 0.0, (),
+        dashboard_snapshot.freeze([{'title': 'New', 'content': 'content'}]),
+        dashboard_snapshot.freeze([{'title': 'Update', 'content': 'content'}]))
+    diff = widget_interface.snapshot_diff(old, new)
+    assert diff['version'] == 2
+    assert diff['metrics'] == {}
+    assert diff['news_removed'] == ['Old']
+    assert diff['news_added'] == [{'index': 0, 'title': 'New',
+        'content': 'content'}]
+    assert diff['updates_added'][0]['title'] == 'Update'
+
+def test_stream_events():
+    client = app.test_client()
+    response = client.get('/events?version=-1')
+    assert response.mimetype == 'text/event-stream'
+    assert b'event: reload' in response.data
+    version = dashboard_snapshot.get_snapshot().version
+    threading.Timer(0.2, dashboard_snapshot.publish,
+        kwargs={'updates': [{'title': 'Pushed', 'content': 'x'}]}).start()
+    response = client.get(f'/events?version={version}', buffered=False)
+    event = next(iter(response.response))
+    event = event.decode() if isinstance(event, bytes) else event
+    assert '"Pushed"' in event
+    response.close()
+
+def test_stream_events_reconnect():
+    client = app.test_client()
+    first = dashboard_snapshot.get_snapshot().version
+    dashboard_snapshot.publish(updates=[{'title': 'Seen', 'content': 'x'}])
+    seen = dashboard_snapshot.get_snapshot().version
+    threading.Timer(0.2, dashboard_snapshot.publish,
+        kwargs={'updates': [{'title': 'Seen', 'content': 'x'},
+            {'title': 'Unseen', 'content': 'x'}]}).start()
+    response = client.get(f'/events?version={first}', buffered=False,
+        headers={'Last-Event-ID': str(seen)})
+    event = next(iter(response.response))
+    event = event.decode() if isinstance(event, bytes) else event
+    assert '"Unseen"' in event
+    assert '"Seen"' not in event
+    response.close()
+
+def test_topic_panels():
+    snapshot = dashboard_snapshot.DashboardSnapshot(1, 0.0, (),
+        dashboard_snapshot.freeze([
+            {'title': 'Jab', 'content': 'content', 'topics': ('vaccines',)},
+            {'title': 'Other', 'content': 'content', 'topics': ()}]), ())
+    panels = widget_interface.dashboard_values(snapshot)['topic_panels']
+    vaccines = [panel for panel in panels if panel['id'] == 'vaccines'][0]
+    assert [article['title'] for article in vaccines['articles']] == ['Jab']
+
+def test_headlines_exclude_topic_only_articles():
+    snapshot = dashboard_snapshot.DashboardSnapshot(1, 0.0, (),
+        dashboard_snapshot.freeze([
+            {'title': 'Covid cases rise', 'content': 'content',
+                'topics': ('headlines', 'local-outbreaks')},
+            {'title': 'Exeter roadworks guidance', 'content': 'content',
+                'topics': ('local-outbreaks', 'policy')},
+            {'title': 'Weekly roundup', 'content': 'content',
+                'topics': ()}]), ())
+    values = widget_interface.dashboard_values(snapshot)
+    assert [article['title'] for article in values['news_articles']] == [
+        'Covid cases rise', 'Weekly roundup']
+
+def test_show_metrics():
+    client = app.test_client()
+    client.get('/index')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'update_site_render_seconds_bucket' in response.data
+
+def test_trend_text():
+    assert widget_interface.trend_text({}) == ""
+    assert widget_interface.trend_text({'7day_average': 1200,
+        'week_change': -0.25}) == \
+        "1,200 a day on average, ↓ 25% on the week before"
+    assert widget_interface.trend_text({'7day_average': 5,
+        'week_change': 0.01}).endswith("→ 1% on the week before")
+
+def test_stream_events_full(monkeypatch):
+    import config_loader
+    monkeypatch.setitem(config_loader.get_config(), 'max_event_streams', 0)
+    version = dashboard_snapshot.get_snapshot().version
+    response = app.test_client().get(f'/events?version={version}')
+    assert b'event: poll' in response.data
+    assert widget_interface.open_streams == 0
+
+def test_update_site_rejects_changes_in_readers(monkeypatch):
+    monkeypatch.setattr(dashboard_snapshot, 'writer', False)
+    version = dashboard_snapshot.get_snapshot().version
+    response = app.test_client().get(
+        '/index?alarm=10:00&two=Reader&covid-data=covid-data')
+    assert response.status_code == 503
+    assert dashboard_snapshot.get_snapshot().version == version
+    assert app.test_client().get('/index').status_code == 200
@@ -0,0 +1,174 @@
+"""
+A single scheduler for covid and news updates
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import timedelta, date
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Heap of [execute_time, sequence, job] entries, earliest first
+queue = []
+# Scheduled jobs, indexed by title
+jobs = {}
+queue_lock = threading.RLock()
+sequence = itertools.count()
+stale_entries = 0
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def calculate_interval(update_interval: str = "00:00") -> float:
+    """Calculate a timestamp for when to schedule updates.
+
+    Generates a unixtime timestamp from an Hours:Minutes string,
+    which is parsed into unix time that can then be used to schedule
+    the update. If the given time has already passed, we set the update
+    to happen the next time that time happes [i.e. tomorrow]
+
+    update-interval -- the time at which the update should run,
+    expected in the format %H:%M [parsed into usable data]
+    """
+    update_interval = str(update_interval).split(":")
+    update_hour = update_interval[0]
+    try:
+        update_minute = update_interval[1]
+    except IndexError:
+        update_minute = "00"
+    next_time = str(date.today()) + ' ' + update_hour + \
+        ":" + update_minute + ':00'
+    execute_time = time.strptime(next_time, '%Y-%m-%d %H:%M:%S')
+    execute_time = time.mktime(execute_time)
+    try:
+        if time.time() > execute_time:
+            next_time = (str((date.today() + timedelta(days=1))) +
+                         ' ' + update_hour + ":" + update_minute + ':00')
+            execute_time = time.mktime(
+                time.strptime(next_time, '%Y-%m-%d %H:%M:%S'))
+    except TypeError:
+        logger.error("TypeError when parsing time")
+    logger.info(
+        "Successfuly parsed %s, next call is at: %s",update_interval,
+        next_time)
+    return execute_time
+
+
+def push(job: dict, execute_time: float):
+    """Add a job to the heap at the given time.
+
+    Keyword arguments:
+    job -- the job dictionary, as created by schedule
+    execute_time -- the unix time at which to run the job
+    """
+    job['time'] = execute_time
+    heapq.heappush(queue, [execute_time, next(sequence), job])
+
+
+def schedule(title: str, update_interval: str, action,
+             repeat: bool = False, execute_time: float = None) -> dict:
+    """Schedule an update, replacing any update with the same title.
+
+    Keyword arguments:
+    title -- a unique identifier for the update, derived from the
+    widget title
+    update_interval -- the time at which the update should run,
+    expected in the format %H:%M
+    action -- a callable taking no arguments, run when the update is due
+    repeat -- whether to run the update again every day (False by default)
+    execute_time -- the unix time of the first run (calculated from
+    update_interval by default)
+    """
+    if execute_time is None:
+        execute_time = calculate_interval(update_interval)
+    job = {"title": title, "interval": update_interval, "action": action,
+           "repeat": repeat, "cancelled": False}
+    with queue_lock:
+        cancel(title)
+        jobs[title] = job
+        push(job, execute_time)
+    logger.info("Scheduled %s at %s", title, update_interval)
+    return job
+
+
+def cancel(title: str) -> bool:
+    """Cancel a scheduled update, returning whether it was found.
+
+    The job is removed from the index straight away and its heap entry
+    is skipped when it reaches the top, so cancelling never scans the
+    queue. The heap is rebuilt once most of its entries are stale.
+
+    Keyword arguments:
+    title -- the title the update was scheduled with
+    """
+    global stale_entries
+    with queue_lock:
+        job = jobs.pop(title, None)
+        if job is None:
+            return False
+        job['cancelled'] = True
+        stale_entries += 1
+        if stale_entries > len(queue) // 2:
+            queue[:] = [entry for entry in queue
+                        if not entry[2]['cancelled']]
+            heapq.heapify(queue)
+            stale_entries = 0
+    logger.info("Cancelled update %s", title)
+    return True
+
+
+def pop_stale():
+    """Drop cancelled entries from the top of the heap."""
+    global stale_entries
+    while queue and queue[0][2]['cancelled']:
+        heapq.heappop(queue)
+        stale_entries -= 1
+
+
+def next_due_time() -> float:
+    """Return the unix time of the next scheduled update, or None."""
+    with queue_lock:
+        pop_stale()
+        if not queue:
+            return None
+        return queue[0][0]
+
+
+def run_pending(now: float = None) -> int:
+    """Run every update that is due, returning how many were run.
+
+    Repeating updates are pushed back onto the heap for the same time
+    on the next day before they run.
+
+    Keyword arguments:
+    now -- the current unix time (time.time() by default)
+    """
+    if now is None:
+        now = time.time()
+    ran = 0
+    while True:
+        with queue_lock:
+            pop_stale()
+            if not queue or queue[0][0] > now:
+                break
+            execute_time, _, job = heapq.heappop(queue)
+            if job['repeat']:
+                next_time = calculate_interval(job['interval'])
+                if next_time <= execute_time:
+                    next_time = execute_time + DAY_SECONDS
+                push(job, next_time)
+            else:
+                jobs.pop(job['title'], None)
+        metrics.observe("scheduler_lag_seconds", time.time() - execute_time,
+                        "Seconds between when updates were due and ran")
+        logger.info("Running update %s, scheduled for %s",
+                    job['title'], execute_time)
+        try:
+            job['action']()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Update %s failed", job['title'])
+        ran += 1
+    return ran
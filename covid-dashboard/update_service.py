@@ -0,0 +1,94 @@
+"""
+Runs scheduled covid and news updates in a background thread
+"""
+import logging
+import threading
+import time
+from collections import deque
+import update_scheduler
+import config_loader
+import dashboard_snapshot
+
+logger = logging.getLogger(__name__)
+
+wakeup = threading.Event()
+stop_event = threading.Event()
+service_thread = None
+# One-off jobs to run as soon as possible, off the request path
+pending_jobs = deque()
+
+
+def wake():
+    """Wake the service so it picks up newly scheduled updates."""
+    wakeup.set()
+
+
+def run_soon(job):
+    """Run a function on the service thread as soon as possible.
+
+    Keyword arguments:
+    job -- a callable taking no arguments
+    """
+    pending_jobs.append(job)
+    wake()
+
+
+def service_loop():
+    """Sleep until the next update is due, then run it.
+
+    The thread waits on an event until the earliest job in
+    update_scheduler is due, and is woken early whenever something new is
+    scheduled, so updates run on time without any polling. It also
+    wakes every config_poll_seconds to reload config.json if it changed.
+    Processes that only read the shared snapshot (see
+    dashboard_snapshot.is_writer) just reload config.json, leaving
+    updates to the process publishing snapshots.
+    """
+    while not stop_event.is_set():
+        wakeup.clear()
+        writer = dashboard_snapshot.is_writer()
+        try:
+            config_loader.reload_config()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to reload config")
+        poll = config_loader.get_config().get('config_poll_seconds', 5)
+        if not writer:
+            wakeup.wait(poll or None)
+            continue
+        while pending_jobs:
+            job = pending_jobs.popleft()
+            try:
+                job()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Background job %s failed", job)
+        due = update_scheduler.next_due_time()
+        timeout = None if due is None else due - time.time()
+        if poll and (timeout is None or timeout > poll):
+            timeout = poll
+        if timeout is None or timeout > 0:
+            wakeup.wait(timeout)
+            continue
+        update_scheduler.run_pending()
+
+
+def start():
+    """Start the background update thread, if it isn't running."""
+    global service_thread
+    if service_thread is not None and service_thread.is_alive():
+        return
+    stop_event.clear()
+    service_thread = threading.Thread(target=service_loop,
+                                      name="update-service", daemon=True)
+    service_thread.start()
+    logger.info("Started the background update service")
+
+
+def stop():
+    """Stop the background update thread and wait for it to finish."""
+    global service_thread
+    stop_event.set()
+    wake()
+    if service_thread is not None:
+        service_thread.join()
+        service_thread = None
+    logger.info("Stopped the background update service")
@@ -2,28 +2,42 @@
 Handles interactions between the flask frontend and the python backend
 """
 import logging
-import sched
-import time
 import json
-import os
+import threading
+import time
 from flask import current_app as app
 from flask.templating import render_template
-from flask import request
+from flask import request, make_response, Response
 import covid_news_handling
 import covid_data_handler
+import area_registry
+import update_service
+import dashboard_snapshot
+import metrics
+import config_loader
+from config_loader import changed_keys, get_config
 
-updates_list = []
-cumulative_deaths = "n/A"
-hospital_cases = "n/A"
-national_7day_infections = "n/A"
-local_7day_infections = "n/A"
+logger = logging.getLogger(__name__)
 
-scheduler = sched.scheduler(time.time, time.sleep)
-
-directory_path = os.path.dirname(os.path.abspath(__file__)) 
-new_path = os.path.join(directory_path, "config.json")
-with open(new_path, "r", encoding="utf8") as jsonfile:
-    config = json.load(jsonfile)
+# Update widgets, picked up from a snapshot restored by state_store
+updates_list = [dict(update)
+    for update in dashboard_snapshot.get_snapshot().updates]
+# The last rendered index.html, as a ((snapshot version, config version),
+# page) tuple
+rendered_page = (None, None)
+# Server-sent event payloads, indexed by (old version, new version)
+event_cache = {}
+# Seconds between keepalive comments on idle event streams
+EVENT_KEEPALIVE = 15
+# Each open event stream holds a server thread, so only this many (by
+# default) are served at once and other pages poll /index instead
+DEFAULT_MAX_EVENT_STREAMS = 32
+open_streams = 0
+streams_lock = threading.Lock()
+METRIC_NAMES = ["local_7day_infections", "national_7day_infections",
+    "local_trend", "national_trend", "hospital_cases", "deaths_total"]
+# Week-on-week changes smaller than this are shown as flat
+TREND_THRESHOLD = 0.02
 
 
 def remove_item(update: str, element_name: str,
@@ -44,17 +58,17 @@ def remove_item(update: str, element_name: str,
     update_finished -- whether the event is being closed [in the case
     that it has finished running] (False by default)
     """
-    if request.args.get(
-            element_name) == update["title"] or update_finished is True:
+    if update_finished is True or request.args.get(
+            element_name) == update["title"]:
         if len(remove_list) > 0:
             if element_name == "update_news":
-                covid_news_handling.news_blacklist.append(update['title'])
+                covid_news_handling.blacklist_article(update)
             if element_name == "update_item" and update_finished is False:
                 covid_data_handler.remove_update(update['title'])
             try:
                 remove_list.remove(update)
             except IndexError:
-                logging.error(
+                logger.error(
                     "Failed to remove item %s from list",update['title'])
 
 
@@ -104,10 +118,12 @@ def set_updates():
         else:
             update_content = f"Covid data will be updated at: {update_time}"
         update_name = generate_name(updates_list, 'Covid data ')
-        covid_data_handler.schedule_covid_updates(update_time, update_name)
+        covid_data_handler.schedule_covid_updates(update_time, update_name,
+            bool(request.args.get('repeat')))
+        update_service.wake()
         updates_list.append({"title": update_name, "content": update_content})
     if request.args.get('news') == 'news':
-        covid_news_handling.update_news()
+        update_service.run_soon(covid_news_handling.update_news)
         update_content = ""
         if request.args.get('repeat'):
             update_content = f"News data will be updated daily \
@@ -115,7 +131,9 @@ def set_updates():
         else:
             update_content = f"News data will be updated at: {update_time}"
         update_name = generate_name(updates_list, 'News data ')
-        covid_news_handling.schedule_news_updates(update_time, update_name)
+        covid_news_handling.schedule_news_updates(update_time, update_name,
+            bool(request.args.get('repeat')))
+        update_service.wake()
         updates_list.append({"title": update_name, "content": update_content})
 
 
@@ -128,28 +146,302 @@ def update_site():
     method to perform various gunctions around updating data/schedule
     data, such as updating news and removing updates, while returning
     the index.html file as a render_template with all the appropriate
-    variables passed through
+    variables passed through. Scheduled updates are run by
+    update_service in the background, never by this request, and the
+    page is rendered from the latest published dashboard_snapshot.
+    The rendered page is cached until a new snapshot is published or
+    config.json is reloaded, and browsers that already have it get a
+    304 Not Modified response. Processes that only read the shared
+    snapshot can't change it, so they reject changes with a 503 Service
+    Unavailable response, to be retried
+    """
+    if request.method == "GET" and (request.args.get('update_item')
+            or request.args.get('update_news') or request.args.get('two')):
+        if not dashboard_snapshot.is_writer():
+            logger.warning("Rejected a change, as another process publishes")
+            return Response("Changes are handled by another worker, "
+                "please try again\n", status=503, mimetype="text/plain",
+                headers={"Retry-After": "1"})
+        with dashboard_snapshot.write_lock:
+            before = (list(updates_list), list(covid_news_handling.news_list))
+            for update in list(updates_list):
+                remove_item(update, 'update_item', updates_list)
+            for article in list(covid_news_handling.news_list):
+                remove_item(article, 'update_news',
+                    covid_news_handling.news_list)
+            if request.args.get('two'):
+                set_updates()
+            if before != (updates_list, covid_news_handling.news_list):
+                dashboard_snapshot.publish(updates=updates_list,
+                    news=covid_news_handling.news_list)
+
+    global rendered_page
+    snapshot = dashboard_snapshot.get_snapshot()
+    # The config part comes from its contents, as the snapshot version
+    # survives restarts and config.json may change while the server is down
+    key = (snapshot.version, config_loader.config_hash)
+    version, page = rendered_page
+    if version != key:
+        start = time.perf_counter()
+        page = render_dashboard(snapshot)
+        metrics.observe("update_site_render_seconds",
+            time.perf_counter() - start, "Seconds taken to render index.html")
+        rendered_page = (key, page)
+        logger.info("Rendered index.html for snapshot %s", snapshot.version)
+
+    response = make_response(page)
+    response.set_etag("snapshot-{}-{}".format(*key))
+    if snapshot.published_at:
+        response.last_modified = snapshot.published_at
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def trend_text(area: dict) -> str:
+    """Return an area's 7 day average of new cases and its trend.
+
+    Keyword arguments:
+    area -- an area's headline values, as stored by area_registry
+    """
+    average = area.get('7day_average')
+    if average is None:
+        return ""
+    change = area.get('week_change')
+    if change is None:
+        return f"{average:,} a day on average"
+    if change > TREND_THRESHOLD:
+        arrow = "\u2191"
+    elif change < -TREND_THRESHOLD:
+        arrow = "\u2193"
+    else:
+        arrow = "\u2192"
+    return (f"{average:,} a day on average, {arrow} {abs(change):.0%} "
+        "on the week before")
+
+
+def dashboard_values(snapshot: dashboard_snapshot.DashboardSnapshot) -> dict:
+    """Return the values index.html is rendered with for a snapshot.
+
+    Keyword arguments:
+    snapshot -- the dashboard snapshot to read from
     """
-    covid_data_handler.run_updates()
-    covid_news_handling.run_updates()
-    if request.method == "GET":
-        for update in updates_list:
-            remove_item(update, 'update_item', updates_list)
-        for article in covid_news_handling.news_list:
-            remove_item(article, 'update_news', covid_news_handling.news_list)
-        if request.args.get('two'):
-            set_updates()
-
-    final_news = covid_news_handling.news_list[:config['max_articles']]
+    config = get_config()
+    areas = {(area['areaName'], area['areaType']): area
+        for area in snapshot.areas}
+    national_area = (config['national_location'],
+        config['national_location_type'])
+    local_area = (config['local_location'], config['local_location_type'])
+    national = areas.get(national_area, {})
+    local = areas.get(local_area, {})
+    other_areas = [dict(areas[area], trend=trend_text(areas[area]))
+        for area in area_registry.load_areas(config)
+        if area in areas and area not in (national_area, local_area)]
+    # Topics share queries with the headlines, so only articles tagged
+    # as headlines are shown in the main column. Articles without any
+    # tag would show nowhere else, so they count as headlines too
+    headlines_id = covid_news_handling.topics[0]['id']
+    headlines = tuple(article for article in snapshot.news
+        if not article.get('topics') or headlines_id in article['topics'])
+    topic_panels = [{"name": topic['name'], "id": topic['id'],
+        "articles": tuple(article for article in snapshot.news
+            if topic['id'] in article.get('topics', ()))[
+                :config['max_articles']]}
+        for topic in covid_news_handling.topics[1:]]
+
+    return {
+        "updates": snapshot.updates,
+        "news_articles": headlines[:config['max_articles']],
+        "local_7day_infections": local.get('7day_infections', "n/A"),
+        "national_7day_infections": national.get('7day_infections', "n/A"),
+        "local_trend": trend_text(local),
+        "national_trend": trend_text(national),
+        "hospital_cases": ("National hospital cases: "
+            f"{national.get('hospital_cases', 'n/A')}"),
+        "deaths_total": ("National cumulative deaths: "
+            f"{national.get('cumulative_deaths', 'n/A')}"),
+        "areas": other_areas,
+        "topic_panels": topic_panels}
+
 
+def render_dashboard(snapshot: dashboard_snapshot.DashboardSnapshot) -> str:
+    """Render index.html from a dashboard snapshot.
+
+    Keyword arguments:
+    snapshot -- the dashboard snapshot to render
+    """
+    config = get_config()
     return render_template("index.html",
-        updates=updates_list,
-        news_articles=final_news,
         location=config['national_location'],
         nation_location=config['local_location'],
-        local_7day_infections=local_7day_infections,
-        national_7day_infections=national_7day_infections,
-        hospital_cases=(f"National hospital cases: {hospital_cases}"),
-        deaths_total=(f"National cumulative deaths: {cumulative_deaths}"),
         title=config['title'],
-        image=config['image_path'])
+        image=config['image_path'],
+        version=snapshot.version,
+        config_hash=config_loader.config_hash,
+        **dashboard_values(snapshot))
+
+
+def list_changes(old: tuple, new: tuple) -> tuple:
+    """Return the items added to and the titles removed from a list.
+
+    Added items carry their index in the new list, so that clients can
+    insert them in the right place.
+
+    Keyword arguments:
+    old -- the list of dictionaries the client already shows
+    new -- the list of dictionaries the client should show
+    """
+    old_titles = {item['title'] for item in old}
+    new_titles = {item['title'] for item in new}
+    removed = [item['title'] for item in old if item['title'] not in new_titles]
+    added = [{"index": index, "title": item['title'],
+        "content": str(item['content'])}
+        for index, item in enumerate(new) if item['title'] not in old_titles]
+    return added, removed
+
+
+def snapshot_diff(old: dashboard_snapshot.DashboardSnapshot,
+        new: dashboard_snapshot.DashboardSnapshot) -> dict:
+    """Return what changed on the page between two snapshots.
+
+    Keyword arguments:
+    old -- the snapshot the client's page was built from
+    new -- the latest snapshot
+    """
+    old_values = dashboard_values(old)
+    new_values = dashboard_values(new)
+    diff = {"version": new.version, "metrics": {}}
+    for name in METRIC_NAMES:
+        if old_values[name] != new_values[name]:
+            diff['metrics'][name] = str(new_values[name])
+    if old_values['areas'] != new_values['areas']:
+        diff['areas'] = [{"areaName": area['areaName'],
+            "7day_infections": area['7day_infections'],
+            "trend": area['trend']}
+            for area in new_values['areas']]
+    diff['news_added'], diff['news_removed'] = list_changes(
+        old_values['news_articles'], new_values['news_articles'])
+    diff['topics'] = {}
+    for old_panel, new_panel in zip(old_values['topic_panels'],
+            new_values['topic_panels']):
+        added, removed = list_changes(old_panel['articles'],
+            new_panel['articles'])
+        if added or removed:
+            diff['topics'][new_panel['id']] = {"added": added,
+                "removed": removed}
+    diff['updates_added'], diff['updates_removed'] = list_changes(
+        old_values['updates'], new_values['updates'])
+    return diff
+
+
+def event_payload(old: dashboard_snapshot.DashboardSnapshot,
+        new: dashboard_snapshot.DashboardSnapshot) -> str:
+    """Return the server-sent event for a change between two snapshots.
+
+    Clients mostly share the same versions, so each payload is built
+    once and then reused for every connection.
+
+    Keyword arguments:
+    old -- the snapshot the client's page was built from
+    new -- the latest snapshot
+    """
+    key = (old.version, new.version)
+    payload = event_cache.get(key)
+    if payload is None:
+        payload = (f"id: {new.version}\n"
+            f"data: {json.dumps(snapshot_diff(old, new))}\n\n")
+        if len(event_cache) > 100:
+            event_cache.clear()
+        event_cache[key] = payload
+    return payload
+
+
+@app.route('/events')
+def stream_events():
+    """Stream changes to the dashboard as server-sent events.
+
+    The page passes the snapshot version it was rendered from. Each
+    time a new snapshot is published, connected clients are sent a
+    small diff (changed metrics, added or removed news and updates)
+    instead of reloading the whole page. Reconnecting clients resume
+    from the Last-Event-ID header they send. Clients whose version is no
+    longer known, or whose page was rendered with an older config, are
+    told to reload. Every stream holds a server thread while it is open,
+    so once max_event_streams are open, new clients are told to poll
+    /index instead, which costs a 304 Not Modified while nothing changed.
+    """
+    # A reconnecting EventSource reuses the page's url, so the id of the
+    # last event it received is newer than the version in the query
+    version = request.headers.get('Last-Event-ID') or request.args.get(
+        'version', '')
+    try:
+        version = int(version)
+    except ValueError:
+        version = None
+    config_hash = request.args.get('config', config_loader.config_hash)
+
+    def generate():
+        global open_streams
+        sent = dashboard_snapshot.history.get(version)
+        if sent is None or config_hash != config_loader.config_hash:
+            yield "event: reload\ndata: {}\n\n"
+            return
+        with streams_lock:
+            full = open_streams >= get_config().get('max_event_streams',
+                DEFAULT_MAX_EVENT_STREAMS)
+            if not full:
+                open_streams += 1
+        if full:
+            logger.info("Told a client to poll, as every event stream is open")
+            yield "event: poll\ndata: {}\n\n"
+            return
+        try:
+            while True:
+                snapshot = dashboard_snapshot.wait_for_change(sent.version,
+                    EVENT_KEEPALIVE)
+                if config_loader.config_hash != config_hash:
+                    yield "event: reload\ndata: {}\n\n"
+                    return
+                if snapshot.version == sent.version:
+                    yield ": keepalive\n\n"
+                    continue
+                yield event_payload(sent, snapshot)
+                sent = snapshot
+        finally:
+            with streams_lock:
+                open_streams -= 1
+
+    return Response(generate(), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+
+@app.route('/metrics')
+def show_metrics():
+    """Return the dashboard's metrics in the Prometheus text format.
+
+    Returns 404 Not Found while metrics_enabled is false in config.json.
+    """
+    if not metrics.enabled:
+        return Response("Metrics are disabled\n", status=404,
+            mimetype="text/plain")
+    return Response(metrics.render(),
+        mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def apply_config(old: dict, new: dict):
+    """Reload open pages after a config change, called by config_loader.
+
+    Pages are re-rendered with the new config on their next request,
+    as the page cache is keyed on the config's hash. Publishing a
+    snapshot wakes the event streams, which then tell their pages to
+    reload. Streams served by processes that only read the shared
+    snapshot notice the change within EVENT_KEEPALIVE seconds instead.
+
+    Keyword arguments:
+    old -- the previous config
+    new -- the new config
+    """
+    if changed_keys(old, new) and dashboard_snapshot.is_writer():
+        dashboard_snapshot.publish()
+
+
+config_loader.listeners.append(apply_config)